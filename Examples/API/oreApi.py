@@ -2,6 +2,7 @@ import json
 import urllib.request
 import urllib.parse
 import ORE as ore
+import numpy as np
 import pandas as pd
 import requests
 from flask import make_response
@@ -27,21 +28,26 @@ class oreApi():
         # Format Headers into columns
         report_headers = [[i, report.header(i), report.columnType(i)] for i in range(report.columns())]
 
+        rows = report.rows()
         formatted_report = dict()
-        # Loop over headers and put them into the appropriate column
+        # Loop over headers and put them into the appropriate column, numbers go straight into typed arrays
         for i, column_name, data_type in report_headers:
             if data_type == 0:
-                formatted_report[column_name] = list(report.dataAsSize(i))
+                formatted_report[column_name] = np.fromiter(report.dataAsSize(i), dtype=np.int64, count=rows)
             if data_type == 1:
-                formatted_report[column_name] = list(report.dataAsReal(i))
+                formatted_report[column_name] = np.fromiter(report.dataAsReal(i), dtype=np.float64, count=rows)
             if data_type == 2:
-                formatted_report[column_name] = list(report.dataAsString(i))
+                formatted_report[column_name] = np.array(report.dataAsString(i), dtype=object)
             if data_type == 3:
-                formatted_report[column_name] = [d.ISO() for d in report.dataAsDate(i)]
+                # Serial numbers are cheaper to read than ISO strings, each distinct date is formatted once
+                serials = np.fromiter((d.serialNumber() for d in report.dataAsDate(i)), dtype=np.int64, count=rows)
+                unique_serials, inverse = np.unique(serials, return_inverse=True)
+                iso = (unique_serials - 25569).astype("datetime64[D]").astype(str).astype(object)
+                formatted_report[column_name] = iso[inverse]
             if data_type == 4:
                 formatted_report[column_name] = list(report.dataAsPeriod(i))
 
-        formatted_report = pd.DataFrame(formatted_report)
+        formatted_report = pd.DataFrame(formatted_report, copy=False)
 
         return formatted_report
 
@@ -1,5 +1,7 @@
-import sys, time, math
+import os, sys, time, math
 import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from ore_report_diff import diff_sensitivity_reports, diff_scenario_reports
 
 def checkErrorsAndRunTime(app):
     errors = app.getErrors()
@@ -306,34 +308,18 @@ def match_sensi_reports(ore1, ore2, deltaHeader1, deltaHeader2, debug=False):
         print("ORE 2:")
         display(format_report(sensi2))
 
-    trade1 = sensi1.dataAsString(0)
-    factor1 = sensi1.dataAsString(2)
-    currency1 = sensi1.dataAsString(6)
-    delta1 = sensi1.dataAsReal(8) 
-
-    trade2 = sensi2.dataAsString(0)
-    factor2 = sensi2.dataAsString(2)
-    currency2 = sensi2.dataAsString(6)
-    delta2 = sensi2.dataAsReal(8) 
+    diff = diff_sensitivity_reports(sensi1, sensi2)
 
     print ("%-25s %-45s %10s %10s %10s %10s" % ("Trade", "Factor", "Currency", deltaHeader1, deltaHeader2, "Diff"))
-    for j in range(0, sensi2.rows()):
-        matched = False
-        for i in range(0, sensi1.rows()):
-            if (trade1[i] == trade2[j] and factor1[i] == factor2[j]):
-                diff = delta1[i] - delta2[j]
-                print("%-25s %-45s %10s %10.2f %10.2f %10.2f" % (trade1[i], factor1[i], currency1[i], delta1[i], delta2[j], diff))
-                matched = True
-        if (matched == False):      
-            print("%-25s %-45s %10s %10s %10.2f %10s" % (trade2[j], factor2[j], currency2[j], "----", delta2[j], "----"))
-
-    for i in range(0, sensi1.rows()):
-        matched = False
-        for j in range(0, sensi2.rows()):
-            if (trade1[i] == trade2[j] and factor1[i] == factor2[j]):
-                matched = True
-        if (matched == False):      
-            print("%-25s %-45s %10s %10.2f %10s %10s" % (trade1[i], factor1[i], currency1[i], delta1[i], "----", "----"))
+    rows = pd.concat([diff.matched, diff.only_2.assign(row_1=-1)]).sort_values(["row_2", "row_1"])
+    for r in rows.itertuples(index=False):
+        if r.row_1 >= 0:
+            print("%-25s %-45s %10s %10.2f %10.2f %10.2f" % (r.TradeId, r.Factor_1, r.Currency, r.value_1, r.value_2, r.diff))
+        else:
+            print("%-25s %-45s %10s %10s %10.2f %10s" % (r.TradeId, r.Factor_1, r.Currency, "----", r.Delta, "----"))
+
+    for r in diff.only_1.itertuples(index=False):
+        print("%-25s %-45s %10s %10.2f %10s %10s" % (r.TradeId, r.Factor_1, r.Currency, r.Delta, "----", "----"))
 
 def match_scenario_reports(ore1, ore2, debug=False):
     sensi1 = ore1.getReport("xvacg-cva-sensi-scenario")
@@ -345,36 +331,19 @@ def match_scenario_reports(ore1, ore2, debug=False):
         print("ORE 2:")
         display(format_report(sensi2))
 
-    trade1 = sensi1.dataAsString(0)
-    factor1 = sensi1.dataAsString(1)
-    upDown1 = sensi1.dataAsString(2)
-    scenarioNpv1 = sensi1.dataAsReal(6)
-    delta1 = sensi1.dataAsReal(7)
-
-    trade2 = sensi2.dataAsString(0)
-    factor2 = sensi2.dataAsString(1)
-    upDown2 = sensi2.dataAsString(2)
-    scenarioNpv2 = sensi2.dataAsReal(6)
-    delta2 = sensi2.dataAsReal(7)
+    diff = diff_scenario_reports(sensi1, sensi2)
+    factor, upDown = diff.keys[1], diff.keys[2]
 
     print ("%-40s %-10s %10s %10s %10s" % ("Factor", "Scenario", "Delta1", "Delta2", "Diff"))
-    for j in range(0, sensi2.rows()):
-        matched = False
-        for i in range(0, sensi1.rows()):
-            if (trade1[i] == trade2[j] and factor1[i] == factor2[j] and upDown1[i] == upDown2[j]):
-                diff = delta1[i] - delta2[j]
-                print("%-40s %10s %10.2f %10.2f %10.2f" % (factor1[i], upDown1[i], delta1[i], delta2[j], diff))
-                matched = True
-        if (matched == False):      
-            print("%-25s %-10s %10s %10s %10.2f %10s" % (factor2[j], upDown2[j], "----", delta2[j], "----"))
-
-    for i in range(0, sensi1.rows()):
-        matched = False
-        for j in range(0, sensi2.rows()):
-            if (trade1[i] == trade2[j] and factor1[i] == factor2[j] and upDown1[i] == upDown2[j]):
-                matched = True
-        if (matched == False):      
-            print("%-40s %-10s %10.2f %10s %10s" % (factor1[i], upDown1[i], delta1[i], "----", "----"))
+    rows = pd.concat([diff.matched, diff.only_2.rename(columns={diff.value: "value_2"}).assign(row_1=-1)]).sort_values(["row_2", "row_1"])
+    for r in rows.to_dict("records"):
+        if r["row_1"] >= 0:
+            print("%-40s %10s %10.2f %10.2f %10.2f" % (r[factor], r[upDown], r["value_1"], r["value_2"], r["diff"]))
+        else:
+            print("%-40s %10s %10s %10.2f %10s" % (r[factor], r[upDown], "----", r["value_2"], "----"))
+
+    for r in diff.only_1.to_dict("records"):
+        print("%-40s %-10s %10.2f %10s %10s" % (r[factor], r[upDown], r[diff.value], "----", "----"))
 
 def match_pricingstats_12(ore1, ore2, header2, debug = False):
     pricingstats1 = ore1.getReport("pricingstats")
@@ -1,16 +1,21 @@
 from sys import prefix
-from llm_manager import llm
+from llm_manager import llm, cached_llm
 from langchain_experimental.agents.agent_toolkits import create_pandas_dataframe_agent
 from langchain_core.messages import HumanMessage, SystemMessage
 import pandas as pd
 import os
 from langchain.tools import tool
 import re
-from typing import List, Dict, Optional, Tuple, Literal
+from typing import Any, List, Dict, Optional, Tuple, Literal
 from glob import glob
 from langchain_anthropic import ChatAnthropic
 from pydantic import BaseModel, Field
-from config_file import f_path_out
+from config_file import f_path_out, f_path_in
+from ore_parquet import query_report
+from ore_exposure import get_exposure_engines, pfe_column
+from ore_collateral import CsaParameters, run_collateral_sweep
+from ore_inputs import resolve_ore_input_files
+from ore_pricing_profiler import get_pricing_history
 
 report_descriptions = {
     "npv": "Contains the Net Present Value (NPV) for each trade, calculated based on discounted future cash flows. The output file, typically 'npv.csv', includes columns such as TradeId (unique trade identifier), NPV (the net present value), and Currency (the currency of the NPV). This report provides a snapshot of trade or portfolio valuation under current market conditions.",
@@ -47,10 +52,12 @@ def analyze_relevant_files(query: str) -> str:
         file_name: Literal[*files_list] = Field(description="The file name to be selected that best describes the query")
         rephrased_query: str = Field(description="Rephrase the user query to make it very objective and specific in terms of the question to be answered by an AI agent to get answer from the data file provided.")
         report_type: Literal[*list(report_descriptions.keys())] = Field(description="The type of report that best describes the query")
+        trade_ids: List[str] = Field(description="Trade ids the query is restricted to, empty if it is about all trades.", default=[])
+        netting_sets: List[str] = Field(description="Netting set ids the query is restricted to, empty if it is about all netting sets.", default=[])
    
     
     # Extract key terms from the query
-    df_query = llm.with_structured_output(ChooseFileQuery).invoke([SystemMessage(content="You are an expert in finding relevant files based on a user query. Analyze the following query: \n\n"), HumanMessage(content=query)])
+    df_query = cached_llm.with_structured_output(ChooseFileQuery).invoke([SystemMessage(content="You are an expert in finding relevant files based on a user query. Analyze the following query: \n\n"), HumanMessage(content=query)], files=files_list)
     sys_prompt_pandas = f"""You are an expert in analyzing
      data and providing insights by analyzing files using python and pandas library.
      The file provided to you is a {df_query.report_type} report.
@@ -66,7 +73,10 @@ def analyze_relevant_files(query: str) -> str:
     Make sure the response is in markdown format and in professional tone to summarize all the actions taken to come to final conlusion.
     """
     
-    df = pd.read_csv(df_query.file_name)
+    # Only the rows of the trades/netting sets asked about, unless the filter matches nothing.
+    df = query_report(df_query.file_name, trade_ids=df_query.trade_ids, netting_sets=df_query.netting_sets)
+    if df.empty:
+        df = query_report(df_query.file_name)
 
     agent_executor = create_pandas_dataframe_agent(
     llm,
@@ -108,12 +118,14 @@ def analyze_and_plot_relevant_files(query: str) -> Tuple[str, List[str]]:
         file_name: Literal[*files_list] = Field(description="The file name to be selected that best describes the query")
         rephrased_query: str = Field(description="Rephrase the user query to make it very objective and specific in terms of the question to be answered by an AI agent to get answer from the data file provided. You may also choose to use the given query without modification if you think its already spcific and clear to perform analysis.")
         report_type: Literal[*list(report_descriptions.keys())] = Field(description="The type of report that best describes the query")
+        trade_ids: List[str] = Field(description="Trade ids the query is restricted to, empty if it is about all trades.", default=[])
+        netting_sets: List[str] = Field(description="Netting set ids the query is restricted to, empty if it is about all netting sets.", default=[])
    
     class IsPlotSaved(BaseModel):
         plot_created_status: Literal["success", "error"] = Field(description="Status of plot being created and saved. Check if plot created and saved successfully inferred from the code generated by agent.")
         plot_file_name: List[str] = Field(description="The file name of the saved plot. It should be intuitive and self-explanatory based on user query.Always save the plots as jpg.", default=[])
     # Extract key terms from the query
-    df_query = llm.with_structured_output(ChooseFileQuery).invoke([SystemMessage(content="You are an expert in finding relevant files based on a user query. Analyze the following query: \n\n"), HumanMessage(content=query)])
+    df_query = cached_llm.with_structured_output(ChooseFileQuery).invoke([SystemMessage(content="You are an expert in finding relevant files based on a user query. Analyze the following query: \n\n"), HumanMessage(content=query)], files=files_list)
     sys_prompt_pandas_prefix = f"""You are an expert in creating plots and visualizing data using matplotlib library and providing insights by analyzing files using python and pandas library.
      The file provided to you is a {df_query.report_type} report.
      This data contained in this report is described as follows: \n\n{report_descriptions[df_query.report_type]}\n\n
@@ -131,7 +143,10 @@ def analyze_and_plot_relevant_files(query: str) -> Tuple[str, List[str]]:
     Make sure the response is in markdown format and in professional tone to summarize all the actions taken to come to final conlusion.
     """
     
-    df = pd.read_csv(df_query.file_name)
+    # Only the rows of the trades/netting sets asked about, unless the filter matches nothing.
+    df = query_report(df_query.file_name, trade_ids=df_query.trade_ids, netting_sets=df_query.netting_sets)
+    if df.empty:
+        df = query_report(df_query.file_name)
 
     agent_executor = create_pandas_dataframe_agent(
     llm,
@@ -175,6 +190,101 @@ def get_list_of_relevant_files() -> List[str]:
 
     return glob(os.path.join(f_path_out, "*.csv"))
 
+undiscounted_basel_note = "Note: the run sets no baseCurrency for the simulation/xva analytics (or curves.csv has no curve for it), " \
+                          "Basel EE, EEE and EEPE are not discounted."
+
+@tool
+def compute_exposure_metrics(quantiles: Optional[List[float]] = None, trade_id: Optional[str] = None, netting_set: Optional[str] = None) -> str:
+    """
+    Compute exposure profiles (EPE, ENE, PFE at any quantiles, Basel EE/EEE) and Basel EPE/EEPE of a trade or a netting set
+    directly from the simulated NPV cube of the last ORE run, without re-running ORE. Use it for questions like
+    "what is the 99% PFE" or "peak EPE of netting set X".
+
+    Args:
+        quantiles (Optional[List[float]]): PFE quantiles, e.g. [0.95, 0.99]. Defaults to [0.95].
+        trade_id (Optional[str]): Trade to compute the profile for.
+        netting_set (Optional[str]): Netting set to compute the profile for, used when no trade_id is given.
+            If neither is given, the first netting set of the cube is used.
+
+    Returns:
+        str: Peak values and Basel EPE/EEPE followed by the exposure profile as CSV.
+    """
+    try:
+        quantiles = quantiles or [0.95]
+        trade_engine, netting_set_engine = get_exposure_engines(f_path_out, f_path_in)
+        engine = trade_engine if trade_id is not None else netting_set_engine
+        if engine is None:
+            return "Error computing exposure metrics: no rawcube.csv/netcube.csv in the output folder, run ORE with the simulation and xva analytics first."
+        id_ = trade_id or netting_set or engine.cube.ids[0]
+        profile = engine.profile(id_, quantiles)
+        basel = engine.basel_epe().set_index("Id").loc[id_]
+        summary = [f"Exposure of {'trade' if trade_id is not None else 'netting set'} {id_} over {len(profile)} dates:",
+                   f"Peak EPE: {profile['EPE'].max():.2f} on {profile.loc[profile['EPE'].idxmax(), 'Date']}"]
+        for q in quantiles:
+            column = pfe_column(q)
+            summary.append(f"Peak PFE at {q:g}: {profile[column].max():.2f} on {profile.loc[profile[column].idxmax(), 'Date']}")
+        summary.append(f"Basel EPE: {basel['BaselEPE']:.2f}, Basel EEPE: {basel['BaselEEPE']:.2f}")
+        if engine.discount_factors is None:
+            summary.append(undiscounted_basel_note)
+        return "\n".join(summary) + "\n\n" + profile.round(2).to_csv(index=False)
+    except Exception as e:
+        return f"Error computing exposure metrics: {e}"
+
+@tool
+def sweep_collateral_parameters(netting_set: str, variants: List[Dict[str, Any]], quantile: float = 0.95) -> str:
+    """
+    What-if analysis of collateral (CSA) parameters of a netting set on the NPV cube of the last ORE run, without
+    re-running ORE. Every variant starts from the netting set's CSA in the run's netting.xml and overrides some of its
+    parameters: active (bool), threshold_pay, threshold_receive, mta_pay, mta_receive, independent_amount_held,
+    mpor (period such as '2W'), spread_pay, spread_receive. Give every variant a "name".
+
+    Args:
+        netting_set (str): Netting set id, e.g. 'CPTY_A'.
+        variants (List[Dict[str, Any]]): e.g. [{"name": "thr_1m", "threshold_pay": 1e6, "threshold_receive": 1e6}, {"name": "mpor_1m", "mpor": "1M"}].
+        quantile (float): PFE quantile.
+
+    Returns:
+        str: One row per variant (and the current CSA) with peak EPE, peak PFE, Basel EEPE and COLVA, as CSV.
+    """
+    try:
+        csa_file = resolve_ore_input_files(f_path_in).get("xva/csaFile")
+        base = CsaParameters.from_netting_xml(csa_file, netting_set) if csa_file else CsaParameters(active=False)
+        all_variants = {"current": base}
+        for n, variant in enumerate(variants):
+            changes = {k: v for k, v in variant.items() if k != "name"}
+            all_variants[str(variant.get("name", f"variant_{n + 1}"))] = base.replace(active=changes.pop("active", True), **changes)
+        result = run_collateral_sweep(f_path_out, netting_set, all_variants, f_path_in, quantile)
+        summary = result.summary.round({"PeakEPE": 2, "PeakPFE": 2, "BaselEEPE": 2, "COLVA": 2}).to_csv(index=False)
+        if get_exposure_engines(f_path_out, f_path_in)[1].discount_factors is None:
+            summary += undiscounted_basel_note
+        return summary
+    except Exception as e:
+        return f"Error sweeping collateral parameters: {e}"
+
+@tool
+def profile_pricing_performance(runs: Optional[List[str]] = None, baseline: Optional[str] = None, top_k: int = 10) -> str:
+    """
+    Compare the pricing performance (pricingstats timings) of past ORE runs: total timings, speedups per trade type
+    against a baseline run, trades that got slower, and the slowest trades of the latest run.
+
+    Args:
+        runs (Optional[List[str]]): Run ids or labels from the pricing history, oldest first. None or empty for the last 5 full or sharded runs.
+        baseline (Optional[str]): Run to compare against, the first run by default.
+        top_k (int): Number of slowest trades and regressions to list.
+
+    Returns:
+        str: The profiler report, starting with the list of recorded runs.
+    """
+    try:
+        history = get_pricing_history()
+        recorded = history.runs()
+        if recorded.empty:
+            return "Error profiling pricing performance: no runs recorded yet, run ORE first."
+        profile = history.profile(runs or None, last=None if runs else 5)
+        return "Recorded runs:\n" + recorded.round(3).to_string(index=False) + "\n\n" + profile.summary(baseline, top_k)
+    except Exception as e:
+        return f"Error profiling pricing performance: {e}"
+
 # @tool
 # def get_human_help(query: str) -> str:
 #     """
@@ -191,7 +301,7 @@ def get_list_of_relevant_files() -> List[str]:
 
 
 
-list_analysis_tools = [analyze_and_plot_relevant_files, analyze_relevant_files, get_list_of_relevant_files]
+list_analysis_tools = [analyze_and_plot_relevant_files, analyze_relevant_files, get_list_of_relevant_files, compute_exposure_metrics, sweep_collateral_parameters, profile_pricing_performance]
 list_analysis_tools_description = [i.name+" : "+i.description + '\n\n' for n, i in enumerate(list_analysis_tools)]
 
 
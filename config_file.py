@@ -4,6 +4,30 @@ f_path_out = 'Examples/Example_1/Output'
 f_path_trade_docs = 'Docs/UserGuide/tradedata'
 f_path_trade_samples = 'Examples/Sample_Trades'
 
+ore_worker_pool_size = 2
+
+f_path_ore_cache = '.ore_cache'
+ore_cache_budget_bytes = 2 * 1024**3
+ore_incremental_enabled = True
+ore_shard_count = 4
+ore_report_store_enabled = True
+f_path_ore_sandbox = '.ore_sandbox'
+ore_binary_cube_export = True
+ore_parquet_export = True
+ore_parquet_row_group_size = 64 * 1024
+f_path_pricing_history = '.ore_pricing_history.csv'
+ore_pricing_history_enabled = True
+xml_cache_max_entries = 32
+f_path_trade_index = '.ore_trade_index'
+portfolio_compaction_ratio = 0.25
+xml_backend = 'auto'
+f_path_ore_xsd = 'xsd'
+ore_preflight_validation = True
+f_path_llm_cache = '.llm_cache'
+llm_cache_enabled = True
+llm_cache_ttl_seconds = 7 * 24 * 3600
+llm_cache_max_entries = 2000
+
 
 class FileHandlingUtil:
     def __init__(self):
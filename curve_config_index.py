@@ -0,0 +1,274 @@
+"""
+Index and dependency graph of a curveconfig.xml file.
+
+The curve configuration tools used to search the whole file (about 130 KB in the ORE examples) for every
+lookup. The index maps every curve configuration, keyed by its element tag and CurveId (e.g.
+('YieldCurve', 'EUR1D')), to its element and records what it references:
+    - curves: market specifications such as 'Yield/EUR/EUR1D' and bare yield curve ids in DiscountCurve,
+      ProjectionCurve... elements,
+    - conventions: Conventions elements (ids in conventions.xml),
+    - quotes: Quote, SpotQuote, SpotRate, RecoveryRate... elements (market data quotes),
+    - indices: IborIndex, SwapIndexBase, Index... elements.
+From the reverse curve references, affected_curves finds every curve that has to be built again after a
+change of some curves, conventions or quotes, and affected_market_objects and affected_trades follow
+that to the todaysmarket.xml entries and the trades using them.
+
+The index is built from the cached parse of the file and rebuilt when the file changes on disk; the
+curve configuration tools report the curves they edited with record_edit, which re-indexes only those.
+"""
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from xml_document_cache import file_signature, parse_xml
+
+CurveKey = Tuple[str, str]
+
+# First token of a market specification -> curve configuration element
+spec_curve_types = {
+    "Yield": "YieldCurve", "Default": "DefaultCurve", "Inflation": "InflationCurve", "Equity": "EquityCurve",
+    "Security": "Security", "Commodity": "CommodityCurve", "SwaptionVolatility": "SwaptionVolatility",
+    "CapFloorVolatility": "CapFloorVolatility", "FXVolatility": "FXVolatility", "EquityVolatility": "EquityVolatility",
+    "CDSVolatility": "CDSVolatility", "BaseCorrelation": "BaseCorrelation", "Correlation": "Correlation",
+    "CommodityVolatility": "CommodityVolatility", "InflationCapFloorVolatility": "InflationCapFloorVolatility",
+}
+# Elements that name a yield curve by its bare CurveId
+yield_curve_tags = {"DiscountCurve", "ProjectionCurve", "ProjectionCurveShort", "ProjectionCurveLong", "ProjectionCurveDomestic",
+                    "ProjectionCurveForeign", "ProjectionCurvePay", "ProjectionCurveReceive", "ReferenceCurve", "IborIndexCurve",
+                    "ForecastingCurve", "ForeignDiscountCurve", "DomesticDiscountCurve"}
+quote_tags = {"Quote", "SpotRate", "RecoveryRate", "Factor"}
+index_tags = {"IborIndex", "SwapIndexBase", "ShortSwapIndexBase", "Index", "Index1", "Index2"}
+
+
+def curve_element_tag(curve_type: str) -> str:
+    """Element tag of a curve type given by its section or element name, e.g. SwaptionVolatilities -> SwaptionVolatility."""
+    if curve_type.endswith("ies"):
+        return curve_type[:-3] + "y"
+    if curve_type.endswith("s") and not curve_type.endswith("ss"):
+        return curve_type[:-1]
+    return curve_type
+
+
+def spec_curve_key(spec: str) -> Optional[CurveKey]:
+    """Curve configuration a market specification such as 'Yield/EUR/EUR1D' refers to, None if it is not one."""
+    tokens = spec.strip().split("/")
+    if len(tokens) < 2 or tokens[0] not in spec_curve_types:
+        return None
+    return spec_curve_types[tokens[0]], tokens[-1]
+
+
+class CurveReferences:
+    """What one curve configuration references."""
+
+    def __init__(self):
+        self.curves: Set[CurveKey] = set()
+        self.conventions: Set[str] = set()
+        self.quotes: Set[str] = set()
+        self.indices: Set[str] = set()
+
+
+def _references(key: CurveKey, element: ET.Element) -> CurveReferences:
+    references = CurveReferences()
+    for child in element.iter():
+        text = (child.text or "").strip()
+        if len(child) or not text or child is element:
+            continue
+        tag = child.tag
+        if tag == "Conventions":
+            references.conventions.add(text)
+        elif tag in quote_tags or tag.endswith("Quote"):
+            references.quotes.add(text)
+        elif tag in index_tags:
+            references.indices.add(text)
+        elif "/" in text:
+            curve = spec_curve_key(text)
+            if curve is not None:
+                references.curves.add(curve)
+        elif tag in yield_curve_tags:
+            references.curves.add(("YieldCurve", text))
+    references.curves.discard(key)
+    return references
+
+
+class CurveConfigIndex:
+    """
+    Index of one curveconfig.xml file.
+
+    Attributes:
+        path (str): The curveconfig.xml file.
+        unidentified (List[str]): Element tags of the curve configurations without a CurveId, which are not indexed.
+        full_builds, partial_updates (int): How often the index was built from scratch or updated by record_edit.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self.signature = None
+        self._curves: Dict[CurveKey, ET.Element] = {}
+        self._sections: Dict[str, Dict[str, None]] = {}
+        self._section_of: Dict[str, str] = {}
+        self._references: Dict[CurveKey, CurveReferences] = {}
+        self._dependents: Dict[CurveKey, Set[CurveKey]] = {}
+        self.unidentified: List[str] = []
+        self.full_builds = 0
+        self.partial_updates = 0
+
+    def _add(self, section: str, element: ET.Element) -> None:
+        curve_id = (element.findtext("CurveId") or "").strip()
+        if not curve_id:
+            self.unidentified.append(element.tag)
+            return
+        key = (element.tag, curve_id)
+        self._remove(key)
+        self._curves[key] = element
+        self._sections.setdefault(section, {})[curve_id] = None
+        self._section_of[element.tag] = section
+        references = self._references[key] = _references(key, element)
+        for curve in references.curves:
+            self._dependents.setdefault(curve, set()).add(key)
+
+    def _remove(self, key: CurveKey) -> None:
+        if self._curves.pop(key, None) is None:
+            return
+        self._sections.get(self._section_of.get(key[0]), {}).pop(key[1], None)
+        for curve in self._references.pop(key).curves:
+            self._dependents.get(curve, set()).discard(key)
+
+    def _build(self, root: ET.Element) -> None:
+        self._curves, self._sections, self._section_of, self._references, self._dependents = {}, {}, {}, {}, {}
+        self.unidentified = []
+        for section in root:
+            for element in section:
+                self._add(section.tag, element)
+        self.full_builds += 1
+
+    def refresh(self) -> "CurveConfigIndex":
+        """Build the index again if the file changed on disk."""
+        with self._lock:
+            signature = file_signature(self.path)
+            if signature != self.signature:
+                self._build(parse_xml(self.path).getroot())
+                self.signature = signature
+            return self
+
+    def record_edit(self, curves: Iterable[Tuple[str, str]]) -> None:
+        """
+        Take over an edit of the file that added, changed or removed the given curves, as (curve type, CurveId),
+        by indexing only those again. Falls back to a full build if the index was not up to date.
+        """
+        with self._lock:
+            if self.signature is None:
+                self.refresh()
+                return
+            root = parse_xml(self.path).getroot()
+            for curve_type, curve_id in curves:
+                tag = curve_element_tag(curve_type)
+                self._remove((tag, curve_id))
+                for section in root:
+                    element = next((e for e in section if e.tag == tag and (e.findtext("CurveId") or "").strip() == curve_id), None)
+                    if element is not None:
+                        self._add(section.tag, element)
+                        break
+            self.signature = file_signature(self.path)
+            self.partial_updates += 1
+
+    def get(self, curve_type: str, curve_id: str) -> Optional[ET.Element]:
+        """The (shared, read-only) element of a curve configuration, None if there is none."""
+        self.refresh()
+        return self._curves.get((curve_element_tag(curve_type), curve_id))
+
+    def curve_ids(self, curve_type: str) -> List[str]:
+        """CurveIds of all configurations of a curve type."""
+        self.refresh()
+        tag = curve_element_tag(curve_type)
+        return [curve_id for curve_id in self._sections.get(self._section_of.get(tag), {}) if (tag, curve_id) in self._curves]
+
+    def find(self, curve_id: str) -> List[CurveKey]:
+        """All curve configurations with this CurveId, of any type."""
+        self.refresh()
+        return [key for key in self._curves if key[1] == curve_id]
+
+    def curve_types(self) -> Dict[str, List[str]]:
+        """CurveIds by section, in file order."""
+        self.refresh()
+        return {section: list(ids) for section, ids in self._sections.items() if ids}
+
+    def references(self, curve_type: str, curve_id: str) -> Optional[CurveReferences]:
+        self.refresh()
+        return self._references.get((curve_element_tag(curve_type), curve_id))
+
+    def dependents(self, curve_type: str, curve_id: str) -> Set[CurveKey]:
+        """Curves that reference this curve directly."""
+        self.refresh()
+        return set(self._dependents.get((curve_element_tag(curve_type), curve_id), set()))
+
+    def missing_references(self) -> List[Tuple[CurveKey, CurveKey]]:
+        """(curve, referenced curve) for every reference to a curve configuration that is not in the file."""
+        self.refresh()
+        return [(key, curve) for key, references in self._references.items() for curve in sorted(references.curves)
+                if curve not in self._curves]
+
+    def affected_curves(self, curves: Iterable[Tuple[str, str]] = (), conventions: Iterable[str] = (),
+                        quotes: Iterable[str] = ()) -> Set[CurveKey]:
+        """
+        Curves to build again after a change of the given curves, conventions or quotes: the curves themselves,
+        the curves using the conventions or quotes, and everything that references them, transitively.
+        """
+        self.refresh()
+        conventions, quotes = set(conventions), set(quotes)
+        pending = [(curve_element_tag(t), i) for t, i in curves]
+        pending += [key for key, r in self._references.items() if r.conventions & conventions or r.quotes & quotes]
+        affected: Set[CurveKey] = set()
+        while pending:
+            key = pending.pop()
+            if key in affected:
+                continue
+            affected.add(key)
+            pending.extend(self._dependents.get(key, ()))
+        return affected
+
+
+def affected_market_objects(todaysmarket: ET.Element, curves: Set[CurveKey]) -> Dict[str, Set[str]]:
+    """
+    Entries of todaysmarket.xml built from the given curves, by section, e.g.
+    {"DiscountingCurves": {"EUR"}, "IndexForwardingCurves": {"EUR-EURIBOR-6M"}}.
+    """
+    objects: Dict[str, Set[str]] = {}
+    for section in todaysmarket:
+        for entry in section:
+            if spec_curve_key(entry.text or "") in curves:
+                name = next(iter(entry.attrib.values()), None)
+                if name:
+                    objects.setdefault(section.tag, set()).add(name)
+    return objects
+
+
+def affected_trades(portfolio_path: str, names: Iterable[str]) -> List[str]:
+    """
+    Ids of the trades with an element whose text is one of names (currencies, index names, curve or equity
+    names), i.e. the trades that use one of these market objects.
+    """
+    from portfolio_trade_index import get_trade_index
+    names = sorted(set(names), key=len, reverse=True)
+    if not names:
+        return []
+    pattern = re.compile(rb">\s*(?:" + b"|".join(re.escape(n.encode()) for n in names) + rb")\s*<")
+    index = get_trade_index(portfolio_path)
+    with open(index.path, "rb") as f:
+        data = f.read()
+    return [trade_id for trade_id, start, end in zip(index.ids, index.starts, index.ends) if pattern.search(data, start, end)]
+
+
+_indexes: Dict[str, CurveConfigIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_curve_config_index(path: str) -> CurveConfigIndex:
+    """Return the process-wide, up to date index of a curveconfig.xml file."""
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = CurveConfigIndex(path)
+    return index.refresh()
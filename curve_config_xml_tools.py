@@ -1,14 +1,19 @@
 import os
 import xml.etree.ElementTree as ET
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from langchain_anthropic import ChatAnthropic
 from langchain.tools import tool
+from config_file import f_path_in
+from xml_document_cache import parse_xml, write_xml
+from xml_edit_session import XmlEditSession, XmlEditError, edit_xml
+from curve_config_index import get_curve_config_index, curve_element_tag, affected_market_objects, affected_trades
+from ore_inputs import resolve_ore_input_files
 
 # Helper function to save XML with proper formatting
 def _save_xml(tree: ET.ElementTree, file_path: str) -> None:
     """Save the XML tree to the specified file path with proper indentation."""
     ET.indent(tree, space="  ")  # Pretty print with 2-space indentation
-    tree.write(file_path, encoding="utf-8", xml_declaration=True)
+    write_xml(tree, file_path, encoding="utf-8", xml_declaration=True)
 
 # Tool 1: Create a new curveconfig.xml file with a minimal template
 @tool
@@ -30,6 +35,63 @@ def create_curveconfig_file(file_path: str) -> Dict[str, str]:
     _save_xml(tree, file_path)
     return {"status": "New curveconfig.xml created", "path": file_path}
 
+def _find_curve(root: ET.Element, curve_type: str, curve_id: str) -> ET.Element:
+    curve_element_name = curve_element_tag(curve_type)
+    curve = root.find(f".//{curve_element_name}[CurveId='{curve_id}']")
+    if curve is None:
+        raise XmlEditError(f"No {curve_type} found with CurveId '{curve_id}'")
+    return curve
+
+def _add_curve_configuration(root: ET.Element, curve_type: str, curve_data: Dict[str, str]) -> str:
+    # Ensure the parent element exists (e.g., <SwaptionVolatilities>)
+    parent = root.find(curve_type)
+    if parent is None:
+        parent = ET.SubElement(root, curve_type)
+    
+    # Create the specific curve element (e.g., <SwaptionVolatility>)
+    curve_element_name = curve_element_tag(curve_type)  # e.g., 'SwaptionVolatility'
+    curve = ET.SubElement(parent, curve_element_name)
+    
+    # Add curve data as sub-elements
+    for key, value in curve_data.items():
+        ET.SubElement(curve, key).text = value
+    return f"Added {curve_type} configuration"
+
+def _modify_curve_configuration(root: ET.Element, curve_type: str, curve_id: str, updates: Dict[str, str]) -> str:
+    curve = _find_curve(root, curve_type, curve_id)
+    
+    # Update the fields
+    for key, value in updates.items():
+        element = curve.find(key)
+        if element is not None:
+            element.text = value
+        else:
+            ET.SubElement(curve, key).text = value
+    return f"Modified {curve_type} with CurveId '{curve_id}'"
+
+def _delete_curve_configuration(root: ET.Element, curve_type: str, curve_id: str) -> str:
+    curve = _find_curve(root, curve_type, curve_id)
+    
+    # Remove the curve from its parent
+    parent = root.find(f".//{curve_element_tag(curve_type)}[CurveId='{curve_id}']/..")
+    parent.remove(curve)
+    return f"Deleted {curve_type} with CurveId '{curve_id}'"
+
+curve_edit_actions = {"add": _add_curve_configuration, "modify": _modify_curve_configuration, "delete": _delete_curve_configuration}
+
+def _edited_curves(edit: Dict[str, Any]) -> List[tuple]:
+    """(curve type, CurveId) of the curves an edit of curve_edit_actions adds, changes or removes."""
+    curve_type = edit.get("curve_type", "")
+    curve_ids = [edit.get("curve_id"), (edit.get("curve_data") or {}).get("CurveId"), (edit.get("updates") or {}).get("CurveId")]
+    return [(curve_type, curve_id) for curve_id in curve_ids if curve_id]
+
+def _edit_curveconfig(file_path: str, operation, edited_curves: List[tuple]) -> str:
+    """Apply one edit operation to a curveconfig.xml file, save it pretty printed and update its index."""
+    index = get_curve_config_index(file_path)
+    message = edit_xml(file_path, operation, indent="  ", encoding="utf-8", xml_declaration=True)
+    index.record_edit(edited_curves)
+    return message
+
 # Tool 2: Add a new curve configuration
 @tool
 def add_curve_configuration(file_path: str, curve_type: str, curve_data: Dict[str, str]) -> Dict[str, str]:
@@ -47,24 +109,12 @@ def add_curve_configuration(file_path: str, curve_type: str, curve_data: Dict[st
     if not os.path.exists(file_path):
         return {"status": "File does not exist", "path": file_path}
     
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
-    # Ensure the parent element exists (e.g., <SwaptionVolatilities>)
-    parent = root.find(curve_type)
-    if parent is None:
-        parent = ET.SubElement(root, curve_type)
-    
-    # Create the specific curve element (e.g., <SwaptionVolatility>)
-    curve_element_name = curve_type.rstrip('s')  # e.g., 'SwaptionVolatility'
-    curve = ET.SubElement(parent, curve_element_name)
-    
-    # Add curve data as sub-elements
-    for key, value in curve_data.items():
-        ET.SubElement(curve, key).text = value
-    
-    _save_xml(tree, file_path)
-    return {"status": f"Added {curve_type} configuration", "curve_id": curve_data.get("CurveId", "Unknown")}
+    try:
+        status = _edit_curveconfig(file_path, lambda root: _add_curve_configuration(root, curve_type, curve_data),
+                                   _edited_curves({"curve_type": curve_type, "curve_data": curve_data}))
+    except XmlEditError as e:
+        status = str(e)
+    return {"status": status, "curve_id": curve_data.get("CurveId", "Unknown")}
 
 # Tool 3: Modify an existing curve configuration
 @tool
@@ -84,25 +134,11 @@ def modify_curve_configuration(file_path: str, curve_type: str, curve_id: str, u
     if not os.path.exists(file_path):
         return {"status": "File does not exist", "path": file_path}
     
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
-    # Find the specific curve
-    curve_element_name = curve_type.rstrip('s')
-    curve = root.find(f".//{curve_element_name}[CurveId='{curve_id}']")
-    if curve is None:
-        return {"status": f"No {curve_type} found with CurveId '{curve_id}'"}
-    
-    # Update the fields
-    for key, value in updates.items():
-        element = curve.find(key)
-        if element is not None:
-            element.text = value
-        else:
-            ET.SubElement(curve, key).text = value
-    
-    _save_xml(tree, file_path)
-    return {"status": f"Modified {curve_type} with CurveId '{curve_id}'"}
+    try:
+        return {"status": _edit_curveconfig(file_path, lambda root: _modify_curve_configuration(root, curve_type, curve_id, updates),
+                                            _edited_curves({"curve_type": curve_type, "curve_id": curve_id, "updates": updates}))}
+    except XmlEditError as e:
+        return {"status": str(e)}
 
 # Tool 4: Delete a curve configuration
 @tool
@@ -121,21 +157,41 @@ def delete_curve_configuration(file_path: str, curve_type: str, curve_id: str) -
     if not os.path.exists(file_path):
         return {"status": "File does not exist", "path": file_path}
     
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    try:
+        return {"status": _edit_curveconfig(file_path, lambda root: _delete_curve_configuration(root, curve_type, curve_id),
+                                            [(curve_type, curve_id)])}
+    except XmlEditError as e:
+        return {"status": str(e)}
+
+# Tool 4b: Apply several curve configuration edits at once
+@tool
+def edit_curve_configurations(file_path: str, edits: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Applies several curve configuration edits in one go. The edits are applied in order and saved together;
+    if one of them fails, none is saved.
     
-    # Find the specific curve
-    curve_element_name = curve_type.rstrip('s')
-    curve = root.find(f".//{curve_element_name}[CurveId='{curve_id}']")
-    if curve is None:
-        return {"status": f"No {curve_type} found with CurveId '{curve_id}'"}
+    Args:
+        file_path (str): Absolute path to the curveconfig.xml file.
+        edits (List[Dict[str, Any]]): The edits, each one of
+            {"action": "add", "curve_type": "SwaptionVolatilities", "curve_data": {"CurveId": "EUR", ...}},
+            {"action": "modify", "curve_type": "SwaptionVolatilities", "curve_id": "EUR", "updates": {"Dimension": "Smile"}},
+            {"action": "delete", "curve_type": "SwaptionVolatilities", "curve_id": "EUR"}.
     
-    # Remove the curve from its parent
-    parent = root.find(f".//{curve_element_name}[CurveId='{curve_id}']/..")
-    parent.remove(curve)
+    Returns:
+        Dict[str, str]: Status message with one line per edit, or the reason why no edit was saved.
+    """
+    if not os.path.exists(file_path):
+        return {"status": "File does not exist", "path": file_path}
     
-    _save_xml(tree, file_path)
-    return {"status": f"Deleted {curve_type} with CurveId '{curve_id}'"}
+    try:
+        index = get_curve_config_index(file_path)
+        session = XmlEditSession(file_path, indent="  ", encoding="utf-8", xml_declaration=True)
+        session.queue_edits(edits, curve_edit_actions)
+        status = "\n".join(session.commit())
+        index.record_edit([curve for edit in edits for curve in _edited_curves(edit)])
+        return {"status": status}
+    except XmlEditError as e:
+        return {"status": str(e)}
 
 # Tool 5: Retrieve details of a curve configuration
 @tool
@@ -154,12 +210,7 @@ def get_curve_configuration(file_path: str, curve_type: str, curve_id: str) -> D
     if not os.path.exists(file_path):
         return {"status": "File does not exist", "path": file_path}
     
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
-    # Find the specific curve
-    curve_element_name = curve_type.rstrip('s')
-    curve = root.find(f".//{curve_element_name}[CurveId='{curve_id}']")
+    curve = get_curve_config_index(file_path).get(curve_type, curve_id)
     if curve is None:
         return {"status": f"No {curve_type} found with CurveId '{curve_id}'"}
     
@@ -182,8 +233,7 @@ def validate_curveconfig(file_path: str) -> Dict[str, str]:
     if not os.path.exists(file_path):
         return {"status": "File does not exist", "path": file_path}
     
-    tree = ET.parse(file_path)
-    root = tree.getroot()
+    index = get_curve_config_index(file_path)
     
     errors = []
     required_fields = {
@@ -193,17 +243,81 @@ def validate_curveconfig(file_path: str) -> Dict[str, str]:
     }
     
     for curve_type, fields in required_fields.items():
-        curve_element_name = curve_type
-        for curve in root.findall(f".//{curve_element_name}"):
+        if curve_type in index.unidentified:
+            errors.append(f"Missing 'CurveId' in {curve_type} with CurveId 'Unknown'")
+        for curve_id in index.curve_ids(curve_type):
+            curve = index.get(curve_type, curve_id)
             for field in fields:
                 if curve.find(field) is None:
-                    curve_id = curve.find("CurveId").text if curve.find("CurveId") is not None else "Unknown"
                     errors.append(f"Missing '{field}' in {curve_type} with CurveId '{curve_id}'")
+    for (curve_type, curve_id), (missing_type, missing_id) in index.missing_references():
+        errors.append(f"{curve_type} '{curve_id}' references {missing_type} '{missing_id}', which is not configured")
     
     if errors:
         return {"status": "Validation failed", "errors": "; ".join(errors)}
     return {"status": "Validation successful"}
 
+def _ore_input_files_using(file_path: str, input_path: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """
+    Input files of the ORE run that reads file_path: the run in input_path if given, otherwise the ore.xml next
+    to file_path or the one in f_path_in, whichever references it. None if neither does.
+    """
+    candidates = [input_path] if input_path else [os.path.dirname(os.path.abspath(file_path)), f_path_in]
+    for candidate in candidates:
+        if not os.path.isfile(os.path.join(candidate, "ore.xml")):
+            continue
+        input_files = resolve_ore_input_files(candidate)
+        if os.path.abspath(file_path) in input_files.values():
+            return input_files
+    return None
+
+# Tool 6b: Find what has to be rebuilt after a change
+@tool
+def find_curves_affected_by_change(file_path: str, curves: Optional[List[str]] = None, conventions: Optional[List[str]] = None,
+                                   quotes: Optional[List[str]] = None, input_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Finds the curves that have to be built again after a change of some curve configurations, conventions or
+    market quotes (every curve that references them, directly or through other curves), the market objects of
+    todaysmarket.xml built from those curves and the trades of the portfolio using these market objects.
+    
+    Args:
+        file_path (str): Absolute path to the curveconfig.xml file.
+        curves (Optional[List[str]]): Changed curves as CurveId (e.g. 'EUR1D') or curve type and CurveId (e.g. 'YieldCurve/EUR1D').
+        conventions (Optional[List[str]]): Changed convention ids (e.g. 'EUR-EONIA-CONVENTIONS').
+        quotes (Optional[List[str]]): Changed market quotes (e.g. 'IR_SWAP/RATE/EUR/2D/6M/10Y').
+        input_path (Optional[str]): Input folder with the ore.xml whose todaysmarket.xml and portfolio are checked. By default
+            the ore.xml next to file_path or in the default input folder, whichever uses file_path.
+    
+    Returns:
+        Dict[str, Any]: Affected curves, market objects and trade ids.
+    """
+    if not os.path.exists(file_path):
+        return {"status": "File does not exist", "path": file_path}
+    
+    index = get_curve_config_index(file_path)
+    changed = []
+    for curve in curves or []:
+        if "/" in curve:
+            changed.append(tuple(curve.split("/", 1)))
+        else:
+            changed.extend(index.find(curve))
+    affected = index.affected_curves(changed, conventions or [], quotes or [])
+    result = {"status": "Success", "affected_curves": sorted(f"{curve_type}/{curve_id}" for curve_type, curve_id in affected)}
+    
+    try:
+        input_files = _ore_input_files_using(file_path, input_path)
+        if input_files is None:
+            result["status"] = "Affected curves found, but no ore.xml using this curveconfig was found to check market objects and trades; give its input_path."
+            return result
+        if "Setup/marketConfigFile" in input_files:
+            market_objects = affected_market_objects(parse_xml(input_files["Setup/marketConfigFile"]).getroot(), affected)
+            result["affected_market_objects"] = {section: sorted(names) for section, names in market_objects.items()}
+            if "Setup/portfolioFile" in input_files:
+                result["affected_trades"] = affected_trades(input_files["Setup/portfolioFile"], set().union(*market_objects.values()))
+    except Exception as e:
+        result["status"] = f"Affected curves found, but the ORE inputs could not be read: {e}"
+    return result
+
 # Tool 7: List all curve configurations
 @tool
 def list_curve_configurations(file_path: str) -> Dict[str, List[str]]:
@@ -219,17 +333,7 @@ def list_curve_configurations(file_path: str) -> Dict[str, List[str]]:
     if not os.path.exists(file_path):
         return {"status": "File does not exist", "path": file_path}
     
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-    
-    curve_types = {}
-    for elem in root:
-        curve_type = elem.tag
-        curve_ids = [curve.find("CurveId").text for curve in elem if curve.find("CurveId") is not None]
-        if curve_ids:
-            curve_types[curve_type] = curve_ids
-    
-    return {"status": "Success", "curve_types": curve_types}
+    return {"status": "Success", "curve_types": get_curve_config_index(file_path).curve_types()}
 
 @tool
 def seek_advice_on_curveconfig_xml(file_path: str, query: str) -> str:
@@ -285,8 +389,10 @@ list_curve_config_tools = [
     add_curve_configuration,
     modify_curve_configuration,
     delete_curve_configuration,
+    edit_curve_configurations,
     list_curve_configurations,
     seek_advice_on_curveconfig_xml,
     get_curve_configuration,
-    validate_curve_configuration
+    validate_curveconfig,
+    find_curves_affected_by_change
 ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 from langchain_anthropic import ChatAnthropic
 from dotenv import load_dotenv, find_dotenv
+from llm_response_cache import CachedChatModel
 
 load_dotenv(find_dotenv(), override = True)
 
@@ -25,3 +26,7 @@ llm_37 = ChatAnthropic(
     max_retries=2,
     # other params...
 )
+
+# Cached views of the models for one-shot tool calls, the agents use the models themselves.
+cached_llm = CachedChatModel(llm)
+cached_llm_37 = CachedChatModel(llm_37)
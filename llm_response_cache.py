@@ -0,0 +1,340 @@
+"""
+Persistent cache of LLM answers for the one-shot calls of the tools and the planner.
+
+Tools such as extract_trade_sample, get_output_file_name_from_analytic_parameters, the file selection of
+analyze_relevant_files and the planner send the same prompts again and again, within a session and across
+sessions. CachedChatModel wraps a chat model (llm_manager.llm, llm_37) and answers invoke and
+with_structured_output(schema).invoke from the cache when the same model was already asked the same thing.
+
+The key is a hash over the model (class, model name, temperature), the messages (role and content, with
+whitespace runs collapsed) and, for structured output, the JSON schema of the output type, so a prompt
+whose output type offers other choices (e.g. a Literal over the files in a folder) is a different prompt.
+Structured answers are stored as their JSON dump and validated into the schema again on a hit, plain
+answers as the message content. A call can name the files its prompt is about (files=[...]); the entry
+records their signatures and is dropped once one of them changes on disk.
+
+Entries are JSON files in f_path_llm_cache. They expire after llm_cache_ttl_seconds, and beyond
+llm_cache_max_entries the least recently used are evicted. The agents themselves keep the plain models,
+they need tool binding and their conversations rarely repeat.
+"""
+import os
+import re
+import json
+import time
+import hashlib
+import importlib
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from config_file import f_path_llm_cache, llm_cache_enabled, llm_cache_ttl_seconds, llm_cache_max_entries
+
+_whitespace = re.compile(r"\s+")
+
+
+def _content_key(content: Any) -> Any:
+    if isinstance(content, str):
+        return _whitespace.sub(" ", content).strip()
+    return json.loads(json.dumps(content, sort_keys=True, default=str))
+
+
+def normalize_messages(messages: Any) -> List[List[Any]]:
+    """[role, content] of every message of a prompt given as a string, message objects, dicts or (role, content) tuples."""
+    if isinstance(messages, str) or not isinstance(messages, (list, tuple)):
+        messages = [messages]
+    normalized = []
+    for message in messages:
+        if isinstance(message, str):
+            role, content = "human", message
+        elif isinstance(message, dict):
+            role, content = message.get("role", "human"), message.get("content", "")
+        elif isinstance(message, (list, tuple)) and len(message) == 2:
+            role, content = message
+        else:
+            role, content = getattr(message, "type", type(message).__name__), getattr(message, "content", str(message))
+        normalized.append([role, _content_key(content)])
+    return normalized
+
+
+def model_key(model: Any) -> str:
+    """Class, model name and sampling settings of a chat model."""
+    name = getattr(model, "model", None) or getattr(model, "model_name", None)
+    settings = {field: getattr(model, field, None) for field in ["temperature", "max_tokens", "top_p", "top_k"]}
+    return json.dumps([type(model).__name__, name, settings], sort_keys=True, default=str)
+
+
+def schema_key(schema: Any) -> str:
+    """JSON schema of a structured output type (pydantic model or JSON schema dict)."""
+    if hasattr(schema, "model_json_schema"):
+        return json.dumps(schema.model_json_schema(), sort_keys=True, default=str)
+    if isinstance(schema, dict):
+        return json.dumps(schema, sort_keys=True, default=str)
+    return repr(schema)
+
+
+def _file_signatures(files: Iterable[str]) -> Dict[str, Optional[List[int]]]:
+    signatures = {}
+    for path in files:
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+            signatures[path] = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+        except OSError:
+            signatures[path] = None
+    return signatures
+
+
+class LlmResponseCache:
+    def __init__(self, cache_dir: str = f_path_llm_cache, ttl_seconds: float = llm_cache_ttl_seconds,
+                 max_entries: int = llm_cache_max_entries):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    def key(self, model: str, messages: List[List[Any]], schema: Optional[str] = None) -> str:
+        payload = json.dumps([model, messages, schema], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _remove(self, key: str) -> None:
+        try:
+            os.remove(self._entry_path(key))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        The stored entry for key ({"value": ..., "message_class": ...}), None on a miss.
+
+        Expired entries and entries whose files changed on disk are removed.
+        """
+        with self._lock:
+            path = self._entry_path(key)
+            try:
+                with open(path, "r") as f:
+                    entry = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.misses += 1
+                return None
+            if time.time() - entry["created"] > self.ttl_seconds or _file_signatures(entry["files"]) != entry["files"]:
+                self._remove(key)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            # the modification time orders entries for eviction
+            os.utime(path)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, value: Any, files: Iterable[str] = (), message_class: Optional[str] = None) -> None:
+        """Store a JSON serialisable answer, valid while the given files are unchanged."""
+        entry = {"created": time.time(), "files": _file_signatures(files), "value": value, "message_class": message_class}
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self._entry_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._entry_path(key))
+            self._evict(key)
+
+    def _evict(self, keep: str) -> None:
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json") and name != keep + ".json":
+                try:
+                    entries.append((os.path.getmtime(os.path.join(self.cache_dir, name)), name))
+                except FileNotFoundError:
+                    continue
+        now = time.time()
+        entries.sort()
+        for n, (mtime, name) in enumerate(entries):
+            # an entry not used for longer than the TTL has expired as well
+            if len(entries) - n < self.max_entries and now - mtime <= self.ttl_seconds:
+                break
+            self._remove(name[:-len(".json")])
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            if os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".json"):
+                        self._remove(name[:-len(".json")])
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "evictions": self.evictions}
+
+
+_cache: Optional[LlmResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> LlmResponseCache:
+    """Return the process-wide LLM response cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LlmResponseCache()
+        return _cache
+
+
+def _class_path(obj: Any) -> str:
+    return f"{type(obj).__module__}.{type(obj).__qualname__}"
+
+
+def _load_class(path: str) -> type:
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)
+
+
+class CachedStructuredOutput:
+    """model.with_structured_output(schema) whose answers are served from the cache."""
+
+    def __init__(self, cached_model: "CachedChatModel", schema: Any, **kwargs):
+        self.cached_model = cached_model
+        self.schema = schema
+        self.kwargs = kwargs
+        self.runnable = cached_model.model.with_structured_output(schema, **kwargs)
+
+    def invoke(self, input: Any, files: Iterable[str] = (), **kwargs) -> Any:
+        """
+        Answer of the model for input, parsed into the schema.
+
+        Args:
+            input (Any): The prompt, as for the model's invoke.
+            files (Iterable[str]): Files (or folders) the prompt refers to, the answer is reused only while they are unchanged.
+        """
+        cache = self.cached_model.cache
+        # include_raw answers carry the raw message, they are not cached
+        if not llm_cache_enabled or self.kwargs.get("include_raw"):
+            return self.runnable.invoke(input, **kwargs)
+        key = cache.key(model_key(self.cached_model.model), normalize_messages(input),
+                        schema_key(self.schema) + json.dumps(self.kwargs, sort_keys=True, default=str))
+        entry = cache.get(key)
+        if entry is not None:
+            return self.schema.model_validate(entry["value"]) if hasattr(self.schema, "model_validate") else entry["value"]
+        result = self.runnable.invoke(input, **kwargs)
+        if result is not None:
+            cache.put(key, result.model_dump(mode="json") if hasattr(result, "model_dump") else result, files)
+        return result
+
+
+class CachedChatModel:
+    """
+    Chat model whose invoke and with_structured_output(...).invoke answers are served from the cache.
+
+    Args:
+        model: The chat model, e.g. llm_manager.llm.
+        cache (Optional[LlmResponseCache]): Defaults to the process-wide cache.
+    """
+
+    def __init__(self, model: Any, cache: Optional[LlmResponseCache] = None):
+        self.model = model
+        self._cache = cache
+
+    @property
+    def cache(self) -> LlmResponseCache:
+        return self._cache or get_llm_response_cache()
+
+    def invoke(self, input: Any, files: Iterable[str] = (), **kwargs) -> Any:
+        """The model's answer message for input, files as for CachedStructuredOutput.invoke."""
+        if not llm_cache_enabled:
+            return self.model.invoke(input, **kwargs)
+        key = self.cache.key(model_key(self.model), normalize_messages(input))
+        entry = self.cache.get(key)
+        if entry is not None:
+            return _load_class(entry["message_class"])(content=entry["value"])
+        response = self.model.invoke(input, **kwargs)
+        self.cache.put(key, response.content, files, _class_path(response))
+        return response
+
+    def with_structured_output(self, schema: Any, **kwargs) -> CachedStructuredOutput:
+        return CachedStructuredOutput(self, schema, **kwargs)
+
+
+class FakeMessage:
+    def __init__(self, content: Any):
+        self.content = content
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for a chat model: answers come from respond(prompt text, schema) and calls are counted.
+    Structured answers are validated into pydantic schemas, dict schemas get the answer as it is.
+    """
+
+    model = "fake-chat-model"
+    temperature = 0
+
+    def __init__(self, respond: Callable[[str, Any], Any]):
+        self.respond = respond
+        self.calls = 0
+
+    def _answer(self, input: Any, schema: Any) -> Any:
+        self.calls += 1
+        return self.respond("\n".join(str(content) for _, content in normalize_messages(input)), schema)
+
+    def invoke(self, input: Any, **kwargs) -> FakeMessage:
+        return FakeMessage(self._answer(input, None))
+
+    def with_structured_output(self, schema: Any, **kwargs) -> Any:
+        fake = self
+
+        class Structured:
+            def invoke(self, input: Any, **kwargs) -> Any:
+                answer = fake._answer(input, schema)
+                return schema.model_validate(answer) if hasattr(schema, "model_validate") else answer
+        return Structured()
+
+
+def check_llm_response_cache(work_dir: str = ".") -> str:
+    """Exercise hits, misses, schema and file invalidation, TTL and eviction with FakeChatModel, no LLM needed."""
+    import shutil
+    cache_dir = os.path.join(work_dir, ".llm_cache_check")
+    watched = os.path.join(work_dir, "llm_cache_check_file.txt")
+    fake = FakeChatModel(lambda text, schema: {"answer": text.upper()} if schema else f"echo {text}")
+    schema = {"title": "Answer", "type": "object", "properties": {"answer": {"type": "string"}}}
+    try:
+        cache = LlmResponseCache(cache_dir, ttl_seconds=3600, max_entries=3)
+        cached = CachedChatModel(fake, cache)
+        structured = cached.with_structured_output(schema)
+        assert structured.invoke([("system", "pick"), ("human", "npv  of swap")]) == {"answer": "PICK\nNPV OF SWAP"}
+        assert structured.invoke([("system", "pick"), ("human", "npv of swap ")]) == {"answer": "PICK\nNPV OF SWAP"}
+        assert fake.calls == 1, "whitespace variant of the prompt missed the cache"
+        other_schema = dict(schema, properties={"answer": {"type": "string", "enum": ["a", "b"]}})
+        cached.with_structured_output(other_schema).invoke([("system", "pick"), ("human", "npv of swap")])
+        assert fake.calls == 2, "another output schema hit the cache"
+        assert cached.invoke("hello").content == "echo hello" and cached.invoke("hello").content == "echo hello"
+        assert fake.calls == 3 and isinstance(cached.invoke("hello"), FakeMessage)
+        with open(watched, "w") as f:
+            f.write("v1")
+        structured.invoke("about the file", files=[watched])
+        structured.invoke("about the file", files=[watched])
+        assert fake.calls == 4
+        with open(watched, "w") as f:
+            f.write("version 2")
+        structured.invoke("about the file", files=[watched])
+        assert fake.calls == 5, "a changed file did not invalidate the entry"
+        assert len([n for n in os.listdir(cache_dir) if n.endswith(".json")]) <= 3, "cache grew beyond max_entries"
+        cache.ttl_seconds = 0
+        time.sleep(0.01)
+        structured.invoke("about the file", files=[watched])
+        assert fake.calls == 6, "an expired entry was served"
+        persistent = CachedChatModel(fake, LlmResponseCache(cache_dir, ttl_seconds=3600, max_entries=3))
+        persistent.with_structured_output(schema).invoke("about the file", files=[watched])
+        assert fake.calls == 6, "entry was not persisted"
+        return f"LLM response cache check passed ({fake.calls} model calls, {cache.stats()})"
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        if os.path.exists(watched):
+            os.remove(watched)
+
+
+if __name__ == "__main__":
+    print(check_llm_response_cache())
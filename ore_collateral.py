@@ -0,0 +1,201 @@
+"""
+Collateral what-if sweeps over a simulated netting set cube.
+
+The NPV cube is simulated once; collateral only changes how it is post-processed. sweep_collateral takes
+the netting set NPV paths and any number of CSA variants (threshold, MTA, independent amount held,
+margin period of risk and collateral spreads, as in netting.xml) and computes the collateralised exposure
+and COLVA profiles of all variants together: the collateral balance recursion runs once over the dates,
+vectorised over variants and samples.
+
+Collateral model (ORE's Symmetric calculation type with margining on every simulation date):
+    - The credit support amount at t is based on the netting set value at t - MPOR, linearly interpolated
+      between simulation dates: V - threshold receive above it, V + threshold pay below minus it, else 0.
+    - A margin call moves the balance to the credit support amount if the call is at least the MTA.
+    - The independent amount held is added to the balance.
+    - Exposure is V(t) - C(t), EPE/ENE/PFE are taken over samples as in ore_exposure.
+    - COLVA increments are -E[C(t) * spread] over the Act/360 period to the next date, with the receive
+      spread for positive and the pay spread for negative balances.
+Collateral compounding at the overnight rate and the collateral floor are not modelled.
+"""
+import os
+import numpy as np
+import pandas as pd
+import xml.etree.ElementTree as ET
+from typing import Dict, Optional, Sequence
+from ore_exposure import year_fractions, pfe, get_exposure_engines
+
+
+def period_offset(period: str) -> pd.DateOffset:
+    """pandas offset of an ORE period string such as '2W', '10D', '1M' or '1Y'."""
+    period = (period or "0D").strip().upper()
+    n, unit = int(period[:-1] or 0), period[-1]
+    return {"D": pd.DateOffset(days=n), "W": pd.DateOffset(weeks=n), "M": pd.DateOffset(months=n), "Y": pd.DateOffset(years=n)}[unit]
+
+
+class CsaParameters:
+    """
+    Collateral parameters of one netting set, named as in the CSADetails of netting.xml.
+
+    Attributes:
+        active (bool): ActiveCSAFlag, an inactive CSA leaves the netting set uncollateralised.
+        threshold_pay, threshold_receive (float): ThresholdPay/ThresholdReceive.
+        mta_pay, mta_receive (float): MinimumTransferAmountPay/MinimumTransferAmountReceive.
+        independent_amount_held (float): IndependentAmountHeld.
+        mpor (str): MarginPeriodOfRisk, e.g. '2W'.
+        spread_pay, spread_receive (float): CollateralCompoundingSpreadPay/CollateralCompoundingSpreadReceive.
+    """
+
+    def __init__(self, active: bool = True, threshold_pay: float = 0.0, threshold_receive: float = 0.0, mta_pay: float = 0.0,
+                 mta_receive: float = 0.0, independent_amount_held: float = 0.0, mpor: str = "0D", spread_pay: float = 0.0,
+                 spread_receive: float = 0.0):
+        self.active = active
+        self.threshold_pay = threshold_pay
+        self.threshold_receive = threshold_receive
+        self.mta_pay = mta_pay
+        self.mta_receive = mta_receive
+        self.independent_amount_held = independent_amount_held
+        self.mpor = mpor
+        self.spread_pay = spread_pay
+        self.spread_receive = spread_receive
+
+    def replace(self, **changes) -> "CsaParameters":
+        """Copy with some parameters changed, e.g. base.replace(threshold_pay=0, threshold_receive=0)."""
+        return CsaParameters(**dict(vars(self), **changes))
+
+    def __repr__(self) -> str:
+        return "CsaParameters(" + ", ".join(f"{k}={v!r}" for k, v in vars(self).items()) + ")"
+
+    @classmethod
+    def from_netting_xml(cls, path: str, netting_set_id: str) -> "CsaParameters":
+        """Parameters of one netting set of a netting.xml file."""
+        root = ET.parse(path).getroot()
+        for netting_set in root.findall("NettingSet"):
+            if (netting_set.findtext("NettingSetId") or "").strip() != netting_set_id:
+                continue
+            csa = netting_set.find("CSADetails")
+
+            def number(tag: str) -> float:
+                text = csa.findtext(tag) if csa is not None else None
+                return float(text) if text and text.strip() else 0.0
+
+            return cls(active=(netting_set.findtext("ActiveCSAFlag") or "false").strip().lower() in ["true", "y", "1"],
+                       threshold_pay=number("ThresholdPay"), threshold_receive=number("ThresholdReceive"),
+                       mta_pay=number("MinimumTransferAmountPay"), mta_receive=number("MinimumTransferAmountReceive"),
+                       independent_amount_held=number("IndependentAmount/IndependentAmountHeld"),
+                       mpor=(csa.findtext("MarginPeriodOfRisk") or "0D").strip() if csa is not None else "0D",
+                       spread_pay=number("CollateralCompoundingSpreadPay"), spread_receive=number("CollateralCompoundingSpreadReceive"))
+        raise KeyError(f"Netting set '{netting_set_id}' is not defined in {path}")
+
+
+class CollateralSweepResult:
+    """
+    Attributes:
+        exposure (Dict[str, pd.DataFrame]): Per variant: Date, Time, EPE, ENE, PFE, ExpectedCollateral, BaselEE,
+            BaselEEE, the columns of exposure_nettingset_*.csv.
+        colva (Dict[str, pd.DataFrame]): Per variant: Date, Time, CollateralBalance, COLVA Increment, COLVA.
+        summary (pd.DataFrame): One row per variant with its parameters, peak EPE and PFE, Basel EEPE and COLVA.
+    """
+
+    def __init__(self, exposure: Dict[str, pd.DataFrame], colva: Dict[str, pd.DataFrame], summary: pd.DataFrame):
+        self.exposure = exposure
+        self.colva = colva
+        self.summary = summary
+
+
+def _lagged_values(values: np.ndarray, dates: np.ndarray, mpor: str) -> np.ndarray:
+    """Netting set values at every date minus mpor, linear in time between dates and V(0) before the valuation date."""
+    days = (dates - dates[0]).astype(float)
+    lagged_days = (pd.DatetimeIndex(dates) - period_offset(mpor)).to_numpy().astype("datetime64[D]")
+    lagged_days = np.clip((lagged_days - dates[0]).astype(float), 0.0, None)
+    upper = np.clip(np.searchsorted(days, lagged_days, side="left"), 1, len(days) - 1)
+    lower = upper - 1
+    weight = np.clip((lagged_days - days[lower]) / (days[upper] - days[lower]), 0.0, 1.0)[:, None]
+    return values[lower] * (1.0 - weight) + values[upper] * weight
+
+
+def sweep_collateral(values: np.ndarray, dates: np.ndarray, variants: Dict[str, CsaParameters], quantile: float = 0.95,
+                     discount_factors: Optional[np.ndarray] = None, horizon_years: float = 1.0) -> CollateralSweepResult:
+    """
+    Collateralised exposure and COLVA profiles of a netting set for many CSA variants at once.
+
+    Args:
+        values (np.ndarray): Netting set NPV paths (discounted, as in the cube), shape (dates, samples), values[0] is T0.
+        dates (np.ndarray): datetime64[D] dates of the rows of values.
+        variants (Dict[str, CsaParameters]): CSA variants by name.
+        quantile (float): PFE quantile.
+        discount_factors (Optional[np.ndarray]): Base currency discount factors at the dates, for Basel EE.
+        horizon_years (float): Horizon of the Basel EEPE in the summary.
+    """
+    names = list(variants)
+    params = [variants[n] for n in names]
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    times = year_fractions(dates[0], dates)
+
+    def column(attribute: str) -> np.ndarray:
+        return np.array([getattr(p, attribute) if p.active else 0.0 for p in params], dtype=float)[:, None]
+
+    active = np.array([p.active for p in params])[:, None]
+    threshold_pay, threshold_receive = column("threshold_pay"), column("threshold_receive")
+    mta_pay, mta_receive = column("mta_pay"), column("mta_receive")
+    iah = column("independent_amount_held")
+    lagged = {mpor: _lagged_values(values, dates, mpor) for mpor in set(p.mpor for p in params)}
+    # variant index -> position in a stack of the distinct lagged value arrays
+    mpors = list(lagged)
+    lag_stack = np.stack([lagged[m] for m in mpors])
+    lag_index = np.array([mpors.index(p.mpor) for p in params])
+
+    n_variants, (n_dates, n_samples) = len(params), values.shape
+    balance = np.zeros((n_variants, n_dates, n_samples))
+    current = np.zeros((n_variants, n_samples))
+    for j in range(1, n_dates):
+        v = lag_stack[lag_index, j]
+        target = np.where(v > threshold_receive, v - threshold_receive, np.where(v < -threshold_pay, v + threshold_pay, 0.0))
+        call = target - current
+        apply = ((call > 0) & (call >= mta_receive)) | ((call < 0) & (-call >= mta_pay))
+        current = np.where(active & apply, target, current)
+        balance[:, j] = current
+    balance[:, 1:] += iah[:, :, None]
+
+    exposure = values[None, :, :] - balance
+    epe = np.maximum(exposure, 0.0).mean(axis=-1)
+    ene = np.maximum(-exposure, 0.0).mean(axis=-1)
+    pfe_values = pfe(exposure, [quantile])[..., 0]
+    expected_collateral = balance.mean(axis=-1)
+    basel_ee = epe if discount_factors is None else epe / discount_factors
+    basel_eee = np.maximum.accumulate(basel_ee, axis=-1)
+
+    dcf = np.r_[(dates[1:] - dates[:-1]).astype(float) / 360.0, 0.0]
+    spread = np.where(balance > 0, np.array([p.spread_receive for p in params])[:, None, None],
+                      np.array([p.spread_pay for p in params])[:, None, None])
+    colva_increment = 0.0 - (balance * spread).mean(axis=-1) * dcf
+    colva = np.cumsum(colva_increment, axis=-1)
+
+    maturity_time = min(horizon_years, float(times[-1]))
+    weights = np.clip(np.minimum(times[1:], maturity_time) - np.minimum(times[:-1], maturity_time), 0.0, None)
+    eepe = (basel_eee[:, 1:] * weights).sum(-1) / maturity_time
+
+    date_strings = dates.astype(str)
+    exposure_profiles, colva_profiles, rows = {}, {}, []
+    for i, name in enumerate(names):
+        exposure_profiles[name] = pd.DataFrame({"Date": date_strings, "Time": times, "EPE": epe[i], "ENE": ene[i], "PFE": pfe_values[i],
+                                                "ExpectedCollateral": expected_collateral[i], "BaselEE": basel_ee[i], "BaselEEE": basel_eee[i]})
+        colva_profiles[name] = pd.DataFrame({"Date": date_strings, "Time": times, "CollateralBalance": expected_collateral[i],
+                                             "COLVA Increment": colva_increment[i], "COLVA": colva[i]})
+        rows.append(dict({"Variant": name}, **vars(params[i]), PeakEPE=epe[i].max(), PeakPFE=pfe_values[i].max(),
+                         BaselEEPE=eepe[i], COLVA=colva[i, -1]))
+    return CollateralSweepResult(exposure_profiles, colva_profiles, pd.DataFrame(rows))
+
+
+def run_collateral_sweep(output_dir: str, netting_set: str, variants: Dict[str, CsaParameters], input_path: Optional[str] = None,
+                         quantile: float = 0.95) -> CollateralSweepResult:
+    """Collateral sweep over the netting set cube of a finished ORE run (see get_exposure_engines)."""
+    _, engine = get_exposure_engines(output_dir, input_path)
+    if engine is None:
+        raise FileNotFoundError(f"No rawcube.csv/netcube.csv in {output_dir}, run ORE with the simulation and xva analytics first.")
+    values = engine.cube.values[engine.cube.index(netting_set), :, :, 0]
+    return sweep_collateral(values, engine.cube.dates, variants, quantile, engine.discount_factors)
+
+
+def variants_from_netting_files(paths: Sequence[str], netting_set: str) -> Dict[str, CsaParameters]:
+    """CSA variants from several netting.xml files (e.g. Example_10's netting_*.xml), named after the files."""
+    return {os.path.splitext(os.path.basename(p))[0]: CsaParameters.from_netting_xml(p, netting_set) for p in paths}
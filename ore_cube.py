@@ -0,0 +1,178 @@
+"""
+Dense NPV cube.
+
+ORE writes simulated NPVs as one row per (id, date, sample, depth): cube.csv.gz (trade NPV cube,
+0-based samples), rawcube.csv / netcube.csv and the in-memory rawcube/netcube reports (1-based
+samples). NpvCube loads any of them into one float64 array of shape (ids, dates, samples, depth), where
+date 0 is the valuation date with its single T0 value repeated over all samples. Paths, per-date
+scenario vectors and quantiles are then plain array slices.
+"""
+import gzip
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+class NpvCube:
+    """
+    Attributes:
+        ids (List[str]): Trade or netting set ids along axis 0.
+        dates (Optional[np.ndarray]): datetime64[D] dates along axis 1, dates[0] is the valuation date.
+        values (np.ndarray): NPVs of shape (ids, dates, samples, depth).
+        netting_sets (Dict[str, str]): Netting set of every id, when the source has one.
+    """
+
+    def __init__(self, ids: List[str], values: np.ndarray, dates: Optional[np.ndarray] = None,
+                 netting_sets: Optional[Dict[str, str]] = None):
+        self.ids = list(ids)
+        self.values = values
+        self.dates = dates
+        self.netting_sets = netting_sets or {}
+        self._id_index = {id_: n for n, id_ in enumerate(self.ids)}
+
+    @property
+    def num_dates(self) -> int:
+        return self.values.shape[1]
+
+    @property
+    def num_samples(self) -> int:
+        return self.values.shape[2]
+
+    @property
+    def depth(self) -> int:
+        return self.values.shape[3]
+
+    def index(self, id_: str) -> int:
+        if id_ not in self._id_index:
+            raise KeyError(f"'{id_}' is not in the cube, ids are {', '.join(self.ids)}")
+        return self._id_index[id_]
+
+    def paths(self, id_: str, samples: Union[slice, Sequence[int]] = slice(None), depth: int = 0) -> np.ndarray:
+        """NPV paths of one id, shape (dates, selected samples)."""
+        return self.values[self.index(id_), :, samples, depth]
+
+    def scenarios(self, id_: str, date_index: int, depth: int = 0) -> np.ndarray:
+        """NPV of every sample of one id at one date, shape (samples,)."""
+        return self.values[self.index(id_), date_index, :, depth]
+
+    def quantiles(self, id_: str, q: Union[float, Sequence[float]], depth: int = 0) -> np.ndarray:
+        """Quantiles over samples of one id at every date, shape (dates,) or (len(q), dates)."""
+        return np.quantile(self.values[self.index(id_), :, :, depth], q, axis=1)
+
+    def aggregate(self, netting_set: str, depth: int = 0) -> np.ndarray:
+        """Sum of the paths of all ids in a netting set, shape (dates, samples)."""
+        rows = [self.index(id_) for id_, ns in self.netting_sets.items() if ns == netting_set]
+        if not rows:
+            raise KeyError(f"No ids in netting set '{netting_set}'")
+        return self.values[rows, :, :, depth].sum(axis=0)
+
+    @classmethod
+    def from_columns(cls, ids: np.ndarray, date_index: np.ndarray, sample: np.ndarray, depth: np.ndarray, value: np.ndarray,
+                     one_based_samples: bool, dates: Optional[np.ndarray] = None, netting_set: Optional[np.ndarray] = None,
+                     id_labels: Optional[List[str]] = None, shape: Optional[Tuple[int, int, int]] = None) -> "NpvCube":
+        """
+        Build the dense cube from long-format columns.
+
+        Args:
+            ids, date_index, sample, depth, value: One entry per cube cell, date_index 0 is the valuation date.
+            one_based_samples (bool): True for rawcube/netcube, where samples after T0 start at 1.
+            dates (Optional[np.ndarray]): Date of every row (datetime64), used to label the date axis.
+            netting_set (Optional[np.ndarray]): Netting set of every row.
+            id_labels (Optional[List[str]]): If given, ids are positions in this list instead of names.
+            shape (Optional[Tuple[int, int, int]]): Number of dates (including T0), samples and depths, when the
+                source omits cells (cube.csv.gz does not write zero NPVs). Taken from the data otherwise.
+        """
+        if id_labels is None:
+            id_codes, id_labels = pd.factorize(ids)
+        else:
+            id_codes = np.asarray(ids, dtype=np.int64)
+        date_index = np.asarray(date_index, dtype=np.int64)
+        sample = np.asarray(sample, dtype=np.int64)
+        depth = np.asarray(depth, dtype=np.int64)
+        value = np.asarray(value, dtype=np.float64)
+
+        t0 = date_index == 0
+        sample = np.where(t0, 0, sample - 1 if one_based_samples else sample)
+        if shape is None:
+            num_samples = int(sample[~t0].max()) + 1 if (~t0).any() else 1
+            shape = (int(date_index.max()) + 1, num_samples, int(depth.max()) + 1)
+        values = np.zeros((len(id_labels),) + tuple(shape))
+        values[id_codes[~t0], date_index[~t0], sample[~t0], depth[~t0]] = value[~t0]
+        # T0 has a single value, it is the starting point of every path.
+        values[id_codes[t0], 0, :, depth[t0]] = value[t0][:, None]
+
+        date_labels = None
+        if dates is not None:
+            date_labels = np.zeros(values.shape[1], dtype="datetime64[D]")
+            date_labels[date_index] = np.asarray(dates, dtype="datetime64[D]")
+        netting_sets = {}
+        if netting_set is not None:
+            first = np.unique(id_codes, return_index=True)[1]
+            netting_sets = {str(id_labels[c]): str(netting_set[i]) for c, i in zip(id_codes[first], first)
+                            if isinstance(netting_set[i], str) and netting_set[i]}
+        return cls([str(i) for i in id_labels], values, date_labels, netting_sets)
+
+    @classmethod
+    def from_report(cls, report) -> "NpvCube":
+        """Load an in-memory netcube or rawcube report (app.getReport("netcube"))."""
+        from ore_report_store import report_to_columns
+        return cls.from_report_columns(report_to_columns(report))
+
+    @classmethod
+    def from_report_columns(cls, columns: Dict[str, np.ndarray]) -> "NpvCube":
+        """Load netcube/rawcube columns: Id, NettingSet, DateIndex, Date, Sample, Depth, Value."""
+        columns = {k.lstrip("#"): v for k, v in columns.items()}
+        return cls.from_columns(columns["Id"], columns["DateIndex"], columns["Sample"], columns["Depth"], columns["Value"],
+                                one_based_samples=True, dates=columns.get("Date"), netting_set=columns.get("NettingSet"))
+
+    @classmethod
+    def from_csv(cls, path: str) -> "NpvCube":
+        """Load rawcube.csv or netcube.csv."""
+        df = pd.read_csv(path, dtype={"#Id": str, "NettingSet": str}, keep_default_na=False, parse_dates=["Date"])
+        return cls.from_report_columns({k: df[k].to_numpy() for k in df.columns})
+
+    @classmethod
+    def from_cube_csv_gz(cls, path: str) -> "NpvCube":
+        """Load the cube.csv.gz written by the simulation analytic."""
+        meta = read_cube_header(path)
+        df = pd.read_csv(path, comment="#", header=None, names=["id", "date", "sample", "depth", "value"],
+                         dtype={"id": np.int64, "date": np.int64, "sample": np.int64, "depth": np.int64, "value": np.float64})
+        cube = cls.from_columns(df["id"].to_numpy(), df["date"].to_numpy(), df["sample"].to_numpy(), df["depth"].to_numpy(),
+                                df["value"].to_numpy(), one_based_samples=False, id_labels=meta["ids"],
+                                shape=(meta["numDates"] + 1, meta["samples"], meta["depth"]))
+        cube.dates = np.array([meta["asof"]] + meta["dates"], dtype="datetime64[D]")
+        return cube
+
+
+def read_cube_header(path: str) -> Dict:
+    """Parse the '#' header of cube.csv.gz: asof, numIds, numDates, samples, depth, dates and ids."""
+    meta: Dict = {"dates": [], "ids": []}
+    section = None
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt") as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            text = line[1:].strip()
+            if ":" in text:
+                key, value = [t.strip() for t in text.split(":", 1)]
+                section = key if key in ["dates", "ids"] and not value else None
+                if key in ["numIds", "numDates", "samples", "depth"]:
+                    meta[key] = int(value)
+                elif key not in ["dates", "ids"]:
+                    meta[key] = value
+            elif section is not None and text and not text.startswith("id,"):
+                meta[section].append(text)
+    return meta
+
+
+def load_cube(source) -> NpvCube:
+    """Load an NpvCube from an in-memory report, a binary cube (.bin), cube.csv.gz, or rawcube.csv/netcube.csv."""
+    if not isinstance(source, str):
+        return NpvCube.from_report(source)
+    if source.endswith(".bin"):
+        from ore_cube_binary import read_npv_cube
+        return read_npv_cube(source)
+    if source.endswith(".csv.gz"):
+        return NpvCube.from_cube_csv_gz(source)
+    return NpvCube.from_csv(source)
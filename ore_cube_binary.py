@@ -0,0 +1,232 @@
+"""
+Self-describing binary format for ORE cubes.
+
+A file holds an 8 byte magic, the length of a JSON header, the JSON header (kind, shape, ids, dates,
+netting sets or key names) padded to a 64 byte boundary, and then the cube as one raw little-endian
+float64 block in C order. The block can be memory-mapped with np.memmap, so loading a cube costs the
+header parse and readers only touch the slices they use.
+
+Written next to the text outputs after each run: cube.csv.gz -> cube.bin, rawcube.csv -> rawcube.bin,
+netcube.csv -> netcube.bin and scenariodata.csv.gz -> scenariodata.bin. The header records the size and
+modification time of the text file, a binary file is current while they match. scenariodata.bin is
+also the file load_scenario_data memory-maps.
+"""
+import os
+import json
+import time
+import struct
+import tempfile
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from ore_cube import NpvCube, load_cube
+from ore_scenario_data import ScenarioData
+
+magic = b"ORECUBE1"
+alignment = 64
+
+# Text output -> binary file name and kind.
+binary_cube_files = {
+    "cube.csv.gz": ("cube.bin", "npv_cube"),
+    "rawcube.csv": ("rawcube.bin", "npv_cube"),
+    "netcube.csv": ("netcube.bin", "netting_set_cube"),
+    "scenariodata.csv.gz": ("scenariodata.bin", "scenario_data"),
+}
+
+
+def source_signature(path: str) -> Dict[str, int]:
+    """Size and modification time of a text file, recorded in the header of its binary version."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def binary_path(source_path: str) -> str:
+    """Binary file of a text output, e.g. Output/scenariodata.csv.gz -> Output/scenariodata.bin."""
+    directory, name = os.path.split(source_path)
+    if name in binary_cube_files:
+        return os.path.join(directory, binary_cube_files[name][0])
+    return os.path.join(directory, name.split(".")[0] + ".bin")
+
+
+def write_binary_cube(path: str, values: np.ndarray, header: Dict) -> None:
+    """Write values with a JSON header, atomically."""
+    values = np.ascontiguousarray(values, dtype="<f8")
+    header = dict(header, shape=list(values.shape), dtype="<f8")
+    header_bytes = json.dumps(header).encode()
+    data_offset = len(magic) + 8 + len(header_bytes)
+    padding = (-data_offset) % alignment
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(magic)
+        f.write(struct.pack("<Q", len(header_bytes) + padding))
+        f.write(header_bytes + b" " * padding)
+        values.tofile(f)
+    os.replace(tmp_path, path)
+
+
+def read_binary_header(path: str) -> Tuple[Dict, int]:
+    """The JSON header of a binary cube and the length of its padded header."""
+    with open(path, "rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a binary ORE cube")
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        return json.loads(f.read(header_length).decode()), header_length
+
+
+def binary_file_current(source_path: str, path: Optional[str] = None) -> bool:
+    """Whether the binary file (by default binary_path(source_path)) was written from source_path as it is now."""
+    path = path or binary_path(source_path)
+    try:
+        return read_binary_header(path)[0].get("source") == source_signature(source_path)
+    except (OSError, ValueError):
+        return False
+
+
+def read_binary_cube(path: str, mmap: bool = True) -> Tuple[np.ndarray, Dict]:
+    """
+    Read a binary cube.
+
+    Returns:
+        Tuple[np.ndarray, Dict]: The values (a read-only memory map unless mmap is False) and the header.
+    """
+    header, header_length = read_binary_header(path)
+    offset = len(magic) + 8 + header_length
+    shape = tuple(header["shape"])
+    if mmap:
+        values = np.memmap(path, dtype=header["dtype"], mode="r", offset=offset, shape=shape)
+    else:
+        values = np.fromfile(path, dtype=header["dtype"], offset=offset).reshape(shape)
+    return values, header
+
+
+def _dates_to_json(dates: Optional[np.ndarray]) -> Optional[List[str]]:
+    return None if dates is None else [str(d) for d in np.asarray(dates, dtype="datetime64[D]")]
+
+
+def write_npv_cube(path: str, cube: NpvCube, kind: str = "npv_cube", source: Optional[str] = None) -> None:
+    write_binary_cube(path, cube.values, {"kind": kind, "ids": cube.ids, "dates": _dates_to_json(cube.dates),
+                                          "netting_sets": cube.netting_sets,
+                                          "source": source_signature(source) if source else None})
+
+
+def read_npv_cube(path: str, mmap: bool = True) -> NpvCube:
+    values, header = read_binary_cube(path, mmap)
+    if header["kind"] not in ["npv_cube", "netting_set_cube"]:
+        raise ValueError(f"{path} holds {header['kind']}, not an NPV cube")
+    dates = None if header.get("dates") is None else np.array(header["dates"], dtype="datetime64[D]")
+    return NpvCube(header["ids"], values, dates, header.get("netting_sets"))
+
+
+def write_scenario_data(path: str, data: ScenarioData, source: Optional[str] = None) -> None:
+    write_binary_cube(path, data.values, {"kind": "scenario_data", "key_names": data.key_names,
+                                          "source": source_signature(source) if source else None})
+
+
+def read_scenario_data(path: str, mmap: bool = True) -> ScenarioData:
+    values, header = read_binary_cube(path, mmap)
+    if header["kind"] != "scenario_data":
+        raise ValueError(f"{path} holds {header['kind']}, not scenario data")
+    return ScenarioData(values, header.get("key_names"))
+
+
+def export_binary_cubes(output_dir: str, since: float = 0.0) -> List[str]:
+    """
+    Write the binary version of every cube file found in output_dir, returns the names written.
+
+    Args:
+        since (float): Only cube files modified at or after this timestamp (the run start) are exported, cube
+            and scenario files an xva analytic reads from an earlier run are left alone. Files whose binary
+            version is current are skipped as well.
+    """
+    written = []
+    for source, (target, kind) in binary_cube_files.items():
+        source_path = os.path.join(output_dir, source)
+        if not os.path.isfile(source_path) or os.path.getmtime(source_path) < since or binary_file_current(source_path):
+            continue
+        if kind == "scenario_data":
+            write_scenario_data(os.path.join(output_dir, target), ScenarioData.from_csv_gz(source_path), source_path)
+        else:
+            write_npv_cube(os.path.join(output_dir, target), load_cube(source_path), kind, source_path)
+        written.append(target)
+    return written
+
+
+def check_binary_roundtrip(output_dir: str) -> str:
+    """
+    Compare every binary cube in output_dir with the text file it was exported from.
+
+    Returns:
+        str: One line per cube with the largest absolute difference and whether ids/dates/shape agree.
+    """
+    lines = []
+    for source, (target, kind) in binary_cube_files.items():
+        source_path, target_path = os.path.join(output_dir, source), os.path.join(output_dir, target)
+        if not (os.path.isfile(source_path) and os.path.isfile(target_path)):
+            continue
+        if kind == "scenario_data":
+            expected, actual = ScenarioData.from_csv_gz(source_path), read_scenario_data(target_path)
+            same_labels = expected.key_names == actual.key_names
+        else:
+            expected, actual = load_cube(source_path), read_npv_cube(target_path)
+            same_labels = expected.ids == actual.ids and np.array_equal(expected.dates, actual.dates)
+        same_shape = expected.values.shape == actual.values.shape
+        diff = float(np.abs(expected.values - actual.values).max()) if same_shape else float("nan")
+        ok = same_labels and same_shape and diff == 0.0
+        lines.append(f"{source} -> {target}: {'ok' if ok else 'MISMATCH'} (shape {actual.values.shape}, max abs diff {diff})")
+    return "\n".join(lines)
+
+
+def benchmark_binary_cube(num_ids: int = 50, num_dates: int = 120, num_samples: int = 1000, depth: int = 1, seed: int = 42) -> str:
+    """
+    Load time of a synthetic cube from cube.csv.gz versus the binary format (memory-mapped and fully read).
+
+    Returns:
+        str: Sizes and load times of both formats.
+    """
+    import gzip
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0.0, 1e5, size=(num_ids, num_dates + 1, num_samples, depth)).round(4)
+    values[:, 0] = values[:, 0, :1]
+    ids = [f"Trade_{n}" for n in range(num_ids)]
+    dates = np.datetime64("2016-02-05") + np.arange(num_dates + 1) * 91
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "cube.csv.gz")
+        with gzip.open(csv_path, "wt") as f:
+            f.write(f"# asof       : {dates[0]}\n# numIds     : {num_ids}\n# numDates   : {num_dates}\n")
+            f.write(f"# samples    : {num_samples}\n# depth      : {depth}\n# dates      : \n")
+            f.writelines(f"# {d}\n" for d in dates[1:])
+            f.write("# ids        : \n")
+            f.writelines(f"# {i}\n" for i in ids)
+            f.write("#id,date,sample,depth,value\n")
+            date_index, sample = [a.ravel() for a in np.indices((num_dates, num_samples))]
+            for i in range(num_ids):
+                for k in range(depth):
+                    f.write(f"{i},0,0,{k},{float(values[i, 0, 0, k])!r}\n")
+                    f.writelines(f"{i},{d + 1},{s},{k},{v!r}\n" for d, s, v in
+                                 zip(date_index.tolist(), sample.tolist(), values[i, 1:, :, k].ravel().tolist()))
+
+        start = time.perf_counter()
+        cube = load_cube(csv_path)
+        csv_seconds = time.perf_counter() - start
+        bin_path = os.path.join(tmp_dir, "cube.bin")
+        write_npv_cube(bin_path, cube)
+        start = time.perf_counter()
+        mapped = read_npv_cube(bin_path)
+        mmap_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        loaded = read_npv_cube(bin_path, mmap=False)
+        read_seconds = time.perf_counter() - start
+        ok = np.array_equal(loaded.values, cube.values) and np.array_equal(np.asarray(mapped.values), values)
+        del mapped
+        return "\n".join([
+            f"cube {values.shape}: round trip {'ok' if ok else 'MISMATCH'}",
+            f"cube.csv.gz {os.path.getsize(csv_path) / 1e6:.1f} MB: {csv_seconds:.3f} sec",
+            f"cube.bin    {os.path.getsize(bin_path) / 1e6:.1f} MB: {mmap_seconds:.4f} sec memory-mapped, {read_seconds:.3f} sec fully read",
+        ])
+
+
+if __name__ == "__main__":
+    from config_file import f_path_out
+    export_binary_cubes(f_path_out)
+    print(check_binary_roundtrip(f_path_out))
+    print(benchmark_binary_cube())
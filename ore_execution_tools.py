@@ -1,12 +1,13 @@
 from ORE import *
 import os
+import json
 from langchain.tools import tool
 from typing import List
 import xml.etree.ElementTree as ET
 from typing import Tuple
 import utilities_ore as utilities
-from config_file import f_path_in
-import sys
+from config_file import f_path_in, ore_shard_count
+from ore_job_runner import get_ore_job_runner
 
 
 @tool
@@ -18,22 +19,104 @@ def run_ore() -> str:
         str: A confirmation message indicating success or failure.
     """
     try:
-        cwd = os.getcwd()
-        os.chdir(os.path.dirname(f_path_in))
-        sys.path.append('..')
-        params = Parameters()
-        base_folder = os.path.basename(f_path_in)
-        params.fromFile(os.path.join(base_folder, 'ore.xml'))
-        ore = OREApp(params, True)
-        ore.run()
-        os.chdir(cwd)
-        reports_str = '\n'.join([str(n)+'. '+i for n,i in enumerate(list(ore.getReportNames()))])
-        return f"ORE run completed successfully. It generated following reports:{reports_str}"
+        runner = get_ore_job_runner()
+        job_id = runner.submit(f_path_in)
+        return runner.wait(job_id)
     except Exception as e:
         return f"Error executing ORE model: {str(e)}"
 
 
-list_ore_execution_tools = [run_ore]
+@tool
+def run_ore_sharded(n_shards: int = ore_shard_count) -> str:
+    """
+    Run the ORE model with the portfolio split across several ORE processes running in parallel.
+    Only for trade-level analytics (npv, cashflow, sensitivity, stress, curves). Runs with simulation
+    or xva active are refused, use run_ore for those.
+
+    Args:
+        n_shards (int): Number of parallel shards the portfolio is split into.
+
+    Returns:
+        str: A confirmation message indicating success or failure.
+    """
+    try:
+        runner = get_ore_job_runner()
+        job_id = runner.submit(f_path_in, shards=n_shards)
+        return runner.wait(job_id)
+    except Exception as e:
+        return f"Error executing ORE model: {str(e)}"
+
+
+@tool
+def submit_ore_run() -> str:
+    """
+    Start an ORE run in the background and return immediately with its job id.
+    Use get_ore_run_progress to follow the run and await_ore_run to get its result.
+
+    Returns:
+        str: The job id of the submitted run, or an error message.
+    """
+    try:
+        job_id = get_ore_job_runner().submit(f_path_in)
+        return f"ORE run submitted with job id {job_id}."
+    except Exception as e:
+        return f"Error submitting ORE run: {str(e)}"
+
+
+@tool
+def get_ore_run_progress(job_id: str) -> str:
+    """
+    Get the status and progress of a submitted ORE run.
+
+    Args:
+        job_id (str): Job id returned by submit_ore_run.
+
+    Returns:
+        str: JSON with status (queued, running, done, failed, cancelled), current step, progress, total and errors.
+    """
+    try:
+        return json.dumps(get_ore_job_runner().progress(job_id))
+    except Exception as e:
+        return f"Error getting ORE run progress: {str(e)}"
+
+
+@tool
+def await_ore_run(job_id: str) -> str:
+    """
+    Wait for a submitted ORE run to finish and return its result.
+
+    Args:
+        job_id (str): Job id returned by submit_ore_run.
+
+    Returns:
+        str: A confirmation message with the generated reports, or an error message.
+    """
+    try:
+        return get_ore_job_runner().wait(job_id)
+    except Exception as e:
+        return f"Error executing ORE model: {str(e)}"
+
+
+@tool
+def cancel_ore_run(job_id: str) -> str:
+    """
+    Cancel a queued or running ORE run.
+
+    Args:
+        job_id (str): Job id returned by submit_ore_run.
+
+    Returns:
+        str: A confirmation message indicating whether the run was cancelled.
+    """
+    try:
+        if get_ore_job_runner().cancel(job_id):
+            return f"ORE run {job_id} cancelled."
+        return f"ORE run {job_id} already finished, nothing to cancel."
+    except Exception as e:
+        return f"Error cancelling ORE run: {str(e)}"
+
+
+list_ore_execution_tools = [run_ore, run_ore_sharded, submit_ore_run, get_ore_run_progress, await_ore_run, cancel_ore_run]
 list_ore_execution_tools_description = [i.name+" : "+i.description +'\n\n' for n, i in enumerate(list_ore_execution_tools)]
 
 
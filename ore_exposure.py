@@ -0,0 +1,274 @@
+"""
+Exposure metrics from the NPV cube.
+
+Computes the exposure profiles of the xva analytic (EPE, ENE, PFE, Basel EE and EEE) and the Basel
+time-weighted EPE/EEPE straight from the simulated NPVs, for every trade and netting set at once and
+for any set of PFE quantiles. Changing the quantile therefore does not need a new ORE run. Definitions
+follow ORE's ExposureCalculator: EPE/ENE are sample means of the positive/negative part of the
+(discounted) NPV, PFE is the sorted-sample quantile floored at zero, Basel EE is EPE divided by the
+discount factor of the simulation market's base currency curve and Basel EEE its running maximum.
+Netting set profiles are uncollateralised.
+"""
+import os
+import threading
+import numpy as np
+import pandas as pd
+from glob import glob
+from typing import Dict, List, Optional, Sequence, Tuple
+from ore_cube import NpvCube, load_cube
+from ore_cube_binary import binary_file_current
+from ore_report_store import get_ore_report_store
+from ore_inputs import resolve_ore_input_files
+from xml_document_cache import parse_xml
+
+
+def year_fractions(asof: np.datetime64, dates: np.ndarray) -> np.ndarray:
+    """Actual/Actual (ISDA) year fractions from asof to every date, the Time column of the exposure reports."""
+    asof = np.datetime64(asof, "D")
+    dates = np.asarray(dates, dtype="datetime64[D]")
+    years = dates.astype("datetime64[Y]")
+    asof_year = asof.astype("datetime64[Y]")
+
+    def days_in_year(y):
+        return ((y + 1).astype("datetime64[D]") - y.astype("datetime64[D]")).astype(float)
+
+    same_year = (dates - asof).astype(float) / days_in_year(asof_year)
+    first = ((asof_year + 1).astype("datetime64[D]") - asof).astype(float) / days_in_year(asof_year)
+    whole = (years - asof_year).astype(float) - 1
+    last = (dates - years.astype("datetime64[D]")).astype(float) / days_in_year(years)
+    return np.where(years == asof_year, same_year, first + whole + last)
+
+
+def pfe(values: np.ndarray, quantiles: Sequence[float], presorted: bool = False) -> np.ndarray:
+    """
+    Potential future exposure over the last axis (samples), shape values.shape[:-1] + (len(quantiles),).
+
+    As in ORE the quantile is the sample at index floor(q * (n - 1) + 0.5) of the sorted NPVs, floored at zero.
+    """
+    sorted_values = values if presorted else np.sort(values, axis=-1)
+    n = sorted_values.shape[-1]
+    index = np.floor(np.asarray(quantiles, dtype=float) * (n - 1) + 0.5).astype(int)
+    return np.maximum(sorted_values[..., index], 0.0)
+
+
+def basel_epe(times: np.ndarray, ee: np.ndarray, eee: np.ndarray, maturity_time: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Basel EPE and EEPE: time-weighted averages of EE and EEE over (0, maturity_time].
+
+    Args:
+        times (np.ndarray): Year fractions of the dates, times[0] = 0 is the valuation date.
+        ee, eee (np.ndarray): Profiles of shape (..., dates).
+        maturity_time (float): Averaging horizon, one year or the netting set maturity if earlier.
+    """
+    weights = np.clip(np.minimum(times[1:], maturity_time) - np.minimum(times[:-1], maturity_time), 0.0, None)
+    if times[-1] < maturity_time:
+        # Profile ends before the horizon, the last value is held.
+        weights[-1] += maturity_time - times[-1]
+    return (ee[..., 1:] * weights).sum(-1) / maturity_time, (eee[..., 1:] * weights).sum(-1) / maturity_time
+
+
+def discount_factors_from_curves(curves_file: str, curve: str, asof: np.datetime64, dates: np.ndarray) -> np.ndarray:
+    """
+    Discount factors of one curve of curves.csv at the given dates.
+
+    Log-linear in the discount factor between grid dates, flat zero rate beyond the last one.
+    """
+    curves = pd.read_csv(curves_file, usecols=["Date", curve])
+    grid = (pd.to_datetime(curves["Date"]).to_numpy().astype("datetime64[D]") - np.datetime64(asof, "D")).astype(float)
+    log_df = np.log(curves[curve].to_numpy(dtype=float))
+    days = (np.asarray(dates, dtype="datetime64[D]") - np.datetime64(asof, "D")).astype(float)
+    inside = np.interp(days, np.r_[0.0, grid], np.r_[0.0, log_df])
+    beyond = log_df[-1] / grid[-1] * days
+    return np.exp(np.where(days > grid[-1], beyond, inside))
+
+
+def simulation_discount_curve(input_path: str, ore_file: str = "ore.xml") -> Tuple[Optional[str], Optional[str]]:
+    """
+    Column of curves.csv holding the base currency discount curve of the simulation market.
+
+    curves.csv is written for the default market configuration, the column is the one whose curve spec
+    in todaysmarket.xml equals the discount curve of the base currency in the simulation configuration.
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: Base currency and curves.csv column name, (None, None) if neither
+        the simulation nor the xva analytic sets a baseCurrency.
+    """
+    files = resolve_ore_input_files(input_path, ore_file)
+    ore_root = parse_xml(files["ore.xml"]).getroot()
+    markets = {p.get("name"): (p.text or "").strip() for p in ore_root.findall("Markets/Parameter")}
+    base_currency = None
+    for analytic in ["simulation", "xva"]:
+        param = ore_root.find(f"Analytics/Analytic[@type='{analytic}']/Parameter[@name='baseCurrency']")
+        if param is not None and (param.text or "").strip():
+            base_currency = param.text.strip()
+            break
+
+    tm_root = parse_xml(files["Setup/marketConfigFile"]).getroot()
+
+    def configuration_ids(configuration: str) -> Dict[str, str]:
+        node = tm_root.find(f"Configuration[@id='{configuration}']")
+        ids = {} if node is None else {child.tag: (child.text or "").strip() for child in node}
+        return {tag: ids.get(f"{tag}Id", "default") for tag in ["DiscountingCurves", "YieldCurves", "IndexForwardingCurves"]}
+
+    def curve_specs(tag: str, id_: str, child_tag: str, key: str) -> Dict[str, str]:
+        node = tm_root.find(f"{tag}[@id='{id_}']")
+        return {} if node is None else {c.get(key): (c.text or "").strip() for c in node.findall(child_tag)}
+
+    simulation_ids = configuration_ids(markets.get("simulation", "default"))
+    target = curve_specs("DiscountingCurves", simulation_ids["DiscountingCurves"], "DiscountingCurve", "currency").get(base_currency)
+    default_ids = configuration_ids("default")
+    columns = {}
+    columns.update(curve_specs("YieldCurves", default_ids["YieldCurves"], "YieldCurve", "name"))
+    columns.update(curve_specs("IndexForwardingCurves", default_ids["IndexForwardingCurves"], "Index", "name"))
+    columns.update(curve_specs("DiscountingCurves", default_ids["DiscountingCurves"], "DiscountingCurve", "currency"))
+    matches = [column for column, spec in columns.items() if spec == target]
+    if base_currency in matches:
+        return base_currency, base_currency
+    return base_currency, matches[0] if matches else base_currency
+
+
+class ExposureEngine:
+    """
+    Exposure profiles of every id of an NPV cube.
+
+    Attributes:
+        cube (NpvCube): Discounted NPVs, ids are trades (rawcube) or netting sets (netcube).
+        times (np.ndarray): Act/Act year fractions of the cube dates.
+        discount_factors (Optional[np.ndarray]): Base currency discount factors at the cube dates. Without
+            them Basel EE equals EPE.
+    """
+
+    def __init__(self, cube: NpvCube, discount_factors: Optional[np.ndarray] = None):
+        if cube.dates is None:
+            raise ValueError("The cube has no dates, load it from rawcube/netcube or cube.csv.gz.")
+        self.cube = cube
+        self.times = year_fractions(cube.dates[0], cube.dates)
+        self.discount_factors = discount_factors
+        values = cube.values[:, :, :, 0]
+        self.epe = np.maximum(values, 0.0).mean(axis=-1)
+        self.ene = np.maximum(-values, 0.0).mean(axis=-1)
+        self._sorted = np.sort(values, axis=-1)
+        self.basel_ee = self.epe if discount_factors is None else self.epe / discount_factors
+        self.basel_eee = np.maximum.accumulate(self.basel_ee, axis=-1)
+
+    def pfe(self, quantiles: Sequence[float]) -> np.ndarray:
+        """PFE of every id at every date, shape (ids, dates, quantiles)."""
+        return pfe(self._sorted, quantiles, presorted=True)
+
+    def basel_epe(self, horizon_years: float = 1.0) -> pd.DataFrame:
+        """Basel time-weighted EPE and EEPE of every id over min(horizon, last cube date)."""
+        maturity_time = min(horizon_years, float(self.times[-1]))
+        epe_b, eepe_b = basel_epe(self.times, self.basel_ee, self.basel_eee, maturity_time)
+        return pd.DataFrame({"Id": self.cube.ids, "BaselEPE": epe_b, "BaselEEPE": eepe_b})
+
+    def time_weighted_epe(self, horizon_years: Optional[float] = None) -> pd.Series:
+        """EPE averaged over time up to horizon_years (the whole profile by default), by id."""
+        horizon = float(self.times[-1]) if horizon_years is None else min(horizon_years, float(self.times[-1]))
+        weights = np.clip(np.minimum(self.times[1:], horizon) - np.minimum(self.times[:-1], horizon), 0.0, None)
+        return pd.Series((self.epe[:, 1:] * weights).sum(-1) / horizon, index=self.cube.ids, name="TimeWeightedEPE")
+
+    def profile(self, id_: str, quantiles: Sequence[float] = (0.95,)) -> pd.DataFrame:
+        """Exposure profile of one id: Date, Time, EPE, ENE, one PFE column per quantile, BaselEE, BaselEEE."""
+        n = self.cube.index(id_)
+        df = pd.DataFrame({"Date": self.cube.dates.astype(str), "Time": self.times, "EPE": self.epe[n], "ENE": self.ene[n]})
+        for q, column in zip(quantiles, pfe(self._sorted[n], quantiles, presorted=True).T):
+            df[pfe_column(q)] = column
+        df["BaselEE"] = self.basel_ee[n]
+        df["BaselEEE"] = self.basel_eee[n]
+        return df
+
+
+def pfe_column(quantile: float) -> str:
+    return f"PFE_{quantile:g}"
+
+
+def _output_cube(output_dir: str, name: str) -> Optional[NpvCube]:
+    csv_path = os.path.join(output_dir, f"{name}.csv")
+    columns = get_ore_report_store().get_columns(csv_path)
+    if columns is not None:
+        return NpvCube.from_report_columns(columns)
+    bin_path = os.path.join(output_dir, f"{name}.bin")
+    if os.path.isfile(csv_path) and binary_file_current(csv_path, bin_path):
+        return load_cube(bin_path)
+    if os.path.isfile(csv_path):
+        return load_cube(csv_path)
+    return None
+
+
+_engines: Dict[Tuple, Tuple[Optional[ExposureEngine], Optional[ExposureEngine]]] = {}
+_engines_lock = threading.Lock()
+
+
+def get_exposure_engines(output_dir: str, input_path: Optional[str] = None) -> Tuple[Optional[ExposureEngine], Optional[ExposureEngine]]:
+    """
+    Trade and netting set exposure engines over the rawcube/netcube of an output folder.
+
+    Engines are kept until the cube files change, so repeated questions on the same run are answered
+    from memory.
+
+    Args:
+        input_path (Optional[str]): Input folder of the run, used to find the simulation discount curve in
+            curves.csv. Without it, or if the run has no base currency or curves.csv no column for its
+            discount curve, Basel EE is not discounted (the engines' discount_factors are None).
+    """
+    names = ["rawcube.csv", "netcube.csv", "curves.csv"]
+    signature = tuple([os.path.abspath(output_dir), input_path] +
+                      [os.path.getmtime(os.path.join(output_dir, n)) if os.path.isfile(os.path.join(output_dir, n)) else None for n in names])
+    with _engines_lock:
+        if signature in _engines:
+            return _engines[signature]
+        trade_cube = _output_cube(output_dir, "rawcube")
+        netting_set_cube = _output_cube(output_dir, "netcube")
+        if netting_set_cube is None and trade_cube is not None and trade_cube.netting_sets:
+            netting_sets = sorted(set(trade_cube.netting_sets.values()))
+            values = np.stack([trade_cube.aggregate(ns) for ns in netting_sets])[:, :, :, None]
+            netting_set_cube = NpvCube(netting_sets, values, trade_cube.dates)
+
+        engines = []
+        for cube in [trade_cube, netting_set_cube]:
+            if cube is None:
+                engines.append(None)
+                continue
+            discount_factors = None
+            curves_file = os.path.join(output_dir, "curves.csv")
+            if input_path is not None and os.path.isfile(curves_file):
+                _, curve = simulation_discount_curve(input_path)
+                if curve is not None and curve in pd.read_csv(curves_file, nrows=0).columns:
+                    discount_factors = discount_factors_from_curves(curves_file, curve, cube.dates[0], cube.dates)
+            engines.append(ExposureEngine(cube, discount_factors))
+        _engines.clear()
+        _engines[signature] = (engines[0], engines[1])
+        return _engines[signature]
+
+
+def validate_against_reports(output_dir: str, input_path: Optional[str] = None, quantile: float = 0.95) -> str:
+    """
+    Compare the engine with the exposure_trade_*.csv and exposure_nettingset_*.csv reports of a run.
+
+    Args:
+        quantile (float): The PFE quantile of the run's xva analytic.
+
+    Returns:
+        str: One line per report with the largest difference of every column relative to the column's peak.
+    """
+    trade_engine, netting_set_engine = get_exposure_engines(output_dir, input_path)
+    lines = []
+    for pattern, engine in [("exposure_trade_*.csv", trade_engine), ("exposure_nettingset_*.csv", netting_set_engine)]:
+        for path in sorted(glob(os.path.join(output_dir, pattern))):
+            report = pd.read_csv(path)
+            id_ = str(report.iloc[0, 0])
+            if engine is None or id_ not in engine.cube.ids:
+                lines.append(f"{os.path.basename(path)}: no cube for {id_}")
+                continue
+            profile = engine.profile(id_, [quantile]).rename(columns={pfe_column(quantile): "PFE"})
+            diffs = []
+            for column in ["Time", "EPE", "ENE", "PFE", "BaselEE", "BaselEEE"]:
+                scale = max(float(report[column].abs().max()), 1.0)
+                diffs.append(f"{column} {np.abs(profile[column].to_numpy() - report[column].to_numpy()).max() / scale:.1e}")
+            lines.append(f"{os.path.basename(path)}: " + ", ".join(diffs))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from config_file import f_path_in, f_path_out
+    print(validate_against_reports(f_path_out, f_path_in))
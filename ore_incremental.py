@@ -0,0 +1,263 @@
+"""
+Incremental trade-level repricing.
+
+Every <Trade> in the portfolio is fingerprinted on its canonical XML. After a run, the per-trade rows of
+the trade-level reports (npv, flows, sensitivity, ...) are kept together with the fingerprints. When
+only part of the portfolio changed and nothing else did, only the new or changed trades are sent
+through ORE and their rows are merged with the kept rows of the unchanged trades.
+"""
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple
+from ore_inputs import get_active_analytics
+from ore_sandbox import OreSandbox
+from ore_worker_pool import OreWorkerPool, OreRunResult
+from config_file import f_path_ore_cache
+
+# Analytics whose reports are a plain concatenation of independent per-trade rows.
+incremental_analytics = ["npv", "cashflow", "sensitivity"]
+
+incremental_ore_file = "_ore_incremental.xml"
+incremental_portfolio_file = "_portfolio_incremental.xml"
+
+
+class IncrementalRunResult(OreRunResult):
+    def __init__(self, result: Optional[OreRunResult], report_names: List[str], repriced: List[str], reused: List[str], removed: List[str]):
+        super().__init__(report_names, result.run_time if result else 0.0, result.errors if result else [],
+                         result.warm if result else True, result.saved_seconds if result else 0.0)
+        self.repriced = repriced
+        self.reused = reused
+        self.removed = removed
+
+
+def _portfolio_roles(files: Dict[str, str]) -> List[str]:
+    return sorted(role for role in files if role.split("#")[0] == "Setup/portfolioFile")
+
+
+def trade_fingerprints(portfolio_paths: List[str]) -> Tuple[Dict[str, str], Dict[str, ET.Element]]:
+    """
+    Canonical-XML fingerprint and element of every trade in the given portfolio files.
+
+    Only the trades directly under <Portfolio> count, the id-less component trades of a CompositeTrade are
+    part of their composite's fingerprint.
+    """
+    fingerprints, elements = {}, {}
+    for path in portfolio_paths:
+        for trade in ET.parse(path).getroot().findall("Trade"):
+            trade_id = trade.get("id")
+            canonical = ET.canonicalize(ET.tostring(trade, encoding="unicode"), strip_text=True)
+            fingerprints[trade_id] = hashlib.sha256(canonical.encode()).hexdigest()
+            elements[trade_id] = trade
+    return fingerprints, elements
+
+
+def _context_key(files: Dict[str, str]) -> str:
+    """Hash of everything except the portfolio: any change here invalidates all kept rows."""
+    digest = hashlib.sha256()
+    portfolio_roles = _portfolio_roles(files)
+    for role, path in sorted(files.items()):
+        if role in portfolio_roles:
+            continue
+        digest.update(role.encode() + b"\0")
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def _state_dir(source_path: str) -> str:
+    name = hashlib.sha256(os.path.abspath(source_path).encode()).hexdigest()[:16]
+    return os.path.join(f_path_ore_cache, "incremental", name)
+
+
+_state_locks: Dict[str, threading.Lock] = {}
+_state_locks_lock = threading.Lock()
+
+
+def _state_lock(state_dir: str) -> threading.Lock:
+    with _state_locks_lock:
+        return _state_locks.setdefault(state_dir, threading.Lock())
+
+
+def _load_state(state_dir: str) -> Optional[Tuple[Dict, Dict[str, Tuple[str, Dict[str, List[str]]]]]]:
+    with _state_lock(state_dir):
+        if not os.path.isfile(os.path.join(state_dir, "state.json")):
+            return None
+        with open(os.path.join(state_dir, "state.json"), "r") as f:
+            state = json.load(f)
+        return state, {name: read_trade_report(os.path.join(state_dir, name)) for name in state["reports"]}
+
+
+def _save_state(state_dir: str, state: Dict, report_paths: List[str]) -> None:
+    """Replace the kept baseline in one step, so concurrent runs only ever see a complete one."""
+    tmp_dir = f"{state_dir}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_dir)
+    for path in report_paths:
+        shutil.copy2(path, os.path.join(tmp_dir, os.path.basename(path)))
+    with open(os.path.join(tmp_dir, "state.json"), "w") as f:
+        json.dump(state, f)
+    with _state_lock(state_dir):
+        shutil.rmtree(state_dir, ignore_errors=True)
+        os.replace(tmp_dir, state_dir)
+
+
+def read_trade_report(path: str) -> Optional[Tuple[str, Dict[str, List[str]]]]:
+    """Split a report whose first column is TradeId into its header and the raw rows of every trade."""
+    with open(path, "r", newline="") as f:
+        header = f.readline()
+        if not header.startswith("#TradeId"):
+            return None
+        rows: Dict[str, List[str]] = {}
+        for line in f:
+            rows.setdefault(line.split(",", 1)[0], []).append(line)
+    return header, rows
+
+
+def write_trade_report(path: str, header: str, rows: Dict[str, List[str]]) -> None:
+    # ORE keeps the portfolio in a map keyed by trade id, so reports come out ordered by trade id.
+    with open(path, "w", newline="") as f:
+        f.write(header)
+        for trade_id in sorted(rows):
+            f.writelines(rows[trade_id])
+
+
+def _is_eligible(input_path: str) -> bool:
+    analytics = get_active_analytics(os.path.join(input_path, "ore.xml"))
+    return len(analytics) > 0 and set(analytics) <= set(incremental_analytics)
+
+
+def record_run(sandbox: OreSandbox, report_names: List[str], since: float = 0.0) -> None:
+    """Keep fingerprints and per-trade report rows of a full run as the baseline for incremental runs."""
+    state_dir = _state_dir(sandbox.source_path)
+    if not _is_eligible(sandbox.input_path):
+        with _state_lock(state_dir):
+            shutil.rmtree(state_dir, ignore_errors=True)
+        return
+    fingerprints, _ = trade_fingerprints([sandbox.files[r] for r in _portfolio_roles(sandbox.files)])
+    report_paths = []
+    for name in sorted(os.listdir(sandbox.output_dir)):
+        path = os.path.join(sandbox.output_dir, name)
+        if name.endswith(".csv") and os.path.getmtime(path) >= since and read_trade_report(path) is not None:
+            report_paths.append(path)
+    _save_state(state_dir, {"context_key": _context_key(sandbox.files), "trades": fingerprints,
+                            "reports": [os.path.basename(p) for p in report_paths], "report_names": list(report_names)}, report_paths)
+
+
+def _write_delta_inputs(input_path: str, trades: List[ET.Element], delta_output: str) -> None:
+    portfolio = ET.Element("Portfolio")
+    portfolio.extend(trades)
+    ET.ElementTree(portfolio).write(os.path.join(input_path, incremental_portfolio_file), encoding="utf-8", xml_declaration=True)
+    tree = ET.parse(os.path.join(input_path, "ore.xml"))
+    setup = tree.getroot().find("Setup")
+    setup.find("Parameter[@name='portfolioFile']").text = incremental_portfolio_file
+    setup.find("Parameter[@name='outputPath']").text = delta_output
+    tree.write(os.path.join(input_path, incremental_ore_file), encoding="utf-8", xml_declaration=True)
+
+
+def run_incremental(sandbox: OreSandbox, pool: OreWorkerPool, token: Optional[str] = None) -> Optional[IncrementalRunResult]:
+    """
+    Reprice only new or changed trades and merge their rows with the kept rows of unchanged trades.
+
+    Args:
+        sandbox (OreSandbox): Snapshot of the run's inputs, the merged reports are written to its output folder.
+        pool (OreWorkerPool): Pool used to run ORE on the changed trades.
+        token (Optional[str]): Passed on to the pool so the run can be cancelled.
+
+    Returns:
+        Optional[IncrementalRunResult]: None if an incremental run is not possible and a full run is needed,
+        i.e. there is no baseline, something other than the portfolio changed, an analytic other than
+        npv/cashflow/sensitivity is active, or every trade changed.
+    """
+    state_dir = _state_dir(sandbox.source_path)
+    loaded = _load_state(state_dir) if _is_eligible(sandbox.input_path) else None
+    if loaded is None:
+        return None
+    state, kept_reports = loaded
+    if _context_key(sandbox.files) != state["context_key"]:
+        return None
+    fingerprints, elements = trade_fingerprints([sandbox.files[r] for r in _portfolio_roles(sandbox.files)])
+    changed = sorted(t for t, fp in fingerprints.items() if state["trades"].get(t) != fp)
+    removed = sorted(set(state["trades"]) - set(fingerprints))
+    reused = sorted(set(fingerprints) - set(changed))
+    if not reused:
+        return None
+
+    output_dir = sandbox.output_dir
+    result = None
+    delta_reports: Dict[str, Tuple[str, Dict[str, List[str]]]] = {}
+    if changed:
+        delta_dir = os.path.join(sandbox.root, os.path.basename(output_dir) + "_incremental")
+        os.makedirs(delta_dir)
+        try:
+            _write_delta_inputs(sandbox.input_path, [elements[t] for t in changed], delta_dir)
+            result = pool.run(sandbox.input_path, incremental_ore_file, token=token)
+            for name in os.listdir(delta_dir):
+                path = os.path.join(delta_dir, name)
+                report = read_trade_report(path) if name.endswith(".csv") else None
+                if report is not None:
+                    delta_reports[name] = report
+                else:
+                    # Portfolio independent output (log, market data, ...) from the latest run.
+                    shutil.copy2(path, os.path.join(output_dir, name))
+        finally:
+            for name in [incremental_ore_file, incremental_portfolio_file]:
+                if os.path.exists(os.path.join(sandbox.input_path, name)):
+                    os.remove(os.path.join(sandbox.input_path, name))
+            shutil.rmtree(delta_dir, ignore_errors=True)
+
+    report_paths = []
+    for name, (header, rows) in kept_reports.items():
+        rows = {t: lines for t, lines in rows.items() if t in reused}
+        rows.update(delta_reports.get(name, (None, {}))[1])
+        write_trade_report(os.path.join(output_dir, name), header, rows)
+        report_paths.append(os.path.join(output_dir, name))
+    # A report the baseline did not have (e.g. written for a newly added trade type) has no rows of the
+    # reused trades, the delta run's rows are all of it.
+    for name, (header, rows) in delta_reports.items():
+        if name not in kept_reports:
+            write_trade_report(os.path.join(output_dir, name), header, rows)
+            report_paths.append(os.path.join(output_dir, name))
+
+    state["trades"] = fingerprints
+    state["reports"] = [os.path.basename(p) for p in report_paths]
+    state["report_names"] = list(dict.fromkeys(state["report_names"] + (result.report_names if result else [])))
+    _save_state(state_dir, state, report_paths)
+    report_names = state["report_names"]
+    return IncrementalRunResult(result, report_names, changed, reused, removed)
+
+
+def check_trade_fingerprints(portfolio_paths: Optional[List[str]] = None) -> str:
+    """
+    Check that every portfolio gets one fingerprint per top-level trade and no id-less entry, and that a
+    changed component of a CompositeTrade shows up as a change of its composite.
+    """
+    portfolio_paths = portfolio_paths or [os.path.join("Examples", name, "Input", "portfolio.xml") for name in ["Example_1", "Example_47"]]
+    lines, passed = [], True
+    for path in portfolio_paths:
+        fingerprints, elements = trade_fingerprints([path])
+        ids = [trade.get("id") for trade in ET.parse(path).getroot().findall("Trade")]
+        ok = None not in fingerprints and sorted(fingerprints) == sorted(set(ids)) and all(elements[t].get("id") == t for t in fingerprints)
+        composites = [t for t in fingerprints if elements[t].find(".//Trade") is not None]
+        if composites:
+            tree = ET.parse(path)
+            component = tree.getroot().find(f"Trade[@id='{composites[0]}']").find(".//Trade/TradeType")
+            component.text = component.text + "_changed"
+            tmp_path = f"{path}.{os.getpid()}.fingerprint.tmp"
+            try:
+                tree.write(tmp_path, encoding="utf-8", xml_declaration=True)
+                changed, _ = trade_fingerprints([tmp_path])
+            finally:
+                os.remove(tmp_path)
+            ok = ok and sorted(t for t in changed if changed[t] != fingerprints.get(t)) == [composites[0]]
+        passed = passed and ok
+        lines.append(f"{path}: {'ok' if ok else 'FAILED'} ({len(fingerprints)} trades, {len(composites)} composite)")
+    lines.append(f"trade fingerprints: {'passed' if passed else 'FAILED'}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(check_trade_fingerprints())
@@ -0,0 +1,153 @@
+import os
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Tuple
+from xml_document_cache import file_signature, parse_xml
+from xml_backend import get_xml_backend
+
+
+# Parameters in ore.xml that point at input files. Setup parameters and analytic parameters
+# are both resolved relative to the Setup/inputPath folder, as ORE does.
+input_file_parameters = [
+    "marketDataFile", "fixingDataFile", "dividendDataFile", "curveConfigFile", "conventionsFile",
+    "marketConfigFile", "pricingEnginesFile", "amcPricingEnginesFile", "portfolioFile",
+    "calendarAdjustment", "currencyConfiguration", "referenceDataFile", "iborFallbackConfig",
+    "scriptLibrary", "simulationConfigFile", "csaFile", "sensitivityConfigFile", "stressConfigFile",
+    "collateralBalancesFile", "sensitivityInputFile", "covarianceInputFile", "historicalScenarioFile",
+    "xvaCgSensitivityConfigFile", "creditMigrationConfig",
+]
+
+# Setup parameters whose content does not depend on the portfolio being priced.
+static_setup_parameters = [
+    "marketDataFile", "fixingDataFile", "dividendDataFile", "curveConfigFile", "conventionsFile",
+    "marketConfigFile", "pricingEnginesFile", "calendarAdjustment", "currencyConfiguration",
+    "referenceDataFile", "iborFallbackConfig",
+]
+
+
+def get_run_directory(input_path: str) -> str:
+    """Directory ORE has to be started from, i.e. the parent of the input folder."""
+    return os.path.dirname(os.path.abspath(input_path))
+
+
+def get_setup_parameters(ore_xml_path: str) -> Dict[str, str]:
+    """Return the Setup section of an ore.xml file as a name -> value dictionary."""
+    root = parse_xml(ore_xml_path).getroot()
+    setup = root.find("Setup")
+    if setup is None:
+        return {}
+    return {p.get("name"): (p.text or "").strip() for p in setup.findall("Parameter") if p.get("name")}
+
+
+def get_active_analytics(ore_xml_path: str) -> Dict[str, Dict[str, str]]:
+    """Return the parameters of every active analytic keyed by analytic type."""
+    root = parse_xml(ore_xml_path).getroot()
+    analytics = {}
+    analytics_section = root.find("Analytics")
+    if analytics_section is None:
+        return analytics
+    for analytic in analytics_section.findall("Analytic"):
+        params = {p.get("name"): (p.text or "").strip() for p in analytic.findall("Parameter") if p.get("name")}
+        if params.get("active") == "Y":
+            analytics[analytic.get("type")] = params
+    return analytics
+
+
+def resolve_ore_input_files(input_path: str, ore_file: str = "ore.xml") -> Dict[str, str]:
+    """
+    Resolve every input file an ORE run depends on to an absolute path.
+
+    Args:
+        input_path (str): Input folder that contains ore.xml (e.g. f_path_in).
+        ore_file (str): Name of the ore.xml file inside input_path.
+
+    Returns:
+        Dict[str, str]: Mapping of '<section>/<parameter>' to absolute file path. The ore.xml
+        itself is returned under the key 'ore.xml'. Files that do not exist are skipped.
+    """
+    ore_xml_path = os.path.abspath(os.path.join(input_path, ore_file))
+    run_dir = get_run_directory(input_path)
+    setup = get_setup_parameters(ore_xml_path)
+    setup_input_dir = os.path.join(run_dir, setup.get("inputPath", os.path.basename(input_path)))
+    output_dir = os.path.join(run_dir, setup.get("outputPath", "Output"))
+
+    files = {"ore.xml": ore_xml_path}
+
+    def add(key, value, base_dir):
+        for n, name in enumerate([v.strip() for v in value.split(",") if v.strip()]):
+            path = os.path.normpath(os.path.join(base_dir, name))
+            if os.path.isfile(path):
+                files[key if n == 0 else f"{key}#{n}"] = path
+
+    for name in input_file_parameters:
+        if setup.get(name):
+            add(f"Setup/{name}", setup[name], setup_input_dir)
+
+    analytics = get_active_analytics(ore_xml_path)
+    for analytic_type, params in analytics.items():
+        for name in input_file_parameters:
+            if params.get(name):
+                add(f"{analytic_type}/{name}", params[name], setup_input_dir)
+    # Without an active simulation the xva analytic reads a previously written cube from the output folder.
+    if "xva" in analytics and "simulation" not in analytics:
+        for name in ["cubeFile", "nettingSetCubeFile", "scenarioFile"]:
+            if analytics["xva"].get(name):
+                add(f"xva/{name}", analytics["xva"][name], output_dir)
+    return files
+
+
+def get_output_directory(input_path: str, ore_file: str = "ore.xml") -> str:
+    """Absolute path of the Setup/outputPath folder of an ore.xml file."""
+    setup = get_setup_parameters(os.path.join(input_path, ore_file))
+    return os.path.normpath(os.path.join(get_run_directory(input_path), setup.get("outputPath", "Output")))
+
+
+def hash_files(paths: List[str]) -> str:
+    """Content hash over a list of files, independent of where the files live."""
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def static_inputs_fingerprint(input_path: str, ore_file: str = "ore.xml") -> str:
+    """Fingerprint of the market data and static configuration (everything but the portfolio and analytics)."""
+    files = resolve_ore_input_files(input_path, ore_file)
+    static_paths = [files[k] for k in sorted(files) if k.split("#")[0] in [f"Setup/{p}" for p in static_setup_parameters]]
+    return hash_files(static_paths)
+
+
+_validated: Dict[str, Tuple[Tuple[int, int, int], str, List[str]]] = {}
+_validated_lock = threading.Lock()
+
+
+def validate_ore_inputs(input_path: str, ore_file: str = "ore.xml") -> Dict[str, List[str]]:
+    """
+    Validate every XML input file of an ORE run with the XML backend, before ORE is started.
+
+    Results are kept per file until it changes on disk, so a run only validates the files edited since the last one.
+
+    Returns:
+        Dict[str, List[str]]: Problems by '<section>/<parameter>' key (as resolve_ore_input_files), only files with problems.
+    """
+    try:
+        files = resolve_ore_input_files(input_path, ore_file)
+    except ET.ParseError as e:
+        return {"ore.xml": [f"not well-formed XML: {e}"]}
+    backend = get_xml_backend()
+    problems = {}
+    for key, path in files.items():
+        if not path.endswith(".xml"):
+            continue
+        signature = file_signature(path)
+        with _validated_lock:
+            entry = _validated.get(path)
+        if entry is None or entry[:2] != (signature, backend.name):
+            entry = _validated[path] = (signature, backend.name, backend.validate_file(path))
+        if entry[2]:
+            problems[key] = entry[2]
+    return problems
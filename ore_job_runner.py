@@ -0,0 +1,281 @@
+"""
+Asynchronous ORE job runner.
+
+Runs are submitted as jobs and executed in the background on the ORE worker pool, so the caller (a
+LangGraph node, the Streamlit app) is not blocked. While a job runs its progress is read by tailing
+ORE's log_progress.json and log_structured.json in the run's output folder. Jobs can be awaited,
+cancelled, and several jobs can be queued.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Dict, Iterator, List, Optional
+from ore_inputs import get_output_directory, validate_ore_inputs
+from ore_sandbox import OreSandbox, get_publish_lock
+from ore_worker_pool import get_ore_worker_pool
+from ore_result_cache import get_ore_result_cache
+from ore_incremental import run_incremental, record_run
+from ore_sharding import run_sharded, get_ore_shard_pool
+from ore_report_store import get_ore_report_store
+from ore_cube_binary import export_binary_cubes
+from ore_parquet import export_reports_to_parquet
+from ore_pricing_profiler import get_pricing_history, load_pricingstats
+from config_file import ore_worker_pool_size, ore_incremental_enabled, ore_report_store_enabled, ore_binary_cube_export, \
+    ore_parquet_export, ore_pricing_history_enabled, ore_preflight_validation
+
+
+def _check_cancelled(cancel_requested: Optional[Callable[[], bool]]) -> None:
+    if cancel_requested is not None and cancel_requested():
+        raise RuntimeError("ORE run cancelled.")
+
+
+def execute_ore_run(sandbox: OreSandbox, job_id: Optional[str] = None, shards: int = 1,
+                    cancel_requested: Optional[Callable[[], bool]] = None) -> str:
+    """
+    Run ORE on a sandbox: restore from the result cache, run incrementally or run in full, then publish
+    the outputs. With shards > 1 a full run is split across that many ORE processes.
+
+    Args:
+        cancel_requested (Optional[Callable[[], bool]]): Checked before every ORE run, the run stops with a
+            RuntimeError once it returns True.
+
+    Returns:
+        str: Summary of the run with the list of generated reports.
+    """
+    _check_cancelled(cancel_requested)
+    cache = get_ore_result_cache()
+    cache_key = cache.key(sandbox.input_path, files=sandbox.files)
+    with get_publish_lock(sandbox.target_output_dir):
+        cached_reports = cache.restore(cache_key, sandbox.target_output_dir)
+        if cached_reports is not None:
+            get_ore_report_store().invalidate(sandbox.target_output_dir)
+    if cached_reports is not None:
+        reports_str = '\n'.join([str(n)+'. '+i for n,i in enumerate(cached_reports)])
+        return f"ORE run completed successfully. Inputs are unchanged since a previous run, results were restored from cache. It generated following reports:{reports_str}"
+
+    pool = get_ore_worker_pool()
+    start = time.time()
+    _check_cancelled(cancel_requested)
+    result = run_incremental(sandbox, pool, token=job_id) if ore_incremental_enabled else None
+    if result is None:
+        _check_cancelled(cancel_requested)
+        if shards > 1:
+            result = run_sharded(sandbox, n_shards=shards, token=job_id)
+            pool = get_ore_shard_pool()
+            mode = "sharded"
+            incremental_str = f"\nSharded run: priced {sum(len(s) for s in result.shards)} trades in {len(result.shards)} parallel shards of " + \
+                ", ".join(str(len(s)) for s in result.shards) + " trades."
+        else:
+            result = pool.run(sandbox.input_path, token=job_id, collect_reports=ore_report_store_enabled)
+            mode = "full"
+            incremental_str = ""
+        # file modification times can be rounded down, allow for it when collecting the run's output
+        record_run(sandbox, result.report_names, since=start - 2)
+    else:
+        mode = "incremental"
+        incremental_str = f"\nIncremental run: repriced {len(result.repriced)} new or changed trades, reused results of {len(result.reused)} unchanged trades, dropped {len(result.removed)} removed trades."
+    if ore_binary_cube_export:
+        export_binary_cubes(sandbox.output_dir, since=start - 2)
+    if ore_parquet_export:
+        export_reports_to_parquet(sandbox.output_dir, result.reports)
+    cache.store(cache_key, sandbox.output_dir, result.report_names, since=start - 2)
+    with get_publish_lock(sandbox.target_output_dir):
+        published = sandbox.publish(since=start - 2)
+        if result.reports is not None:
+            get_ore_report_store().put(sandbox.target_output_dir, result.reports, published)
+        else:
+            # Merged incremental/sharded reports only exist on disk.
+            get_ore_report_store().invalidate(sandbox.target_output_dir)
+    pricingstats_path = os.path.join(sandbox.output_dir, "pricingstats.csv")
+    if ore_pricing_history_enabled and os.path.isfile(pricingstats_path):
+        stats = load_pricingstats(pricingstats_path)
+        if mode == "incremental":
+            # the merged pricingstats hold the old timings of the reused trades, record only the repriced ones
+            stats = stats[stats["TradeId"].isin(result.repriced)]
+        if len(stats):
+            get_pricing_history().record(stats, label=job_id, pricing_engine_file=sandbox.files.get("Setup/pricingEnginesFile"), mode=mode)
+    reports_str = '\n'.join([str(n)+'. '+i for n,i in enumerate(result.report_names)])
+    if result.warm:
+        warm_str = f"\nRan on a warm ORE worker, saved {result.saved_seconds:.2f} sec of market/fixings loading ({pool.saved_seconds:.2f} sec this session)."
+    else:
+        warm_str = "\nRan on a cold ORE worker, market and fixings are now loaded for the next runs."
+    return f"ORE run completed successfully. It generated following reports:{reports_str}{warm_str}{incremental_str}"
+
+
+class OreJob:
+    def __init__(self, job_id: str, input_path: str, shards: int = 1):
+        self.job_id = job_id
+        self.input_path = input_path
+        self.shards = shards
+        self.output_dir = get_output_directory(input_path)
+        self.future: Optional[Future] = None
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.progress: Dict[str, Dict] = {}
+        self.messages: List[Dict] = []
+        # set by OreJobRunner.cancel, a job that fails after it was cancelled counts as cancelled
+        self.cancel_requested = False
+        self._offsets = {"log_progress.json": 0, "log_structured.json": 0}
+        # poll is called by the runner thread, list_jobs and stream_progress at the same time
+        self._lock = threading.Lock()
+
+    @property
+    def status(self) -> str:
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.started is not None else "queued"
+        if self.future.exception() is not None:
+            return "cancelled" if self.cancel_requested else "failed"
+        return "done"
+
+    def _tail(self, name: str) -> List[Dict]:
+        """Read the JSON lines appended to an ORE log file since the last call."""
+        path = os.path.join(self.output_dir, name)
+        if self.started is None or not os.path.isfile(path) or os.path.getmtime(path) < self.started - 2:
+            return []
+        if os.path.getsize(path) < self._offsets[name]:
+            # ORE started a new log file
+            self._offsets[name] = 0
+        entries = []
+        with open(path, "r") as f:
+            f.seek(self._offsets[name])
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                self._offsets[name] += len(line.encode())
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+        return entries
+
+    def poll(self) -> Dict:
+        """Update the job from ORE's progress and structured logs and return a snapshot of its state."""
+        with self._lock:
+            for entry in self._tail("log_progress.json"):
+                self.progress[entry.get("key", "")] = entry
+            self.messages.extend(self._tail("log_structured.json"))
+            current = None
+            if self.progress:
+                current = max(self.progress.values(), key=lambda e: e.get("@timestamp", ""))
+            errors = [m.get("message") for m in self.messages if m.get("category") == "Error"]
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "step": current.get("key") if current else None,
+            "progress": current.get("progress") if current else None,
+            "total": current.get("total") if current else None,
+            "detail": current.get("detail") if current else None,
+            "errors": errors,
+            "elapsed": ((self.finished or time.time()) - self.started) if self.started else 0.0,
+        }
+
+
+class OreJobRunner:
+    """Queue of ORE jobs executed in the background, each in its own sandbox so they can run concurrently."""
+
+    def __init__(self, max_workers: int = ore_worker_pool_size):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ore-job")
+        self._jobs: Dict[str, OreJob] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, job: OreJob) -> str:
+        job.started = time.time()
+        with OreSandbox(job.input_path) as sandbox:
+            # ORE writes its progress logs into the sandbox while the job runs.
+            job.output_dir = sandbox.output_dir
+            try:
+                return execute_ore_run(sandbox, job_id=job.job_id, shards=job.shards, cancel_requested=lambda: job.cancel_requested)
+            finally:
+                job.finished = time.time()
+                job.poll()
+                get_ore_worker_pool().forget(job.job_id)
+                if job.shards > 1:
+                    get_ore_shard_pool().forget(job.job_id)
+
+    def submit(self, input_path: str, shards: int = 1) -> str:
+        """
+        Queue an ORE run for the ore.xml in input_path, optionally split into shards, and return its job id.
+
+        Raises ValueError without starting ORE if an input file fails validation (ore_preflight_validation).
+        """
+        if ore_preflight_validation:
+            problems = validate_ore_inputs(input_path)
+            if problems:
+                raise ValueError("Invalid ORE input files, ORE was not started: "
+                                 + "; ".join(f"{key}: {', '.join(p)}" for key, p in problems.items()))
+        job = OreJob(uuid.uuid4().hex[:12], input_path, shards)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        job.future = self._executor.submit(self._run, job)
+        return job.job_id
+
+    def get_job(self, job_id: str) -> OreJob:
+        if job_id not in self._jobs:
+            raise KeyError(f"Unknown ORE job id '{job_id}'")
+        return self._jobs[job_id]
+
+    def progress(self, job_id: str) -> Dict:
+        return self.get_job(job_id).poll()
+
+    def list_jobs(self, since: float = 0.0) -> List[Dict]:
+        with self._lock:
+            jobs = [j for j in self._jobs.values() if j.submitted >= since]
+        return [j.poll() for j in jobs]
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued job, or stop a running one: its ORE workers are stopped and ORE runs it has not
+        started yet are skipped. Returns False if the job already finished.
+        """
+        job = self.get_job(job_id)
+        if job.future.done():
+            return False
+        job.cancel_requested = True
+        if job.future.cancel():
+            return True
+        get_ore_worker_pool().cancel(job_id)
+        if job.shards > 1:
+            get_ore_shard_pool().cancel(job_id)
+        return True
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> str:
+        """Block until the job finishes and return its summary. Raises on failure or cancellation."""
+        return self.get_job(job_id).future.result(timeout=timeout)
+
+    async def wait_async(self, job_id: str) -> str:
+        """Await the job from asyncio code without blocking the event loop."""
+        return await asyncio.wrap_future(self.get_job(job_id).future)
+
+    def stream_progress(self, job_id: str, poll_interval: float = 0.5) -> Iterator[Dict]:
+        """Yield progress snapshots whenever they change until the job is finished."""
+        job = self.get_job(job_id)
+        last = None
+        while True:
+            snapshot = job.poll()
+            key = (snapshot["status"], snapshot["step"], snapshot["progress"], len(snapshot["errors"]))
+            if key != last:
+                last = key
+                yield snapshot
+            if job.future.done():
+                break
+            time.sleep(poll_interval)
+
+
+_runner: Optional[OreJobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_ore_job_runner() -> OreJobRunner:
+    """Return the process-wide ORE job runner."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = OreJobRunner()
+        return _runner
@@ -0,0 +1,183 @@
+"""
+Parquet copies of the ORE reports.
+
+After a run every CSV report is also written as <report>.parquet next to it. The Parquet copy holds
+the DataFrame load_report gives for the report (built from the in-memory report when the worker handed
+it back, otherwise parsed from the CSV once), so query_report returns the same values and dtypes from
+the report store, the Parquet copy or the CSV file. Files are split into row groups whose min/max
+statistics let query_report read only the columns and row groups a question needs, filtered by trade
+id, netting set and date. Every Parquet file records the size and modification time of its CSV, a
+Parquet file whose CSV changed since is not used.
+
+pyarrow is listed in requirements.txt but optional: without it nothing is exported and queries read the
+report store or the CSV files.
+"""
+import os
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence, Union
+from ore_report_store import columns_to_csv_dataframe, match_report_files, get_ore_report_store
+from config_file import ore_parquet_row_group_size
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+_source_key = b"ore_source_csv"
+
+# Column names that identify a trade, a netting set or a date across the ORE reports.
+trade_id_columns = ["TradeId", "Id", "TradeID"]
+netting_set_columns = ["NettingSet", "NettingSetId"]
+date_columns = ["Date", "PayDate", "AsOfDate"]
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+def parquet_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def _source_signature(csv_path: str) -> bytes:
+    stat = os.stat(csv_path)
+    return f"{stat.st_size},{stat.st_mtime_ns}".encode()
+
+
+def _nulls_as_nan(df: pd.DataFrame) -> pd.DataFrame:
+    # Arrow nulls of string columns come back as None, pd.read_csv gives NaN
+    for name in df.columns:
+        if df[name].dtype == object:
+            df[name] = df[name].where(df[name].notna(), np.nan)
+    return df
+
+
+def export_reports_to_parquet(output_dir: str, reports: Optional[Dict[str, Dict[str, np.ndarray]]] = None,
+                              file_names: Optional[List[str]] = None) -> List[str]:
+    """
+    Write a Parquet copy of every CSV report in output_dir.
+
+    Args:
+        reports (Optional[Dict[str, Dict[str, np.ndarray]]]): Typed columns of the run's reports by report name,
+            used instead of parsing the CSV files they were written to.
+        file_names (Optional[List[str]]): Files to export, all CSV files in output_dir by default.
+
+    Returns:
+        List[str]: Names of the Parquet files written.
+    """
+    if pa is None:
+        return []
+    if file_names is None:
+        file_names = sorted(os.listdir(output_dir))
+    csv_names = [n for n in file_names if n.endswith(".csv") and os.path.isfile(os.path.join(output_dir, n))]
+    matched = match_report_files(output_dir, reports, csv_names) if reports else {}
+    written = []
+    for name in csv_names:
+        csv_path = os.path.join(output_dir, name)
+        try:
+            df = columns_to_csv_dataframe(reports[matched[name]], csv_path) if name in matched else pd.read_csv(csv_path)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowException, ValueError):
+            continue
+        table = table.replace_schema_metadata({_source_key: _source_signature(csv_path)})
+        target = parquet_path(csv_path)
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        pq.write_table(table, tmp_path, row_group_size=ore_parquet_row_group_size)
+        os.replace(tmp_path, target)
+        written.append(os.path.basename(target))
+    return written
+
+
+def _is_current(csv_path: str) -> bool:
+    path = parquet_path(csv_path)
+    if pa is None or not os.path.isfile(path) or not os.path.isfile(csv_path):
+        return False
+    metadata = pq.read_schema(path).metadata or {}
+    return metadata.get(_source_key) == _source_signature(csv_path)
+
+
+def _find_column(names: List[str], candidates: List[str]) -> Optional[str]:
+    for candidate in candidates:
+        for name in [candidate, "#" + candidate]:
+            if name in names:
+                return name
+    return None
+
+
+def _as_date(value: Union[str, datetime.date]) -> datetime.date:
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)[:10])
+
+
+def _date_filter_value(value: datetime.date, date_type):
+    if pa.types.is_date(date_type):
+        return value
+    if pa.types.is_timestamp(date_type):
+        return datetime.datetime.combine(value, datetime.time())
+    # ISO date strings sort like the dates
+    return value.isoformat()
+
+
+def query_report(csv_path: str, columns: Optional[Sequence[str]] = None, trade_ids: Optional[Sequence[str]] = None,
+                 netting_sets: Optional[Sequence[str]] = None, date_from: Optional[Union[str, datetime.date]] = None,
+                 date_to: Optional[Union[str, datetime.date]] = None) -> pd.DataFrame:
+    """
+    Read part of a report: only the given columns and the rows of the given trades, netting sets and dates.
+
+    A report held by the report store is filtered in memory. Otherwise the filters are pushed down to the
+    Parquet reader, which skips row groups whose statistics exclude them, and without a current Parquet copy
+    the CSV file is loaded and filtered in memory. Either way the result is the frame load_report gives,
+    filtered. A filter on a column the report does not have is ignored.
+
+    Args:
+        csv_path (str): Path of the CSV report ORE wrote, e.g. 'Output/flows.csv'.
+        columns (Optional[Sequence[str]]): Columns to return, with or without the leading '#'. All by default.
+        trade_ids, netting_sets: Keep rows of these trade ids or netting sets.
+        date_from, date_to: Keep rows dated within this range (inclusive, ISO strings or dates).
+
+    Returns:
+        pd.DataFrame: The selected rows and columns, with the column names of the CSV file.
+    """
+    df = get_ore_report_store().get_dataframe(csv_path)
+    if df is None and _is_current(csv_path):
+        path = parquet_path(csv_path)
+        names = pq.read_schema(path).names
+        filters = []
+        trade_column = _find_column(names, trade_id_columns)
+        if trade_ids and trade_column:
+            filters.append((trade_column, "in", list(trade_ids)))
+        netting_set_column = _find_column(names, netting_set_columns)
+        if netting_sets and netting_set_column:
+            filters.append((netting_set_column, "in", list(netting_sets)))
+        date_column = _find_column(names, date_columns)
+        if date_column:
+            date_type = pq.read_schema(path).field(date_column).type
+            for op, value in [(">=", date_from), ("<=", date_to)]:
+                if value is not None:
+                    filters.append((date_column, op, _date_filter_value(_as_date(value), date_type)))
+        selected = None if columns is None else [_find_column(names, [c.lstrip("#")]) or c for c in columns]
+        return _nulls_as_nan(pq.read_table(path, columns=selected, filters=filters or None).to_pandas())
+
+    if df is None:
+        df = pd.read_csv(csv_path)
+    names = list(df.columns)
+    mask = np.ones(len(df), dtype=bool)
+    trade_column = _find_column(names, trade_id_columns)
+    if trade_ids and trade_column:
+        mask &= df[trade_column].astype(str).isin(list(trade_ids)).to_numpy()
+    netting_set_column = _find_column(names, netting_set_columns)
+    if netting_sets and netting_set_column:
+        mask &= df[netting_set_column].astype(str).isin(list(netting_sets)).to_numpy()
+    date_column = _find_column(names, date_columns)
+    if date_column and (date_from is not None or date_to is not None):
+        dates = pd.to_datetime(df[date_column], errors="coerce")
+        if date_from is not None:
+            mask &= (dates >= pd.Timestamp(_as_date(date_from))).to_numpy()
+        if date_to is not None:
+            mask &= (dates <= pd.Timestamp(_as_date(date_to))).to_numpy()
+    df = df[mask]
+    if columns is not None:
+        df = df[[_find_column(names, [c.lstrip("#")]) or c for c in columns]]
+    return df.reset_index(drop=True)
@@ -0,0 +1,231 @@
+"""
+Pricing performance profiler over the pricingstats reports of many ORE runs.
+
+Every run's pricingstats (TradeId, TradeType, NumberOfPricings, CumulativeTiming, AverageTiming, timings in
+microseconds) is aligned by TradeId with the other runs. From that the profiler computes speedups against a
+baseline run per trade and per trade type, flags regressions and lists the slowest trades. Runs are kept
+in an append-only history file together with a hash of the pricingengine.xml they used, so performance can
+be followed across changes of the pricing engine configuration.
+"""
+import os
+import csv
+import time
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence
+from ore_report_store import load_report, report_to_columns, columns_to_dataframe
+from config_file import f_path_pricing_history
+
+stats_columns = ["TradeId", "TradeType", "NumberOfPricings", "CumulativeTiming", "AverageTiming"]
+history_columns = ["RunId", "Label", "Timestamp", "Mode", "PricingEngineHash"] + stats_columns
+
+
+def load_pricingstats(source) -> pd.DataFrame:
+    """
+    pricingstats of one run with the columns of stats_columns.
+
+    Args:
+        source: An output folder, a pricingstats.csv path, an ORE InMemoryReport or a DataFrame.
+    """
+    if isinstance(source, pd.DataFrame):
+        df = source
+    elif isinstance(source, str):
+        path = os.path.join(source, "pricingstats.csv") if os.path.isdir(source) else source
+        df = load_report(path)
+    else:
+        df = columns_to_dataframe(report_to_columns(source))
+    df = df.rename(columns={c: c.lstrip("#") for c in df.columns})[stats_columns].copy()
+    df["TradeId"] = df["TradeId"].astype(str)
+    for column in ["NumberOfPricings", "CumulativeTiming", "AverageTiming"]:
+        df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df
+
+
+class PricingProfile:
+    """
+    pricingstats of several runs aligned by TradeId.
+
+    Attributes:
+        runs (Dict[str, pd.DataFrame]): pricingstats by run label, in the order given.
+        timings (pd.DataFrame): CumulativeTiming (microseconds), one row per trade and one column per run, NaN
+            where a run did not price the trade.
+        trade_types (pd.Series): Trade type of every trade.
+    """
+
+    def __init__(self, runs: Dict[str, pd.DataFrame]):
+        if not runs:
+            raise ValueError("A pricing profile needs at least one run.")
+        self.runs = {label: load_pricingstats(df) for label, df in runs.items()}
+        self.timings = pd.concat({label: df.set_index("TradeId")["CumulativeTiming"] for label, df in self.runs.items()}, axis=1)
+        self.trade_types = pd.concat([df.set_index("TradeId")["TradeType"] for df in self.runs.values()])
+        self.trade_types = self.trade_types[~self.trade_types.index.duplicated()].reindex(self.timings.index)
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self.runs)
+
+    def _baseline(self, baseline: Optional[str]) -> str:
+        baseline = baseline or self.labels[0]
+        if baseline not in self.runs:
+            raise KeyError(f"Run '{baseline}' is not in the profile, runs are {', '.join(self.labels)}")
+        return baseline
+
+    def speedups(self, baseline: Optional[str] = None) -> pd.DataFrame:
+        """Per trade: baseline timing / run timing for every run (above 1 is faster than the baseline)."""
+        baseline = self._baseline(baseline)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            speedups = self.timings.rdiv(self.timings[baseline], axis=0)
+        speedups.insert(0, "TradeType", self.trade_types)
+        return speedups
+
+    def by_trade_type(self, baseline: Optional[str] = None) -> pd.DataFrame:
+        """
+        Per trade type: number of trades, total timing of every run (over the trades priced by all runs) and the
+        speedup of every run against the baseline.
+        """
+        baseline = self._baseline(baseline)
+        common = self.timings.dropna()
+        totals = common.groupby(self.trade_types.reindex(common.index)).sum()
+        result = pd.DataFrame({"Trades": common.groupby(self.trade_types.reindex(common.index)).size()})
+        for label in self.labels:
+            result[f"Timing[{label}]"] = totals[label]
+        for label in self.labels:
+            if label != baseline:
+                result[f"Speedup[{label}]"] = totals[baseline] / totals[label]
+        return result.sort_values(f"Timing[{baseline}]", ascending=False)
+
+    def regressions(self, baseline: Optional[str] = None, tolerance: float = 0.1, min_timing: float = 0.0) -> pd.DataFrame:
+        """
+        Trades that got slower than the baseline by more than tolerance (0.1 = 10%) in some run.
+
+        Args:
+            min_timing (float): Ignore trades faster than this in the baseline (microseconds), their timings are noise.
+        """
+        baseline = self._baseline(baseline)
+        ratios = self.timings.div(self.timings[baseline], axis=0).drop(columns=[baseline])
+        ratios = ratios[self.timings[baseline] >= min_timing]
+        worst = ratios.max(axis=1)
+        flagged = ratios[worst > 1.0 + tolerance].rename(columns=lambda label: f"Slowdown[{label}]").assign(WorstSlowdown=worst)
+        flagged.insert(0, "TradeType", self.trade_types.reindex(flagged.index))
+        flagged.insert(1, f"Timing[{baseline}]", self.timings[baseline].reindex(flagged.index))
+        return flagged.sort_values("WorstSlowdown", ascending=False)
+
+    def slowest(self, run: Optional[str] = None, k: int = 10) -> pd.DataFrame:
+        """The k trades with the largest cumulative timing in a run (the last run by default)."""
+        run = run or self.labels[-1]
+        df = self.runs[run].sort_values("CumulativeTiming", ascending=False).head(k).reset_index(drop=True)
+        df["Share"] = df["CumulativeTiming"] / self.runs[run]["CumulativeTiming"].sum()
+        return df
+
+    def summary(self, baseline: Optional[str] = None, k: int = 10, tolerance: float = 0.1) -> str:
+        """Text report: totals per run, speedups per trade type, regressions and the slowest trades of the last run."""
+        baseline = self._baseline(baseline)
+        totals = pd.DataFrame({"Trades": [len(df) for df in self.runs.values()],
+                               "TotalTiming[s]": [df["CumulativeTiming"].sum() / 1e6 for df in self.runs.values()]}, index=self.labels)
+        totals["Speedup"] = totals.loc[baseline, "TotalTiming[s]"] / totals["TotalTiming[s]"]
+        regressions = self.regressions(baseline, tolerance)
+        parts = [f"Baseline run: {baseline}", totals.round(3).to_string(),
+                 "Per trade type:", self.by_trade_type(baseline).round(3).to_string(),
+                 f"Regressions (> {tolerance:.0%} slower than the baseline): {len(regressions)}"]
+        if len(regressions):
+            parts.append(regressions.head(k).round(3).to_string())
+        parts += [f"Slowest {k} trades of {self.labels[-1]}:", self.slowest(k=k).round(3).to_string()]
+        return "\n\n".join(parts)
+
+
+def pricing_engine_hash(pricing_engine_file: Optional[str]) -> str:
+    if not pricing_engine_file or not os.path.isfile(pricing_engine_file):
+        return ""
+    with open(pricing_engine_file, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+class PricingStatsHistory:
+    """Append-only CSV history of the pricingstats of past runs, one row per trade and run."""
+
+    def __init__(self, path: str = f_path_pricing_history):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, source, label: Optional[str] = None, pricing_engine_file: Optional[str] = None, mode: str = "full") -> str:
+        """
+        Append the pricingstats of a run.
+
+        Args:
+            source: Output folder, pricingstats.csv path, InMemoryReport or DataFrame of the run.
+            label (Optional[str]): Name of the run, e.g. 'release-12 AMC'. Defaults to the run id.
+            pricing_engine_file (Optional[str]): pricingengine.xml the run used, its hash is stored with the run.
+            mode (str): How the run was executed, e.g. 'full', 'sharded' or 'incremental' (only the repriced trades).
+
+        Returns:
+            str: The run id.
+        """
+        stats = load_pricingstats(source)
+        run_id = time.strftime("%Y%m%d-%H%M%S") + f"-{os.urandom(2).hex()}"
+        stats.insert(0, "PricingEngineHash", pricing_engine_hash(pricing_engine_file))
+        stats.insert(0, "Mode", mode)
+        stats.insert(0, "Timestamp", time.strftime("%Y-%m-%dT%H:%M:%S"))
+        stats.insert(0, "Label", label or run_id)
+        stats.insert(0, "RunId", run_id)
+        with self._lock:
+            write_header = not os.path.isfile(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", newline="") as f:
+                stats[history_columns].to_csv(f, header=write_header, index=False, quoting=csv.QUOTE_MINIMAL)
+        return run_id
+
+    def load(self) -> pd.DataFrame:
+        if not os.path.isfile(self.path):
+            return pd.DataFrame(columns=history_columns)
+        return pd.read_csv(self.path, dtype={"RunId": str, "Label": str, "TradeId": str, "PricingEngineHash": str}, keep_default_na=False)
+
+    def runs(self) -> pd.DataFrame:
+        """One row per recorded run: label, time, mode, engine hash, number of trades and total timing in seconds."""
+        history = self.load()
+        grouped = history.groupby("RunId", sort=False)
+        runs = grouped[["Label", "Timestamp", "Mode", "PricingEngineHash"]].first()
+        runs["Trades"] = grouped.size()
+        runs["TotalTiming[s]"] = grouped["CumulativeTiming"].sum() / 1e6
+        return runs.reset_index()
+
+    def profile(self, run_ids: Optional[Sequence[str]] = None, last: Optional[int] = None) -> PricingProfile:
+        """
+        PricingProfile over the given runs (ids or labels), or the last runs of the history, oldest first.
+
+        Incremental runs only hold the trades they repriced, so they are left out of the last runs and marked
+        with ' (incremental)' when asked for by id or label.
+        """
+        history = self.load()
+        runs = self.runs()
+        if run_ids:
+            selected = [runs.loc[(runs["RunId"] == r) | (runs["Label"] == r), "RunId"].iloc[-1] for r in run_ids]
+        else:
+            complete = runs[runs["Mode"] != "incremental"]
+            selected = list(complete["RunId"].iloc[-(last or len(complete)):])
+        labels = {r: label + (" (incremental)" if mode == "incremental" else "")
+                  for r, label, mode in zip(runs["RunId"], runs["Label"], runs["Mode"])}
+        return PricingProfile({(labels[r] if list(labels.values()).count(labels[r]) == 1 else r): history[history["RunId"] == r]
+                               for r in selected})
+
+
+_history: Optional[PricingStatsHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_pricing_history() -> PricingStatsHistory:
+    """Return the process-wide pricing performance history."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = PricingStatsHistory()
+        return _history
+
+
+if __name__ == "__main__":
+    import sys
+    # python ore_pricing_profiler.py Output_run1 Output_run2 ...: compare the pricingstats of these output folders.
+    if len(sys.argv) > 1:
+        print(PricingProfile({os.path.basename(os.path.normpath(p)): load_pricingstats(p) for p in sys.argv[1:]}).summary())
+    else:
+        print(get_pricing_history().profile(last=5).summary())
@@ -0,0 +1,162 @@
+"""
+Row-by-row comparison of two ORE reports.
+
+Rows of the two reports are paired on a key (e.g. TradeId and Factor) with a hash join instead of
+comparing every pair of rows, so two sensitivity reports with 10^5 rows compare in well under a
+second. The result is columnar: the paired rows with both values and their absolute and relative
+differences, the rows found in only one of the reports, and summary statistics.
+"""
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence, Union
+from ore_report_store import report_to_columns, columns_to_dataframe, load_report
+
+Column = Union[str, int]
+
+
+class ReportDiff:
+    """
+    Attributes:
+        keys (List[str]): Key columns the rows were paired on.
+        value (str): Compared value column.
+        matched (pd.DataFrame): One row per pair: row_1, row_2 (row positions in the reports), the keys, the extra
+            columns (from report 1), value_1, value_2, diff (value_1 - value_2), rel_diff (diff relative to
+            |value_2|, NaN where it is 0) and within_tolerance.
+        only_1, only_2 (pd.DataFrame): Rows of report 1/2 without a partner: row position, keys, extra columns and value.
+        abs_tol, rel_tol (float): Pairs with |diff| <= abs_tol or |rel_diff| <= rel_tol are within tolerance.
+    """
+
+    def __init__(self, keys: List[str], value: str, matched: pd.DataFrame, only_1: pd.DataFrame, only_2: pd.DataFrame,
+                 abs_tol: float, rel_tol: float):
+        self.keys = keys
+        self.value = value
+        self.matched = matched
+        self.only_1 = only_1
+        self.only_2 = only_2
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+
+    @property
+    def breaks(self) -> pd.DataFrame:
+        """Pairs outside the tolerances."""
+        return self.matched[~self.matched["within_tolerance"]]
+
+    @property
+    def identical(self) -> bool:
+        return self.only_1.empty and self.only_2.empty and bool(self.matched["within_tolerance"].all())
+
+    def summary(self) -> Dict[str, float]:
+        diff = self.matched["diff"].abs()
+        return {
+            "matched": len(self.matched),
+            "only_1": len(self.only_1),
+            "only_2": len(self.only_2),
+            "breaks": int((~self.matched["within_tolerance"]).sum()),
+            "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+            "mean_abs_diff": float(diff.mean()) if len(diff) else 0.0,
+            "max_rel_diff": float(self.matched["rel_diff"].abs().max()) if len(diff) else 0.0,
+            "sum_1": float(self.matched["value_1"].sum() + self.only_1[self.value].sum()),
+            "sum_2": float(self.matched["value_2"].sum() + self.only_2[self.value].sum()),
+        }
+
+
+def _as_dataframe(report) -> pd.DataFrame:
+    if isinstance(report, pd.DataFrame):
+        return report
+    if isinstance(report, str):
+        return load_report(report)
+    if isinstance(report, dict):
+        return columns_to_dataframe(report)
+    # ORE InMemoryReport
+    return columns_to_dataframe(report_to_columns(report))
+
+
+def _column_name(df: pd.DataFrame, column: Column) -> str:
+    """Column by position or by name, a name matches with or without the leading '#' of the CSV header."""
+    if isinstance(column, int):
+        return df.columns[column]
+    for name in [column, "#" + column, column.lstrip("#")]:
+        if name in df.columns:
+            return name
+    raise KeyError(f"Column '{column}' not in report, columns are {', '.join(map(str, df.columns))}")
+
+
+def diff_reports(report_1, report_2, keys: Sequence[Column], value: Column, extra_columns: Sequence[Column] = (),
+                 abs_tol: float = 0.0, rel_tol: float = 0.0) -> ReportDiff:
+    """
+    Pair the rows of two reports on keys and compare one value column.
+
+    Args:
+        report_1, report_2: ORE InMemoryReports, DataFrames, column dictionaries or CSV paths.
+        keys (Sequence[Column]): Key columns by name or position, e.g. ["TradeId", "Factor_1"]. Rows with the same
+            key in both reports are paired, a key repeated within a report pairs with every repeat in the other.
+        value (Column): Value column to compare, e.g. "Delta".
+        extra_columns (Sequence[Column]): Columns carried into the result for display, e.g. ["Currency"].
+        abs_tol, rel_tol (float): Tolerances for within_tolerance.
+    """
+    df_1, df_2 = _as_dataframe(report_1), _as_dataframe(report_2)
+    # Names of report 1 label the output, columns of report 2 are taken at the same positions or names.
+    key_names = [_column_name(df_1, k) for k in keys]
+    key_names_2 = [_column_name(df_2, k if isinstance(k, int) else n) for k, n in zip(keys, key_names)]
+    value_name = _column_name(df_1, value)
+    value_name_2 = _column_name(df_2, value if isinstance(value, int) else value_name)
+    extra_names = [_column_name(df_1, c) for c in extra_columns]
+    extra_names_2 = [_column_name(df_2, c if isinstance(c, int) else n) for c, n in zip(extra_columns, extra_names)]
+    labels = [n.lstrip("#") for n in key_names]
+    extra_labels = [n.lstrip("#") for n in extra_names]
+
+    left = pd.DataFrame({"row_1": np.arange(len(df_1))})
+    right = pd.DataFrame({"row_2": np.arange(len(df_2))})
+    for label, name_1, name_2 in zip(labels, key_names, key_names_2):
+        left[label] = df_1[name_1].to_numpy()
+        right[label] = df_2[name_2].to_numpy()
+    for label, name_1, name_2 in zip(extra_labels, extra_names, extra_names_2):
+        left[label] = df_1[name_1].to_numpy()
+        right[label + "_2"] = df_2[name_2].to_numpy()
+    left["value_1"] = pd.to_numeric(df_1[value_name], errors="coerce").to_numpy()
+    right["value_2"] = pd.to_numeric(df_2[value_name_2], errors="coerce").to_numpy()
+
+    joined = left.merge(right, on=labels, how="outer", indicator=True, sort=False)
+    both = joined["_merge"] == "both"
+    matched = joined[both].drop(columns=["_merge"] + [l + "_2" for l in extra_labels])
+    matched = matched.astype({"row_1": np.int64, "row_2": np.int64})
+    matched = matched[["row_1", "row_2"] + labels + extra_labels + ["value_1", "value_2"]].sort_values(["row_2", "row_1"])
+    matched["diff"] = matched["value_1"] - matched["value_2"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        matched["rel_diff"] = np.where(matched["value_2"] != 0, matched["diff"] / matched["value_2"].abs(), np.nan)
+    matched["within_tolerance"] = (matched["diff"].abs() <= abs_tol) | (matched["rel_diff"].abs() <= rel_tol)
+
+    value_label = value_name.lstrip("#")
+    only_1 = joined[joined["_merge"] == "left_only"][["row_1"] + labels + extra_labels + ["value_1"]]
+    only_1 = only_1.astype({"row_1": np.int64}).rename(columns={"value_1": value_label}).sort_values("row_1")
+    only_2 = joined[joined["_merge"] == "right_only"][["row_2"] + labels + [l + "_2" for l in extra_labels] + ["value_2"]]
+    only_2 = only_2.astype({"row_2": np.int64}).rename(columns=dict({"value_2": value_label}, **{l + "_2": l for l in extra_labels}))
+    only_2 = only_2.sort_values("row_2")
+    return ReportDiff(labels, value_label, matched.reset_index(drop=True), only_1.reset_index(drop=True),
+                      only_2.reset_index(drop=True), abs_tol, rel_tol)
+
+
+def diff_sensitivity_reports(report_1, report_2, abs_tol: float = 0.0, rel_tol: float = 0.0) -> ReportDiff:
+    """Compare the Delta of two sensitivity reports per (TradeId, Factor_1)."""
+    return diff_reports(report_1, report_2, ["TradeId", "Factor_1"], "Delta", ["Currency"], abs_tol, rel_tol)
+
+
+def diff_scenario_reports(report_1, report_2, abs_tol: float = 0.0, rel_tol: float = 0.0) -> ReportDiff:
+    """Compare the delta of two scenario reports (e.g. xvacg-cva-sensi-scenario) per (TradeId, Factor, UpDown)."""
+    return diff_reports(report_1, report_2, [0, 1, 2], 7, (), abs_tol, rel_tol)
+
+
+def benchmark_diff(rows: int = 100000, seed: int = 42) -> str:
+    """Time diff_sensitivity_reports on two synthetic sensitivity reports with the given number of rows."""
+    import time
+    rng = np.random.default_rng(seed)
+    trades = np.array([f"Trade_{n}" for n in range(max(rows // 100, 1))])
+    factors = np.array([f"DiscountCurve/EUR/{n}/{n}Y" for n in range(100)])
+    report = pd.DataFrame({"#TradeId": np.repeat(trades, 100)[:rows], "Factor_1": np.tile(factors, len(trades))[:rows],
+                           "Currency": "EUR", "Delta": rng.normal(0, 1000, rows)})
+    other = report.sample(frac=1.0, random_state=seed).iloc[: rows - rows // 100].copy()
+    other["Delta"] += rng.normal(0, 1e-3, len(other))
+    start = time.perf_counter()
+    diff = diff_sensitivity_reports(report, other, abs_tol=1e-2)
+    seconds = time.perf_counter() - start
+    return f"{rows} x {len(other)} rows compared in {seconds:.3f} sec: {diff.summary()}"
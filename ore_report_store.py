@@ -0,0 +1,237 @@
+"""
+In-memory store of the reports of the last ORE run.
+
+The ORE worker hands every report of a run back as typed columns (NumPy arrays) taken straight from
+OREApp.getReport, so the analysis tools do not have to parse the CSV files ORE wrote. Entries are kept
+per output folder and every CSV file is checked against the size and modification time it had when the
+run was published. A file that changed since, or a report that is not in the store, is read from disk.
+load_report gives the same DataFrame either way: the store rounds real columns to the decimals of the
+CSV file, writes dates as ISO strings and turns ORE's null values into NaN, as pd.read_csv does.
+"""
+import os
+import re
+import csv
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# ORE report column types, see PlainInMemoryReport.
+column_type_size, column_type_real, column_type_string, column_type_date, column_type_period = range(5)
+
+# QuantLib date serial number of 1970-01-01, the datetime64 epoch.
+_serial_number_epoch = 25569
+# Null<Real>() and Null<Date>() of QuantLib, written as #N/A in the CSV reports.
+_null_real = float(np.finfo(np.float32).max)
+_null_date = np.datetime64(-_serial_number_epoch, "D")
+_decimal_number = re.compile(r"^[-+]?\d*\.(\d+)$")
+# Strings pd.read_csv reads as NaN by default, e.g. the empty NettingSet of a trade without one.
+_csv_na_values = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN", "<NA>", "N/A",
+                  "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+
+def report_column(report, i: int) -> np.ndarray:
+    """
+    One column of an ORE InMemoryReport as a typed NumPy array.
+
+    Numeric columns are filled straight from the SWIG sequence without building a Python list. Dates are
+    converted through their serial numbers in one vectorised step instead of formatting and parsing ISO
+    strings for every row.
+    """
+    data_type = report.columnType(i)
+    rows = report.rows()
+    if data_type == column_type_size:
+        return np.fromiter(report.dataAsSize(i), dtype=np.int64, count=rows)
+    if data_type == column_type_real:
+        return np.fromiter(report.dataAsReal(i), dtype=np.float64, count=rows)
+    if data_type == column_type_date:
+        serials = np.fromiter((d.serialNumber() for d in report.dataAsDate(i)), dtype=np.int64, count=rows)
+        return (serials - _serial_number_epoch).astype("datetime64[D]")
+    if data_type == column_type_period:
+        return np.array([str(p) for p in report.dataAsPeriod(i)], dtype=object)
+    return np.array(report.dataAsString(i), dtype=object)
+
+
+def report_to_columns(report) -> Dict[str, np.ndarray]:
+    """Convert an ORE InMemoryReport into a dictionary of typed column arrays, keyed by column header."""
+    return {report.header(i): report_column(report, i) for i in range(report.columns())}
+
+
+def columns_to_dataframe(columns: Dict[str, np.ndarray], iso_dates: bool = False) -> pd.DataFrame:
+    """DataFrame over the column arrays without copying them. With iso_dates, date columns become 'YYYY-MM-DD' strings."""
+    if iso_dates:
+        columns = {k: (_iso_strings(v) if v.dtype.kind == "M" else v) for k, v in columns.items()}
+    return pd.DataFrame(columns, copy=False)
+
+
+def _iso_strings(dates: np.ndarray) -> np.ndarray:
+    # Reports repeat a few hundred dates over many rows, format each distinct date once.
+    unique_dates, inverse = np.unique(dates, return_inverse=True)
+    return unique_dates.astype(str).astype(object)[inverse]
+
+
+def csv_decimals(file_path: str, sample_rows: int = 200) -> Dict[str, int]:
+    """
+    Decimals ORE wrote for every fixed-point number column of a CSV report, from its first rows. Columns with
+    numbers in exponent notation are left out.
+    """
+    decimals: Dict[str, int] = {}
+    exponent = set()
+    with open(file_path, "r", newline="") as f:
+        reader = csv.reader(f)
+        header = [name.lstrip("#") for name in next(reader, [])]
+        for n, row in enumerate(reader):
+            if n >= sample_rows:
+                break
+            for name, value in zip(header, row):
+                match = _decimal_number.match(value)
+                if match:
+                    decimals[name] = max(decimals.get(name, 0), len(match.group(1)))
+                elif "e" in value.lower() and value.lower() not in ("nan", "inf", "-inf"):
+                    exponent.add(name)
+    return {name: d for name, d in decimals.items() if name not in exponent}
+
+
+def columns_to_csv_dataframe(columns: Dict[str, np.ndarray], file_path: str) -> pd.DataFrame:
+    """
+    DataFrame of the report columns as pd.read_csv reads the CSV file ORE wrote from them at file_path: the
+    first column name starts with '#', reals are rounded to the decimals of the file, dates are ISO strings
+    and ORE's null values as well as empty strings are NaN.
+    """
+    decimals = csv_decimals(file_path)
+    converted = {}
+    for i, (name, values) in enumerate(columns.items()):
+        if values.dtype.kind == "f":
+            values = np.where(values == _null_real, np.nan, values)
+            if name in decimals:
+                values = np.round(values, decimals[name])
+        elif values.dtype.kind == "M":
+            nulls = values == _null_date
+            values = _iso_strings(values)
+            if nulls.any():
+                values[nulls] = np.nan
+        elif values.dtype == object:
+            nulls = np.isin(values, _csv_na_values)
+            if nulls.any():
+                values = np.where(nulls, np.nan, values)
+        converted["#" + name if i == 0 else name] = values
+    return columns_to_dataframe(converted)
+
+
+def report_to_dataframe(report, iso_dates: bool = False) -> pd.DataFrame:
+    """Convert an ORE InMemoryReport into a DataFrame with typed columns."""
+    return columns_to_dataframe(report_to_columns(report), iso_dates)
+
+
+def columns_to_arrow(columns: Dict[str, np.ndarray]):
+    """pyarrow Table over the column arrays, numeric and date columns are handed over without copying."""
+    if pa is None:
+        raise ImportError("pyarrow is required to convert ORE reports to Arrow tables.")
+    return pa.table({k: pa.array(v) if v.dtype != object else pa.array(v.tolist(), type=pa.string()) for k, v in columns.items()})
+
+
+def report_to_arrow(report):
+    """Convert an ORE InMemoryReport into a pyarrow Table."""
+    return columns_to_arrow(report_to_columns(report))
+
+
+def _csv_header(columns: Dict[str, np.ndarray]) -> str:
+    return "#" + ",".join(columns)
+
+
+def match_report_files(output_dir: str, reports: Dict[str, Dict[str, np.ndarray]], file_names: List[str]) -> Dict[str, str]:
+    """
+    Link every CSV file in file_names to the report it was written from: a report with the same name as
+    the file, otherwise the only remaining report with the same header.
+
+    Returns:
+        Dict[str, str]: Report name by file name, files without a matching report are left out.
+    """
+    matched = {}
+    unmatched = dict(reports)
+    for name in file_names:
+        stem = os.path.splitext(name)[0]
+        if name.endswith(".csv") and stem in unmatched:
+            matched[name] = stem
+            del unmatched[stem]
+    for name in file_names:
+        path = os.path.join(output_dir, name)
+        if name in matched or not name.endswith(".csv") or not os.path.isfile(path):
+            continue
+        with open(path, "r") as f:
+            header = f.readline().rstrip("\r\n")
+        candidates = [r for r, columns in unmatched.items() if _csv_header(columns) == header]
+        if len(candidates) == 1:
+            matched[name] = candidates[0]
+            del unmatched[candidates[0]]
+    return {name: matched[name] for name in file_names if name in matched and os.path.isfile(os.path.join(output_dir, name))}
+
+
+class OreReportStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # output folder -> {"reports": {name: columns}, "files": {file name: (report name, size, mtime)}}
+        self._entries: Dict[str, Dict] = {}
+
+    def put(self, output_dir: str, reports: Dict[str, Dict[str, np.ndarray]], file_names: List[str]) -> None:
+        """Keep the reports of a run whose outputs were just published to output_dir."""
+        files = {}
+        for name, report_name in match_report_files(output_dir, reports, file_names).items():
+            stat = os.stat(os.path.join(output_dir, name))
+            files[name] = (report_name, stat.st_size, stat.st_mtime)
+        with self._lock:
+            self._entries[os.path.abspath(output_dir)] = {"reports": reports, "files": files}
+
+    def invalidate(self, output_dir: str) -> None:
+        with self._lock:
+            self._entries.pop(os.path.abspath(output_dir), None)
+
+    def get_columns(self, file_path: str) -> Optional[Dict[str, np.ndarray]]:
+        """Typed columns of the report written to file_path, or None if the store does not hold the file as it is on disk."""
+        output_dir, name = os.path.split(os.path.abspath(file_path))
+        with self._lock:
+            entry = self._entries.get(output_dir)
+            if entry is None or name not in entry["files"]:
+                return None
+            report_name, size, mtime = entry["files"][name]
+            columns = entry["reports"][report_name]
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        if (stat.st_size, stat.st_mtime) != (size, mtime):
+            return None
+        return columns
+
+    def get_dataframe(self, file_path: str) -> Optional[pd.DataFrame]:
+        """The report as pd.read_csv reads the file ORE wrote: same column names, dtypes and values."""
+        columns = self.get_columns(file_path)
+        if columns is None:
+            return None
+        return columns_to_csv_dataframe(columns, file_path)
+
+
+_store: Optional[OreReportStore] = None
+_store_lock = threading.Lock()
+
+
+def get_ore_report_store() -> OreReportStore:
+    """Return the process-wide store of in-memory ORE reports."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = OreReportStore()
+        return _store
+
+
+def load_report(file_path: str) -> pd.DataFrame:
+    """Report as a DataFrame, from the in-memory store of the last run when possible, otherwise from the CSV file."""
+    df = get_ore_report_store().get_dataframe(file_path)
+    if df is None:
+        df = pd.read_csv(file_path)
+    return df
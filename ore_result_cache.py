@@ -0,0 +1,137 @@
+"""
+Content-addressed cache of ORE results.
+
+The cache key is a hash over ore.xml and the content of every file it references (portfolio, market,
+fixings, curve config, conventions, pricing engines, simulation, sensitivity, stress test, ...). A hit
+restores the Output files and the list of reports without running ORE. Entries are evicted least
+recently used first once the cache grows beyond its disk budget.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from typing import Dict, List, Optional
+from ore_inputs import resolve_ore_input_files
+from config_file import f_path_ore_cache, ore_cache_budget_bytes
+
+
+class OreResultCache:
+    def __init__(self, cache_dir: str = f_path_ore_cache, budget_bytes: int = ore_cache_budget_bytes):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, input_path: str, ore_file: str = "ore.xml", files: Optional[Dict[str, str]] = None) -> str:
+        """
+        Hash of the effective inputs of a run: every referenced file together with the role it plays.
+
+        Args:
+            input_path (str): Input folder that contains ore.xml (e.g. f_path_in).
+            ore_file (str): Name of the ore.xml file inside input_path.
+            files (Optional[Dict[str, str]]): Already resolved input files (e.g. OreSandbox.files), skips resolving input_path.
+        """
+        digest = hashlib.sha256()
+        files = files if files is not None else resolve_ore_input_files(input_path, ore_file)
+        for role, path in sorted(files.items()):
+            digest.update(role.encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        return digest.hexdigest()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _read_meta(self, key: str) -> Optional[Dict]:
+        try:
+            with open(os.path.join(self._entry_dir(key), "meta.json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, key: str, meta: Dict) -> None:
+        tmp_path = os.path.join(self._entry_dir(key), "meta.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self._entry_dir(key), "meta.json"))
+
+    def restore(self, key: str, output_dir: str) -> Optional[List[str]]:
+        """
+        Copy the cached Output files for key into output_dir.
+
+        Returns:
+            Optional[List[str]]: The report names of the cached run, or None on a cache miss.
+        """
+        with self._lock:
+            meta = self._read_meta(key)
+            if meta is None:
+                self.misses += 1
+                return None
+            os.makedirs(output_dir, exist_ok=True)
+            files_dir = os.path.join(self._entry_dir(key), "Output")
+            for name in meta["files"]:
+                shutil.copy2(os.path.join(files_dir, name), os.path.join(output_dir, name))
+            meta["last_access"] = time.time()
+            self._write_meta(key, meta)
+            self.hits += 1
+            return meta["report_names"]
+
+    def store(self, key: str, output_dir: str, report_names: List[str], since: float = 0.0) -> None:
+        """
+        Store the Output files written by a run under key.
+
+        Args:
+            key (str): Cache key computed with `key` before the run.
+            output_dir (str): The run's output folder.
+            report_names (List[str]): Report names returned by ORE.
+            since (float): Only files modified at or after this timestamp (the run start) are stored.
+        """
+        files = [name for name in sorted(os.listdir(output_dir))
+                 if os.path.isfile(os.path.join(output_dir, name)) and os.path.getmtime(os.path.join(output_dir, name)) >= since]
+        with self._lock:
+            entry_dir = self._entry_dir(key)
+            tmp_dir = entry_dir + ".tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(os.path.join(tmp_dir, "Output"))
+            size = 0
+            for name in files:
+                shutil.copy2(os.path.join(output_dir, name), os.path.join(tmp_dir, "Output", name))
+                size += os.path.getsize(os.path.join(output_dir, name))
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            self._write_meta(key, {"report_names": list(report_names), "files": files, "size": size,
+                                   "created": time.time(), "last_access": time.time()})
+            self._evict()
+
+    def _evict(self) -> None:
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            meta = self._read_meta(key)
+            if meta is not None:
+                entries.append((meta["last_access"], meta["size"], key))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.budget_bytes:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+
+_cache: Optional[OreResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ore_result_cache() -> OreResultCache:
+    """Return the process-wide ORE result cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = OreResultCache()
+        return _cache
@@ -0,0 +1,209 @@
+"""
+Run-isolated ORE sandboxes.
+
+A sandbox is a private folder holding a snapshot of every input file of a run and an empty output
+folder. Its ore.xml is rewritten with absolute paths, so ORE can be started from any working directory
+and no process ever has to chdir. Concurrent runs therefore do not see each other's inputs or
+outputs. When a run has finished its outputs are published to the real output folder in one step.
+"""
+import os
+import uuid
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from ore_inputs import input_file_parameters, resolve_ore_input_files, get_setup_parameters, get_output_directory, get_run_directory
+from config_file import f_path_ore_sandbox
+
+source_ore_file = "_source_ore.xml"
+
+_publish_locks: Dict[str, threading.RLock] = {}
+_publish_locks_lock = threading.Lock()
+
+
+def get_publish_lock(output_dir: str) -> threading.RLock:
+    """Lock serialising writes of whole runs into one output folder."""
+    with _publish_locks_lock:
+        return _publish_locks.setdefault(os.path.abspath(output_dir), threading.RLock())
+
+
+class OreSandbox:
+    """
+    Private snapshot of the inputs of one ORE run.
+
+    Attributes:
+        source_path (str): The input folder the snapshot was taken from.
+        input_path (str): Snapshot input folder, holds the rewritten ore.xml.
+        output_dir (str): Private output folder of the run.
+        target_output_dir (str): Output folder of the source inputs, where results are published.
+        files (Dict[str, str]): Input files of the run by role, as resolve_ore_input_files returns them for the
+            source folder but pointing at the snapshot. 'ore.xml' is a copy of the unmodified source ore.xml, so
+            hashes over these files do not depend on where the sandbox lives.
+    """
+
+    def __init__(self, input_path: str, ore_file: str = "ore.xml", root: str = f_path_ore_sandbox):
+        self.source_path = input_path
+        self.root = os.path.abspath(os.path.join(root, uuid.uuid4().hex))
+        self.input_path = os.path.join(self.root, "Input")
+        self.output_dir = os.path.join(self.root, "Output")
+        self.target_output_dir = get_output_directory(input_path, ore_file)
+        os.makedirs(self.input_path)
+        os.makedirs(self.output_dir)
+        try:
+            self.files = self._snapshot(ore_file)
+        except Exception:
+            self.cleanup()
+            raise
+
+    def _snapshot(self, ore_file: str) -> Dict[str, str]:
+        source_files = resolve_ore_input_files(self.source_path, ore_file)
+        ore_xml_path = source_files["ore.xml"]
+        run_dir = get_run_directory(self.source_path)
+        setup = get_setup_parameters(ore_xml_path)
+        source_input_dir = os.path.join(run_dir, setup.get("inputPath", os.path.basename(self.source_path)))
+
+        # Same file referenced twice is copied once, different files with the same name are kept apart.
+        snapshot_names: Dict[str, str] = {}
+        files = {"ore.xml": os.path.join(self.input_path, source_ore_file)}
+        shutil.copyfile(ore_xml_path, files["ore.xml"])
+        for role, path in source_files.items():
+            if role == "ore.xml":
+                continue
+            if role.startswith("xva/"):
+                # Cube and scenario files of a previous simulation are read from the output folder.
+                files[role] = os.path.join(self.output_dir, os.path.basename(path))
+                shutil.copy2(path, files[role])
+                continue
+            if path not in snapshot_names:
+                name = os.path.basename(path)
+                if name in snapshot_names.values() or name in [ore_file, source_ore_file]:
+                    name = f"{len(snapshot_names)}_{name}"
+                snapshot_names[path] = name
+                shutil.copyfile(path, os.path.join(self.input_path, name))
+            files[role] = os.path.join(self.input_path, snapshot_names[path])
+
+        def relocate(value: str) -> str:
+            names = []
+            for name in [v.strip() for v in value.split(",") if v.strip()]:
+                path = os.path.normpath(os.path.join(source_input_dir, name))
+                names.append(snapshot_names.get(path, path))
+            return ",".join(names)
+
+        tree = ET.parse(ore_xml_path)
+        root = tree.getroot()
+        sections = [root.find("Setup")] + (root.find("Analytics").findall("Analytic") if root.find("Analytics") is not None else [])
+        for section in [s for s in sections if s is not None]:
+            for param in section.findall("Parameter"):
+                if param.get("name") in input_file_parameters and (param.text or "").strip():
+                    param.text = relocate(param.text)
+        setup_section = root.find("Setup")
+        for name, value in [("inputPath", self.input_path), ("outputPath", self.output_dir)]:
+            param = setup_section.find(f"Parameter[@name='{name}']")
+            if param is None:
+                param = ET.SubElement(setup_section, "Parameter", name=name)
+            param.text = value
+        tree.write(os.path.join(self.input_path, ore_file), encoding="utf-8", xml_declaration=True)
+        return files
+
+    def publish(self, since: float = 0.0) -> List[str]:
+        """
+        Copy the outputs of the run into the real output folder.
+
+        Args:
+            since (float): Only files modified at or after this timestamp (the run start) are published.
+
+        Returns:
+            List[str]: Names of the published files.
+        """
+        names = [name for name in sorted(os.listdir(self.output_dir))
+                 if os.path.isfile(os.path.join(self.output_dir, name)) and os.path.getmtime(os.path.join(self.output_dir, name)) >= since]
+        with get_publish_lock(self.target_output_dir):
+            os.makedirs(self.target_output_dir, exist_ok=True)
+            for name in names:
+                tmp_path = os.path.join(self.target_output_dir, f".{name}.{os.getpid()}.tmp")
+                shutil.copy2(os.path.join(self.output_dir, name), tmp_path)
+                os.replace(tmp_path, os.path.join(self.target_output_dir, name))
+        return names
+
+    def cleanup(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __enter__(self) -> "OreSandbox":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.cleanup()
+
+
+def stress_test_sandboxes(input_path: str, n_runs: int = 8) -> str:
+    """
+    Run n_runs ORE runs at once, each in its own sandbox, and check that they did not interfere.
+
+    Every sandbox prices one trade of the portfolio under a trade id tagged with its run number. A run
+    passes if its npv.csv holds exactly its own tagged trade, and the source input and output folders
+    are left untouched.
+
+    Returns:
+        str: One line per run and an overall verdict.
+    """
+    from ore_worker_pool import OreWorkerPool
+
+    def folder_state(path):
+        return {n: os.path.getmtime(os.path.join(path, n)) for n in os.listdir(path)} if os.path.isdir(path) else {}
+
+    sandboxes = [OreSandbox(input_path) for _ in range(n_runs)]
+    before = (folder_state(input_path), folder_state(sandboxes[0].target_output_dir))
+    pool = OreWorkerPool(size=n_runs)
+    try:
+        for i, sandbox in enumerate(sandboxes):
+            portfolio_path = sandbox.files["Setup/portfolioFile"]
+            tree = ET.parse(portfolio_path)
+            trades = tree.getroot().findall("Trade")
+            keep = trades[i % len(trades)]
+            for trade in trades:
+                if trade is not keep:
+                    tree.getroot().remove(trade)
+            keep.set("id", f"{keep.get('id')}_run{i}")
+            tree.write(portfolio_path, encoding="utf-8", xml_declaration=True)
+
+        with ThreadPoolExecutor(max_workers=n_runs) as executor:
+            futures = [executor.submit(pool.run, s.input_path) for s in sandboxes]
+            errors = []
+            for f in futures:
+                try:
+                    f.result()
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(str(e))
+
+        lines = []
+        passed = True
+        for i, sandbox in enumerate(sandboxes):
+            npv_path = os.path.join(sandbox.output_dir, "npv.csv")
+            if errors[i] is not None:
+                ok, detail = False, errors[i]
+            elif not os.path.isfile(npv_path):
+                ok, detail = False, "no npv.csv written"
+            else:
+                with open(npv_path, "r") as f:
+                    trade_ids = [line.split(",", 1)[0] for line in f.read().splitlines()[1:] if line]
+                ok = len(trade_ids) == 1 and trade_ids[0].endswith(f"_run{i}")
+                detail = ", ".join(trade_ids)
+            passed = passed and ok
+            lines.append(f"run {i}: {'ok' if ok else 'FAILED'} ({detail})")
+        after = (folder_state(input_path), folder_state(sandboxes[0].target_output_dir))
+        if after != before:
+            passed = False
+            lines.append("source input or output folder was modified")
+        lines.append(f"{n_runs} concurrent sandboxed runs: {'passed' if passed else 'FAILED'}")
+        return "\n".join(lines)
+    finally:
+        pool.shutdown()
+        for sandbox in sandboxes:
+            sandbox.cleanup()
+
+
+if __name__ == "__main__":
+    from config_file import f_path_in
+    print(stress_test_sandboxes(f_path_in))
@@ -0,0 +1,117 @@
+"""
+Indexed reader for the simulation scenario data (scenariodata.csv.gz).
+
+The file is decompressed and parsed once into a float64 array of shape (dates, samples, keys), which
+is saved next to it as scenariodata.bin, in the binary cube format of ore_cube_binary (also written by
+export_binary_cubes after a run). Later reads memory-map that file, so a slice for one key or one date
+only touches that slice and the gzip file is not read again. The binary file is rebuilt when the size or
+modification time of the source file changes.
+"""
+import os
+import gzip
+import threading
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+
+def read_scenario_header(path: str) -> Dict:
+    """Parse the '#' header of scenariodata.csv.gz: dimDates, dimSamples, keys and the key descriptions."""
+    meta: Dict = {"key_names": []}
+    with gzip.open(path, "rt") as f:
+        for line in f:
+            if not line.startswith("#"):
+                break
+            text = line[1:].strip()
+            if ":" in text:
+                key, value = [t.strip() for t in text.split(":", 1)]
+                meta[key] = int(value) if value.isdigit() else value
+            elif text and not text.startswith("date,"):
+                meta["key_names"].append(text.rstrip(","))
+    return meta
+
+
+class ScenarioData:
+    """
+    Attributes:
+        values (np.ndarray): Scenario values of shape (dates, samples, keys), possibly memory-mapped.
+            values[d - 1] holds date index d of the file, which starts at 1 (there is no T0).
+        key_names (List[str]): Key descriptions from the file header.
+    """
+
+    def __init__(self, values: np.ndarray, key_names: Optional[List[str]] = None):
+        self.values = values
+        self.key_names = key_names or []
+
+    @property
+    def num_dates(self) -> int:
+        return self.values.shape[0]
+
+    @property
+    def num_samples(self) -> int:
+        return self.values.shape[1]
+
+    @property
+    def num_keys(self) -> int:
+        return self.values.shape[2]
+
+    def states(self, key: int, date_index: int) -> np.ndarray:
+        """Value of one key in every sample at one date index (1-based as in the file), shape (samples,)."""
+        return np.asarray(self.values[date_index - 1, :, key])
+
+    def paths(self, key: int, samples: Union[slice, Sequence[int]] = slice(None), t0: Optional[float] = None) -> np.ndarray:
+        """
+        Paths of one key, shape (dates, selected samples).
+
+        Args:
+            t0 (Optional[float]): If given, a first row with this value (e.g. today's fixing) is prepended, so
+                row n is date index n.
+        """
+        paths = np.asarray(self.values[:, samples, key])
+        if t0 is not None:
+            paths = np.vstack([np.full((1, paths.shape[1]), t0), paths])
+        return paths
+
+    @classmethod
+    def from_csv_gz(cls, path: str) -> "ScenarioData":
+        """Decompress and parse scenariodata.csv.gz in a single pass."""
+        meta = read_scenario_header(path)
+        df = pd.read_csv(path, comment="#", header=None, names=["date", "sample", "key", "value"],
+                         dtype={"date": np.int64, "sample": np.int64, "key": np.int64, "value": np.float64})
+        date, sample, key = df["date"].to_numpy(), df["sample"].to_numpy(), df["key"].to_numpy()
+        shape = (max(meta.get("dimDates", 0), int(date.max()) if len(df) else 0),
+                 max(meta.get("dimSamples", 0), int(sample.max()) + 1 if len(df) else 0),
+                 max(meta.get("keys", 0), int(key.max()) + 1 if len(df) else 0))
+        values = np.zeros(shape)
+        values[date - 1, sample, key] = df["value"].to_numpy()
+        return cls(values, meta["key_names"])
+
+
+_open_files: Dict[str, Tuple[Dict, ScenarioData]] = {}
+_open_files_lock = threading.Lock()
+
+
+def load_scenario_data(path: str) -> ScenarioData:
+    """
+    ScenarioData for a scenariodata.csv.gz, from the memory-mapped scenariodata.bin when it is current.
+
+    The gzip file is only parsed when there is no current binary file, which is then written for the next call.
+    """
+    from ore_cube_binary import source_signature, binary_path, binary_file_current, read_scenario_data, write_scenario_data
+    key = os.path.abspath(path)
+    signature = source_signature(path)
+    with _open_files_lock:
+        if key in _open_files and _open_files[key][0] == signature:
+            return _open_files[key][1]
+        if binary_file_current(path):
+            data = read_scenario_data(binary_path(path))
+        else:
+            data = ScenarioData.from_csv_gz(path)
+            try:
+                write_scenario_data(binary_path(path), data, path)
+                data = read_scenario_data(binary_path(path))
+            except OSError:
+                # Read-only output folder, keep the parsed array in memory only.
+                pass
+        _open_files[key] = (signature, data)
+        return data
@@ -0,0 +1,190 @@
+"""
+Sharded ORE runs for trade-level analytics.
+
+The portfolio is split into balanced shards, using the trade timings of the last pricingstats.csv as
+weights (longest processing time first). Every shard is priced by its own ORE worker process and the
+per-trade reports are merged back into one Output folder. Analytics that aggregate over netting sets
+or the whole portfolio (simulation, xva, VaR, ...) cannot be merged from shards and are refused.
+"""
+import os
+import heapq
+import atexit
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from ore_inputs import get_active_analytics
+from ore_sandbox import OreSandbox
+from ore_worker_pool import OreWorkerPool, OreRunResult
+from ore_incremental import trade_fingerprints, read_trade_report, write_trade_report
+from config_file import ore_shard_count
+
+# Analytics whose reports are per-trade rows or do not depend on the portfolio.
+shardable_analytics = ["npv", "cashflow", "sensitivity", "stress", "curves", "additionalResults", "todaysMarketCalibration"]
+
+shard_ore_file = "_ore_shard_{}.xml"
+shard_portfolio_file = "_portfolio_shard_{}.xml"
+
+
+class ShardedRunResult(OreRunResult):
+    def __init__(self, results: List[OreRunResult], shards: List[List[str]]):
+        super().__init__(results[0].report_names, max(r.run_time for r in results), [e for r in results for e in r.errors],
+                         all(r.warm for r in results), sum(r.saved_seconds for r in results))
+        self.shards = shards
+
+
+def check_shardable(input_path: str) -> None:
+    """Raise ValueError if an active analytic needs the whole portfolio or its netting sets in one run."""
+    analytics = get_active_analytics(os.path.join(input_path, "ore.xml"))
+    refused = sorted(set(analytics) - set(shardable_analytics))
+    if refused:
+        raise ValueError(f"Sharded runs support only trade-level analytics ({', '.join(shardable_analytics)}). "
+                         f"Deactivate {', '.join(refused)} or run without sharding, these analytics aggregate over netting sets or the portfolio.")
+
+
+def trade_weights(output_dir: str, trade_types: Dict[str, str]) -> Dict[str, float]:
+    """
+    Pricing time of every trade from the pricingstats.csv of the last run.
+
+    Trades without timings get the mean timing of their trade type, or the overall mean.
+    """
+    timings: Dict[str, float] = {}
+    path = os.path.join(output_dir, "pricingstats.csv")
+    if os.path.isfile(path):
+        report = read_trade_report(path)
+        columns = report[0].lstrip("#").strip().split(",")
+        timing_col = columns.index("CumulativeTiming")
+        for trade_id, lines in report[1].items():
+            timings[trade_id] = sum(float(line.rstrip("\r\n").split(",")[timing_col]) for line in lines)
+
+    by_type: Dict[str, List[float]] = {}
+    for trade_id, timing in timings.items():
+        if trade_id in trade_types:
+            by_type.setdefault(trade_types[trade_id], []).append(timing)
+    overall = sum(timings.values()) / len(timings) if timings else 1.0
+    weights = {}
+    for trade_id, trade_type in trade_types.items():
+        if trade_id in timings:
+            weights[trade_id] = timings[trade_id]
+        elif trade_type in by_type:
+            weights[trade_id] = sum(by_type[trade_type]) / len(by_type[trade_type])
+        else:
+            weights[trade_id] = overall
+    return weights
+
+
+def balance_shards(weights: Dict[str, float], n_shards: int) -> List[List[str]]:
+    """Assign trades to n_shards shards, heaviest first to the currently lightest shard."""
+    heap = [(0.0, i) for i in range(min(n_shards, len(weights)))]
+    shards: List[List[str]] = [[] for _ in heap]
+    for trade_id in sorted(weights, key=lambda t: (-weights[t], t)):
+        load, i = heapq.heappop(heap)
+        shards[i].append(trade_id)
+        heapq.heappush(heap, (load + weights[trade_id], i))
+    return [sorted(s) for s in shards]
+
+
+def _write_shard_inputs(input_path: str, i: int, trades: List[ET.Element], shard_output: str) -> None:
+    portfolio = ET.Element("Portfolio")
+    portfolio.extend(trades)
+    ET.ElementTree(portfolio).write(os.path.join(input_path, shard_portfolio_file.format(i)), encoding="utf-8", xml_declaration=True)
+    tree = ET.parse(os.path.join(input_path, "ore.xml"))
+    setup = tree.getroot().find("Setup")
+    setup.find("Parameter[@name='portfolioFile']").text = shard_portfolio_file.format(i)
+    setup.find("Parameter[@name='outputPath']").text = shard_output
+    # One process per shard already uses the cores, avoid oversubscribing them with ORE's own threads.
+    threads = setup.find("Parameter[@name='nThreads']")
+    if threads is None:
+        threads = ET.SubElement(setup, "Parameter", name="nThreads")
+    threads.text = "1"
+    tree.write(os.path.join(input_path, shard_ore_file.format(i)), encoding="utf-8", xml_declaration=True)
+
+
+def merge_shard_outputs(shard_dirs: List[str], output_dir: str) -> None:
+    """Concatenate per-trade reports of all shards, other files are taken from the first shard."""
+    os.makedirs(output_dir, exist_ok=True)
+    merged: Dict[str, Tuple[str, Dict[str, List[str]]]] = {}
+    for n, shard_dir in enumerate(shard_dirs):
+        for name in sorted(os.listdir(shard_dir)):
+            path = os.path.join(shard_dir, name)
+            report = read_trade_report(path) if name.endswith(".csv") else None
+            if report is not None:
+                header, rows = merged.setdefault(name, (report[0], {}))
+                rows.update(report[1])
+            elif n == 0:
+                shutil.copy2(path, os.path.join(output_dir, name))
+    for name, (header, rows) in merged.items():
+        write_trade_report(os.path.join(output_dir, name), header, rows)
+
+
+def run_sharded(sandbox: OreSandbox, pool: Optional[OreWorkerPool] = None, n_shards: int = ore_shard_count,
+                token: Optional[str] = None) -> ShardedRunResult:
+    """
+    Run ORE on n_shards balanced parts of the portfolio in parallel and merge the reports.
+
+    Args:
+        sandbox (OreSandbox): Snapshot of the run's inputs, the merged reports are written to its output folder.
+        pool (Optional[OreWorkerPool]): Pool the shards run on, defaults to the shard pool.
+        n_shards (int): Number of shards.
+        token (Optional[str]): Passed on to the pool so all shards can be cancelled together.
+
+    Returns:
+        ShardedRunResult: Combined result with the trade ids of every shard.
+    """
+    check_shardable(sandbox.input_path)
+    pool = pool or get_ore_shard_pool()
+    portfolio_roles = sorted(role for role in sandbox.files if role.split("#")[0] == "Setup/portfolioFile")
+    _, elements = trade_fingerprints([sandbox.files[r] for r in portfolio_roles])
+    trade_types = {t: (e.findtext("TradeType") or "").strip() for t, e in elements.items()}
+    # Timings of the last published run of these inputs.
+    shards = balance_shards(trade_weights(sandbox.target_output_dir, trade_types), n_shards)
+    if len(shards) < 2:
+        raise ValueError("The portfolio has too few trades to be sharded.")
+
+    shard_dirs = [os.path.join(sandbox.root, os.path.basename(sandbox.output_dir) + f"_shard_{i}") for i in range(len(shards))]
+    try:
+        for i, trades in enumerate(shards):
+            os.makedirs(shard_dirs[i])
+            _write_shard_inputs(sandbox.input_path, i, [elements[t] for t in trades], shard_dirs[i])
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(pool.run, sandbox.input_path, shard_ore_file.format(i), token) for i in range(len(shards))]
+            results = [f.result() for f in futures]
+        merge_shard_outputs(shard_dirs, sandbox.output_dir)
+    finally:
+        for i in range(len(shards)):
+            for name in [shard_ore_file.format(i), shard_portfolio_file.format(i)]:
+                if os.path.exists(os.path.join(sandbox.input_path, name)):
+                    os.remove(os.path.join(sandbox.input_path, name))
+            shutil.rmtree(shard_dirs[i], ignore_errors=True)
+    return ShardedRunResult(results, shards)
+
+
+_shard_pool: Optional[OreWorkerPool] = None
+_shard_pool_lock = threading.Lock()
+
+
+def get_ore_shard_pool() -> OreWorkerPool:
+    """Return the worker pool used for sharded runs, one warm worker per shard."""
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = OreWorkerPool(size=ore_shard_count)
+            atexit.register(_shard_pool.shutdown)
+        return _shard_pool
+
+
+def check_balance_shards(portfolio_paths: Optional[List[str]] = None, n_shards: int = 2) -> str:
+    """Check that the shards of portfolios with composite trades hold every top-level trade exactly once."""
+    portfolio_paths = portfolio_paths or [os.path.join("Examples", name, "Input", "portfolio.xml") for name in ["Example_1", "Example_47"]]
+    _, elements = trade_fingerprints(portfolio_paths)
+    trade_types = {t: (e.findtext("TradeType") or "").strip() for t, e in elements.items()}
+    shards = balance_shards(trade_weights("", trade_types), n_shards)
+    assigned = [t for shard in shards for t in shard]
+    passed = None not in assigned and sorted(assigned) == sorted(elements)
+    return f"{len(assigned)} trades in shards of {', '.join(str(len(s)) for s in shards)} " \
+           f"({', '.join(sorted(set(trade_types.values())))}): {'passed' if passed else 'FAILED'}"
+
+
+if __name__ == "__main__":
+    print(check_balance_shards())
@@ -0,0 +1,241 @@
+"""
+Pool of long-lived ORE worker processes.
+
+Starting ORE from scratch means loading the ORE library and reading the market and fixing files
+(several hundred KB of text) before anything is priced. A warm worker keeps the ORE module imported
+and the market/fixing data loaded, so repeated runs in one session only pay for the analytics.
+A worker is recycled when the market data or static configuration of a run changes.
+"""
+import os
+import time
+import atexit
+import threading
+import multiprocessing as mp
+from typing import Dict, List, Optional, Set
+from ore_inputs import resolve_ore_input_files, static_inputs_fingerprint
+from config_file import ore_worker_pool_size
+
+
+class OreRunResult:
+    def __init__(self, report_names: List[str], run_time: float, errors: List[str], warm: bool, saved_seconds: float,
+                 reports: Optional[Dict[str, Dict]] = None):
+        self.report_names = report_names
+        self.run_time = run_time
+        self.errors = errors
+        self.warm = warm
+        self.saved_seconds = saved_seconds
+        # Typed report columns by report name, when requested from the worker.
+        self.reports = reports
+
+
+def _read_lines(path: Optional[str]) -> List[str]:
+    if path is None:
+        return []
+    with open(path, "r") as f:
+        return f.read().splitlines()
+
+
+def _worker_main(conn) -> None:
+    """Worker loop: load ORE once, keep market/fixings for the current static inputs and serve run requests."""
+    import ORE
+    from ore_report_store import report_to_columns
+    static_key = None
+    market_data = fixing_data = None
+    load_seconds = 0.0
+
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        try:
+            warm = task["static_key"] == static_key
+            if not warm:
+                start = time.time()
+                static_key = None
+                market_data = ORE.StrVector(_read_lines(task["market_file"]))
+                fixing_data = ORE.StrVector(_read_lines(task["fixing_file"]))
+                load_seconds = time.time() - start
+                static_key = task["static_key"]
+            params = ORE.Parameters()
+            params.fromFile(task["ore_file"])
+            app = ORE.OREApp(params, True)
+            app.run(market_data, fixing_data)
+            report_names = list(app.getReportNames())
+            reports = {name: report_to_columns(app.getReport(name)) for name in report_names} if task["collect_reports"] else None
+            conn.send({
+                "report_names": report_names,
+                "reports": reports,
+                "run_time": app.getRunTime(),
+                "errors": list(app.getErrors()),
+                "warm": warm,
+                "static_key": static_key,
+                "load_seconds": load_seconds,
+            })
+        except Exception as e:
+            conn.send({"exception": str(e), "static_key": static_key, "load_seconds": load_seconds})
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        self.static_key = None
+        self.load_seconds = 0.0
+        self.busy = False
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class OreWorkerPool:
+    """
+    Fixed-size pool of warm ORE worker processes.
+
+    Runs are routed to an idle worker whose loaded market matches the run's static inputs. If no such
+    worker is idle, an unused worker is taken, or an idle worker holding other inputs is recycled.
+    """
+
+    def __init__(self, size: int = ore_worker_pool_size):
+        self._ctx = mp.get_context("spawn")
+        self._size = max(1, size)
+        self._workers: List[_Worker] = []
+        self._cond = threading.Condition()
+        self._running: Dict[str, List[_Worker]] = {}
+        self._cancelled: Set[str] = set()
+        self.saved_seconds = 0.0
+
+    def _acquire(self, static_key: str, token: Optional[str] = None) -> _Worker:
+        with self._cond:
+            while True:
+                if token in self._cancelled:
+                    raise RuntimeError("ORE run cancelled before it started.")
+                # An idle worker whose process died (crashed, killed) would hold its pool slot forever.
+                for dead in [w for w in self._workers if not w.busy and not w.process.is_alive()]:
+                    self._workers.remove(dead)
+                    dead.stop()
+                idle = [w for w in self._workers if not w.busy]
+                worker = next((w for w in idle if w.static_key == static_key), None)
+                if worker is None:
+                    worker = next((w for w in idle if w.static_key is None), None)
+                if worker is None and len(self._workers) < self._size:
+                    worker = _Worker(self._ctx)
+                    self._workers.append(worker)
+                if worker is None and idle:
+                    # Recycle a worker whose market/configuration is stale for this run.
+                    stale = idle[0]
+                    self._workers.remove(stale)
+                    stale.stop()
+                    worker = _Worker(self._ctx)
+                    self._workers.append(worker)
+                if worker is not None:
+                    worker.busy = True
+                    if token is not None:
+                        self._running.setdefault(token, []).append(worker)
+                    return worker
+                self._cond.wait()
+
+    def _release(self, worker: _Worker, response: Optional[Dict]) -> None:
+        with self._cond:
+            worker.busy = False
+            if response is None or not worker.process.is_alive():
+                self._workers.remove(worker)
+                worker.stop()
+            else:
+                worker.static_key = response["static_key"]
+                worker.load_seconds = response["load_seconds"]
+            self._cond.notify_all()
+
+    def run(self, input_path: str, ore_file: str = "ore.xml", token: Optional[str] = None, collect_reports: bool = False) -> OreRunResult:
+        """
+        Run ORE for the ore.xml in input_path on a warm worker.
+
+        Args:
+            input_path (str): Input folder that contains ore.xml with absolute paths (e.g. OreSandbox.input_path),
+                the worker does not change its working directory.
+            ore_file (str): Name of the ore.xml file inside input_path.
+            token (Optional[str]): Identifies the run so it can be stopped with `cancel`.
+            collect_reports (bool): Also return the content of every report as typed columns.
+
+        Returns:
+            OreRunResult: Report names, ORE run time, errors and the startup time saved by the warm path.
+        """
+        files = resolve_ore_input_files(input_path, ore_file)
+        static_key = static_inputs_fingerprint(input_path, ore_file)
+        task = {
+            "ore_file": os.path.abspath(os.path.join(input_path, ore_file)),
+            "static_key": static_key,
+            "market_file": files.get("Setup/marketDataFile"),
+            "fixing_file": files.get("Setup/fixingDataFile"),
+            "collect_reports": collect_reports,
+        }
+        worker = self._acquire(static_key, token)
+        response = None
+        try:
+            worker.conn.send(task)
+            response = worker.conn.recv()
+        except EOFError:
+            raise RuntimeError("ORE worker stopped before the run finished (cancelled or crashed).")
+        finally:
+            if token is not None:
+                with self._cond:
+                    self._running[token].remove(worker)
+                    if not self._running[token]:
+                        del self._running[token]
+            self._release(worker, response)
+        if "exception" in response:
+            raise RuntimeError(response["exception"])
+
+        # A warm run skips reading and splitting the market and fixing files.
+        saved = response["load_seconds"] if response["warm"] else 0.0
+        with self._cond:
+            self.saved_seconds += saved
+        return OreRunResult(response["report_names"], response["run_time"], response["errors"], response["warm"], saved, response["reports"])
+
+    def cancel(self, token: str) -> bool:
+        """
+        Stop the workers executing runs identified by token, runs of token that have not started yet fail
+        without running ORE. Workers are replaced on next use.
+
+        Returns:
+            bool: True if a running worker was stopped.
+        """
+        with self._cond:
+            self._cancelled.add(token)
+            workers = list(self._running.get(token, []))
+            # wake up runs of token waiting for a worker
+            self._cond.notify_all()
+        for worker in workers:
+            worker.process.terminate()
+        return len(workers) > 0
+
+    def forget(self, token: str) -> None:
+        """Drop the cancellation of token once no more runs of it will be submitted."""
+        with self._cond:
+            self._cancelled.discard(token)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            for worker in self._workers:
+                worker.stop()
+            self._workers = []
+
+
+_pool: Optional[OreWorkerPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_ore_worker_pool() -> OreWorkerPool:
+    """Return the process-wide ORE worker pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OreWorkerPool()
+            atexit.register(_pool.shutdown)
+        return _pool
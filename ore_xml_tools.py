@@ -1,9 +1,11 @@
 from langchain.tools import tool
 import xml.etree.ElementTree as ET
 import ore_analytics_snippets as ore_snippet
-from typing import Tuple, List, Literal
-from llm_manager import llm
+from typing import Tuple, List, Dict, Literal
+from llm_manager import llm, cached_llm
 from config_file import f_path_in
+from xml_document_cache import parse_xml
+from xml_edit_session import XmlEditSession, XmlEditError, edit_xml
 import os
 
 
@@ -16,7 +18,7 @@ def list_analytics() -> Tuple[str, List[str]]:
         Tuple[str, List[str]]: A tuple containing a comma-separated string of analytic types and a list of analytic types.
     """
     try:
-        root = ET.parse(os.path.join(f_path_in, 'ore.xml')).getroot()
+        root = parse_xml(os.path.join(f_path_in, 'ore.xml')).getroot()
         analytics_section = root.find("Analytics")
         if analytics_section is None:
             return "Analytics section not found.", []
@@ -38,7 +40,7 @@ def get_analytic_parameters(analytic_type: Literal[*list(ore_snippet.ore_analyti
         str: A string representation of the parameters and their values.
     """
     try:
-        tree = ET.parse(os.path.join(f_path_in, 'ore.xml'))
+        tree = parse_xml(os.path.join(f_path_in, 'ore.xml'))
         root = tree.getroot()
         analytics_section = root.find("Analytics")
         if analytics_section is None:
@@ -66,7 +68,7 @@ def get_output_file_name_from_analytic_parameters(analytic_type: Literal[*list(o
         str: The output file name.
     """
     try:
-        tree = ET.parse(os.path.join(f_path_in, 'ore.xml'))
+        tree = parse_xml(os.path.join(f_path_in, 'ore.xml'))
         root = tree.getroot()
         analytics_section = root.find("Analytics")
         if analytics_section is None:
@@ -78,13 +80,56 @@ def get_output_file_name_from_analytic_parameters(analytic_type: Literal[*list(o
         param_dict = {param.get("name"): param.text for param in params if param.get("name")}
         class outputFileName(BaseModel):
             outputFileName: str = Field(str, description="Output file name")
-        file_name = llm.with_structured_output(outputFileName).invoke(f"Here is the content of an ore.xml file:\n{str(param_dict)}\n\nPlease provide a name of output file as answer:")
+        file_name = cached_llm.with_structured_output(outputFileName).invoke(f"Here is the content of an ore.xml file:\n{str(param_dict)}\n\nPlease provide a name of output file as answer:",
+                                                                            files=[os.path.join(f_path_in, 'ore.xml')])
         return file_name.outputFileName
     except ET.ParseError:
         return "Error parsing XML file."
     except FileNotFoundError:
         return "File not found."
        
+def _analytic(root: ET.Element, analytic_type: str) -> ET.Element:
+    analytics_section = root.find("Analytics")
+    if analytics_section is None:
+        raise XmlEditError("Analytics section not found.")
+    analytic_elem = analytics_section.find(f"Analytic[@type='{analytic_type}']")
+    if analytic_elem is None:
+        raise XmlEditError(f"Analytic '{analytic_type}' not found.")
+    return analytic_elem
+
+def _set_analytic_active(root: ET.Element, analytic_type: str, active: str) -> str:
+    if active not in ['Y', 'N']:
+        raise XmlEditError("Invalid value for active. Must be 'Y' or 'N'.")
+    analytic_elem = _analytic(root, analytic_type)
+    active_param = analytic_elem.find("Parameter[@name='active']")
+    if active_param is not None:
+        active_param.text = active
+    else:
+        ET.SubElement(analytic_elem, "Parameter", name="active").text = active
+    return f"Analytic '{analytic_type}' set to active='{active}'."
+
+def _add_analytic(root: ET.Element, analytic_type: str) -> str:
+    analytics_section = root.find("Analytics")
+    if analytics_section is None:
+        raise XmlEditError("Analytics section not found.")
+    if analytics_section.find(f"Analytic[@type='{analytic_type}']") is not None:
+        raise XmlEditError(f"Analytic '{analytic_type}' already exists.")
+    new_analytic = ore_snippet.ore_analytics.get(analytic_type)
+    if new_analytic is None:
+        raise XmlEditError(f"Invalid analytic type: '{analytic_type}'.")
+    analytics_section.append(ET.fromstring(new_analytic))
+    return f"Added new analytic '{analytic_type}' with active='Y'."
+
+def _remove_analytic(root: ET.Element, analytic_type: str) -> str:
+    root.find("Analytics").remove(_analytic(root, analytic_type))
+    return f"Removed analytic '{analytic_type}'."
+
+analytic_edit_actions = {"set_active": _set_analytic_active, "add": _add_analytic, "remove": _remove_analytic}
+
+def _validate_analytics(root: ET.Element) -> List[str]:
+    types = [analytic.get("type") for analytic in root.iter("Analytic")]
+    return [f"Analytic '{t}' is defined more than once." for t in sorted(set(types)) if types.count(t) > 1]
+
 @tool(response_format="content")
 def set_analytic_active(analytic_type: Literal[*list(ore_snippet.ore_analytics.keys())], active: str) -> str:
     """
@@ -97,25 +142,12 @@ def set_analytic_active(analytic_type: Literal[*list(ore_snippet.ore_analytics.k
     Returns:
         str: A confirmation message indicating success or failure.
     """
-    if active not in ['Y', 'N']:
-        return "Invalid value for active. Must be 'Y' or 'N'."
     try:
         ore_path = os.path.join(f_path_in, 'ore.xml')
-        tree = ET.parse(ore_path)
-        root = tree.getroot()
-        analytics_section = root.find("Analytics")
-        if analytics_section is None:
-            return "Analytics section not found."
-        analytic_elem = analytics_section.find(f"Analytic[@type='{analytic_type}']")
-        if analytic_elem is None:
-            return f"Analytic '{analytic_type}' not found."
-        active_param = analytic_elem.find("Parameter[@name='active']")
-        if active_param is not None:
-            active_param.text = active
-        else:
-            ET.SubElement(analytic_elem, "Parameter", name="active").text = active
-        tree.write(ore_path)
-        return f"Analytic '{analytic_type}' set to active='{active}'. saved results to {ore_path}"
+        message = edit_xml(ore_path, lambda root: _set_analytic_active(root, analytic_type, active), _validate_analytics)
+        return f"{message} saved results to {ore_path}"
+    except XmlEditError as e:
+        return str(e)
     except ET.ParseError:
         return "Error parsing XML file."
     except FileNotFoundError:
@@ -134,19 +166,10 @@ def add_analytic(analytic_type: Literal[*list(ore_snippet.ore_analytics.keys())]
     """
     try:
         ore_path = os.path.join(f_path_in, 'ore.xml')
-        tree = ET.parse(ore_path)
-        root = tree.getroot()
-        analytics_section = root.find("Analytics")
-        if analytics_section is None:
-            return "Analytics section not found."
-        if analytics_section.find(f"Analytic[@type='{analytic_type}']") is not None:
-            return f"Analytic '{analytic_type}' already exists."
-        new_analytic = ore_snippet.ore_analytics.get(analytic_type)
-        if new_analytic is None:
-            return f"Invalid analytic type: '{analytic_type}'."
-        analytics_section.append(ET.fromstring(new_analytic))
-        tree.write(ore_path)
-        return f"Added new analytic '{analytic_type}' with active='Y'. saved results to {ore_path}"
+        message = edit_xml(ore_path, lambda root: _add_analytic(root, analytic_type), _validate_analytics)
+        return f"{message} saved results to {ore_path}"
+    except XmlEditError as e:
+        return str(e)
     except ET.ParseError:
         return "Error parsing XML file."
     except FileNotFoundError:
@@ -165,18 +188,39 @@ def remove_analytic(analytic_type: Literal[*list(ore_snippet.ore_analytics.keys(
     """
     try:
         ore_path = os.path.join(f_path_in, 'ore.xml')
-        root = ET.parse(ore_path).getroot()
-        analytics_section = root.find("Analytics")
-        if analytics_section is None:
-            return "Analytics section not found."
-        analytic_elem = analytics_section.find(f"Analytic[@type='{analytic_type}']")
-        if analytic_elem is not None:
-            analytics_section.remove(analytic_elem)
-            tree = ET.ElementTree(root)
-            tree.write(ore_path)
-            return f"Removed analytic '{analytic_type}'. saved results to {ore_path}"
-        else:
-            return f"Analytic '{analytic_type}' not found."
+        message = edit_xml(ore_path, lambda root: _remove_analytic(root, analytic_type), _validate_analytics)
+        return f"{message} saved results to {ore_path}"
+    except XmlEditError as e:
+        return str(e)
+    except ET.ParseError:
+        return "Error parsing XML file."
+    except FileNotFoundError:
+        return "File not found."
+
+@tool(response_format="content")
+def edit_analytics(edits: List[Dict[str, str]]) -> str:
+    """
+    Apply several analytic edits to the ore.xml file in one go. The edits are applied in order and saved
+    together; if one of them fails, none is saved. Prefer this over repeated calls of set_analytic_active,
+    add_analytic and remove_analytic.
+
+    Args:
+        edits (List[Dict[str, str]]): The edits, each one of
+            {"action": "set_active", "analytic_type": "npv", "active": "Y"},
+            {"action": "add", "analytic_type": "cashflow"},
+            {"action": "remove", "analytic_type": "curves"}.
+
+    Returns:
+        str: One confirmation line per edit, or the reason why no edit was saved.
+    """
+    try:
+        ore_path = os.path.join(f_path_in, 'ore.xml')
+        session = XmlEditSession(ore_path, _validate_analytics)
+        session.queue_edits(edits, analytic_edit_actions)
+        messages = session.commit()
+        return "\n".join(messages + [f"saved results to {ore_path}"])
+    except XmlEditError as e:
+        return str(e)
     except ET.ParseError:
         return "Error parsing XML file."
     except FileNotFoundError:
@@ -191,7 +235,7 @@ def list_active_analytics() -> Tuple[str, List[str]]:
         Tuple[str, List[str]]: A tuple containing a comma-separated string of active analytic types and a list of active analytic types.
     """
     try:
-        root = ET.parse(os.path.join(f_path_in, 'ore.xml')).getroot()
+        root = parse_xml(os.path.join(f_path_in, 'ore.xml')).getroot()
         analytics_section = root.find("Analytics")
         if analytics_section is None:
             return "Analytics section not found.", []
@@ -233,7 +277,7 @@ def seek_advice_on_ore_xml(query: str) -> str:
         return f"Error: {str(e)}"
 
 
-list_ore_tools = [list_analytics, get_analytic_parameters, set_analytic_active, add_analytic, remove_analytic, list_active_analytics, seek_advice_on_ore_xml, get_output_file_name_from_analytic_parameters]
+list_ore_tools = [list_analytics, get_analytic_parameters, set_analytic_active, add_analytic, remove_analytic, edit_analytics, list_active_analytics, seek_advice_on_ore_xml, get_output_file_name_from_analytic_parameters]
 
 list_ore_xml_tools_description = [i.name+" : "+i.description +'\n\n' for n, i in enumerate(list_ore_tools)]
 
@@ -9,7 +9,7 @@ from ExtendedState import State
 from pydantic import BaseModel, Field
 from members_details import members
 from ExtendedStatePlanExecute import PlanExecuteState
-from llm_manager import llm
+from llm_manager import llm, cached_llm
 from summary_node import summary_node
 
 class CreatePlan(BaseModel):
@@ -25,8 +25,7 @@ def planner_node(state: PlanExecuteState):
     members_str = '\n'.join([f"**{key}**: \n{value}" for key, value in members.items()])
     system_prompt = (supervisor_system_prompt.format(members_str=members_str))
     messages = [SystemMessage(content=system_prompt), HumanMessage(content="\n\nCreate a plan for following user query: \n"+state["user_query"])]
-    test = llm.invoke(messages)
-    response_plan = llm.with_structured_output(CreatePlan).invoke(messages)
+    response_plan = cached_llm.with_structured_output(CreatePlan).invoke(messages)
     return {"plan_steps": response_plan.plan_steps}
     
 
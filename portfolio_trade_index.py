@@ -0,0 +1,298 @@
+"""
+Persistent index of the trades in a portfolio.xml file.
+
+One streaming pass over the file records, for every trade, its id, TradeType, Envelope CounterParty and
+NettingSetId and the byte range of its <Trade> element. Listing and filtering trades is then served from
+the index, and the XML of a single trade is read from its byte range without parsing the rest of the
+portfolio. The index is saved next to the other caches and refreshed when the file changes: if trades
+were only appended (the prefix up to the last indexed trade is unchanged) just the new tail is scanned,
+otherwise the file is indexed again. The prefix is checked against digests of fixed size blocks, so
+the portfolio writer, which changes a few bytes of the file, only needs to re-digest the blocks it
+touched (record_write).
+
+ElementTree's iterparse does not report positions, so the pass runs on pyexpat (the parser underneath
+iterparse) whose CurrentByteIndex gives the byte offsets.
+"""
+import os
+import json
+import hashlib
+import threading
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+from typing import Dict, List, Optional, Tuple
+from xml_document_cache import file_signature
+from config_file import f_path_trade_index
+
+index_fields = ["ids", "types", "counterparties", "netting_sets", "starts", "ends"]
+digest_block_size = 1 << 16
+
+
+def _block_digest(block: bytes) -> str:
+    return hashlib.sha1(block).hexdigest()[:16]
+
+
+def _block_digests(data: bytes, end: int) -> List[str]:
+    """Digests of data[:end] in blocks of digest_block_size bytes."""
+    return [_block_digest(data[start:min(start + digest_block_size, end)]) for start in range(0, end, digest_block_size)]
+
+
+def _scan_trades(data: bytes, offset: int = 0) -> Dict[str, list]:
+    """
+    Trades of a portfolio document (or of '<Portfolio>' + a tail of one) in data.
+
+    Args:
+        offset (int): Added to the byte positions found in data.
+    """
+    columns = {field: [] for field in index_fields}
+    path: List[str] = []
+    text: List[str] = []
+    current: Dict[str, str] = {}
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+
+    def start(tag, attributes):
+        path.append(tag)
+        if len(path) == 2 and tag == "Trade":
+            current.clear()
+            current["id"] = attributes.get("id", "")
+            current["start"] = parser.CurrentByteIndex
+        text.clear()
+
+    def end(tag):
+        depth = len(path)
+        if depth == 3 and tag == "TradeType" and path[1] == "Trade":
+            current["type"] = "".join(text).strip()
+        elif depth == 4 and path[2] == "Envelope" and tag in ("CounterParty", "NettingSetId"):
+            current[tag] = "".join(text).strip()
+        elif depth == 2 and tag == "Trade":
+            # CurrentByteIndex is the position of '</Trade', the element ends at the following '>'
+            end_index = data.index(b">", parser.CurrentByteIndex) + 1
+            columns["ids"].append(current.get("id", ""))
+            columns["types"].append(current.get("type", ""))
+            columns["counterparties"].append(current.get("CounterParty", ""))
+            columns["netting_sets"].append(current.get("NettingSetId", ""))
+            columns["starts"].append(current["start"] + offset)
+            columns["ends"].append(end_index + offset)
+        path.pop()
+        text.clear()
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text.append
+    parser.Parse(data, True)
+    return columns
+
+
+class TradeIndex:
+    """
+    Index of one portfolio.xml file.
+
+    Attributes:
+        path (str): The portfolio file.
+        ids, types, counterparties, netting_sets (List[str]): Trade id, TradeType, CounterParty and NettingSetId
+            of every trade, in file order.
+        starts, ends (List[int]): Byte range of every <Trade> element.
+    """
+
+    def __init__(self, path: str, index_dir: str = f_path_trade_index):
+        self.path = os.path.abspath(path)
+        self.index_file = os.path.join(index_dir, hashlib.sha256(self.path.encode()).hexdigest()[:16] + ".json")
+        self._lock = threading.Lock()
+        self.signature = None
+        self.block_digests: List[str] = []
+        for field in index_fields:
+            setattr(self, field, [])
+        self._positions: Dict[str, int] = {}
+        self.full_scans = 0
+        self.tail_scans = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, trade_id: str) -> bool:
+        self.refresh()
+        return trade_id in self._positions
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_file, "r") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if saved.get("path") != self.path:
+            return
+        self.signature = tuple(saved["signature"])
+        self.block_digests = saved["block_digests"]
+        self._set_columns({field: saved[field] for field in index_fields})
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
+        tmp_path = f"{self.index_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(dict({"path": self.path, "signature": list(self.signature), "block_digests": self.block_digests},
+                           **{field: getattr(self, field) for field in index_fields}), f)
+        os.replace(tmp_path, self.index_file)
+
+    def _set_columns(self, columns: Dict[str, list]) -> None:
+        for field in index_fields:
+            setattr(self, field, columns[field])
+        self._positions = {}
+        for position, trade_id in enumerate(self.ids):
+            self._positions.setdefault(trade_id, position)
+
+    def refresh(self) -> "TradeIndex":
+        """Bring the index up to date with the file, scanning only appended trades where possible."""
+        with self._lock:
+            signature = file_signature(self.path)
+            if signature == self.signature:
+                return self
+            with open(self.path, "rb") as f:
+                data = f.read()
+            prefix_end = self.ends[-1] if self.ends else 0
+            if self.ends and len(data) >= prefix_end and _block_digests(data, prefix_end) == self.block_digests:
+                wrapper = b"<Portfolio>"
+                tail = _scan_trades(wrapper + data[prefix_end:], prefix_end - len(wrapper))
+                columns = {field: getattr(self, field) + tail[field] for field in index_fields}
+                self.tail_scans += 1
+            else:
+                columns = _scan_trades(data)
+                self.full_scans += 1
+            self._set_columns(columns)
+            self.signature = signature
+            self.block_digests = _block_digests(data, self.ends[-1] if self.ends else 0)
+            self._save()
+            return self
+
+    def record_write(self, columns: Dict[str, list], changed: List[Tuple[int, int]]) -> None:
+        """
+        Take over a change the caller made to the file without scanning it again.
+
+        Args:
+            columns (Dict[str, list]): The index fields after the change.
+            changed (List[Tuple[int, int]]): Byte ranges the caller wrote; only blocks overlapping them, and the
+                last block, are digested again.
+        """
+        with self._lock:
+            self._set_columns(columns)
+            prefix_end = self.ends[-1] if self.ends else 0
+            count = -(-prefix_end // digest_block_size)
+            digests = (self.block_digests + [""] * count)[:count]
+            stale = {count - 1} if count else set()
+            for start, end in changed:
+                stale.update(range(start // digest_block_size, min(-(-end // digest_block_size), count)))
+            stale.update(n for n in range(count) if not digests[n])
+            with open(self.path, "rb") as f:
+                for n in sorted(stale):
+                    f.seek(n * digest_block_size)
+                    digests[n] = _block_digest(f.read(min(digest_block_size, prefix_end - n * digest_block_size)))
+            self.block_digests = digests
+            self.signature = file_signature(self.path)
+            self._save()
+
+    def columns(self) -> Dict[str, list]:
+        """Copy of the index fields."""
+        return {field: list(getattr(self, field)) for field in index_fields}
+
+    def position(self, trade_id: str) -> Optional[int]:
+        """Position of the first trade with this id in the index fields, None if there is none."""
+        return self._positions.get(trade_id)
+
+    def trade_xml(self, trade_id: str) -> Optional[str]:
+        """XML of one trade as written in the file, read from its byte range, or None if there is no such trade."""
+        self.refresh()
+        position = self._positions.get(trade_id)
+        if position is None:
+            return None
+        with open(self.path, "rb") as f:
+            f.seek(self.starts[position])
+            return f.read(self.ends[position] - self.starts[position]).decode("utf-8")
+
+    def trade_element(self, trade_id: str) -> Optional[ET.Element]:
+        xml = self.trade_xml(trade_id)
+        return None if xml is None else ET.fromstring(xml)
+
+    def select(self, trade_type: Optional[str] = None, counterparty: Optional[str] = None,
+               netting_set: Optional[str] = None) -> List[str]:
+        """Ids of the trades matching all given filters, in file order."""
+        self.refresh()
+        return [trade_id for trade_id, t, c, n in zip(self.ids, self.types, self.counterparties, self.netting_sets)
+                if (trade_type is None or t == trade_type) and (counterparty is None or c == counterparty)
+                and (netting_set is None or n == netting_set)]
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """Number of trades per trade type, counterparty and netting set."""
+        self.refresh()
+        counts = {"TradeType": {}, "CounterParty": {}, "NettingSetId": {}}
+        for name, values in zip(counts, [self.types, self.counterparties, self.netting_sets]):
+            for value in values:
+                counts[name][value] = counts[name].get(value, 0) + 1
+        return counts
+
+
+_indexes: Dict[str, TradeIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_trade_index(path: str) -> TradeIndex:
+    """Return the process-wide, up to date trade index of a portfolio file."""
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = TradeIndex(path)
+    return index.refresh()
+
+
+def drop_trade_index(path: str) -> None:
+    """Forget the process-wide index of a portfolio file and delete its saved copy, e.g. for a temporary file."""
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.pop(path, None)
+    index_file = index.index_file if index is not None else TradeIndex(path).index_file
+    if os.path.exists(index_file):
+        os.remove(index_file)
+
+
+def benchmark_trade_index(trades: int = 50000, path: str = "portfolio_benchmark.xml") -> str:
+    """Time indexing, lookups and an appended trade on a synthetic portfolio of copies of Example_1's swap."""
+    import time
+    template = ET.tostring(ET.parse(os.path.join("Examples", "Example_1", "Input", "portfolio.xml")).getroot().find("Trade"),
+                           encoding="unicode").strip()
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0"?>\n<Portfolio>\n')
+        for n in range(trades):
+            f.write("  " + template.replace('id="Swap_20"', f'id="Trade_{n}"').replace("CPTY_A", f"CPTY_{n % 7}") + "\n")
+        f.write("</Portfolio>\n")
+    results = []
+    try:
+        start = time.perf_counter()
+        ET.parse(path)
+        results.append(f"ET.parse {time.perf_counter() - start:.2f} s")
+        index = TradeIndex(path, index_dir=os.path.join(f_path_trade_index, "benchmark"))
+        start = time.perf_counter()
+        index.refresh()
+        results.append(f"full index of {len(index)} trades {time.perf_counter() - start:.2f} s")
+        start = time.perf_counter()
+        for n in range(0, trades, max(trades // 100, 1)):
+            index.trade_element(f"Trade_{n}")
+        results.append(f"100 lookups {time.perf_counter() - start:.4f} s")
+        start = time.perf_counter()
+        index.select(netting_set="CPTY_3")
+        results.append(f"netting set filter {time.perf_counter() - start:.4f} s")
+        with open(path, "rb+") as f:
+            data = f.read()
+            f.seek(data.rindex(b"</Portfolio>"))
+            f.write(("  " + template.replace('id="Swap_20"', 'id="Trade_new"') + "\n</Portfolio>\n").encode())
+        start = time.perf_counter()
+        index.refresh()
+        results.append(f"refresh after append {time.perf_counter() - start:.2f} s ({index.tail_scans} tail scan)")
+        assert index.trade_element("Trade_new").get("id") == "Trade_new"
+    finally:
+        os.remove(path)
+    return ", ".join(results)
+
+
+if __name__ == "__main__":
+    print(benchmark_trade_index())
@@ -0,0 +1,292 @@
+"""
+In-place edits of portfolio.xml that write only the trades they change.
+
+Adding, replacing or removing one trade used to parse the whole portfolio and serialise it again. The
+writer instead splices the bytes of the one <Trade> element into the file, using the byte ranges of the
+trade index:
+    - add_trade writes the new trade over the closing </Portfolio> tag and writes the tag again after it.
+    - replace_trade overwrites the old trade in place when the new one is not longer, padding the rest
+      with spaces; a longer trade blanks the old one and is added at the end.
+    - remove_trade blanks the trade with spaces.
+A write costs O(trade size) and the trade index takes the change over without scanning the file again.
+Every trade is validated by the XML backend before it is written.
+Blanked trades leave whitespace behind; once it exceeds portfolio_compaction_ratio of the file,
+compact_portfolio rewrites the file without it (trades, comments and everything else are kept as they are).
+
+Trades are expected in UTF-8 (or ASCII) encoded portfolios, as all ORE examples are.
+"""
+import os
+import threading
+import xml.etree.ElementTree as ET
+from typing import Dict, List, Optional, Tuple, Union
+from portfolio_trade_index import get_trade_index, drop_trade_index, TradeIndex
+from xml_backend import get_xml_backend
+from config_file import portfolio_compaction_ratio
+
+_closing_tag = b"</Portfolio>"
+_empty_portfolio = b'<?xml version="1.0"?>\n<Portfolio>\n</Portfolio>\n'
+# What compaction puts between two trades.
+_trade_separator = b"\n  "
+
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_lock = threading.Lock()
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        return _path_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+
+def _trade_bytes(trade: Union[str, ET.Element]) -> Tuple[ET.Element, bytes]:
+    """The trade element and its bytes, indented as a child of <Portfolio>."""
+    element = ET.fromstring(trade) if isinstance(trade, str) else trade
+    if element.tag != "Trade" or not element.get("id"):
+        raise ValueError("Expected a <Trade> element with an id attribute.")
+    element = ET.fromstring(ET.tostring(element))
+    element.tail = None
+    portfolio = ET.Element("Portfolio")
+    portfolio.append(element)
+    problems = get_xml_backend().validate(portfolio)
+    if problems:
+        raise ValueError(f"Invalid trade {element.get('id')}: {'; '.join(problems)}.")
+    ET.indent(element, space="  ", level=1)
+    return element, ET.tostring(element, encoding="utf-8", xml_declaration=False)
+
+
+def _index_entry(element: ET.Element, start: int, end: int) -> Dict[str, object]:
+    return {"ids": element.get("id"), "types": (element.findtext("TradeType") or "").strip(),
+            "counterparties": (element.findtext("Envelope/CounterParty") or "").strip(),
+            "netting_sets": (element.findtext("Envelope/NettingSetId") or "").strip(), "starts": start, "ends": end}
+
+
+def _append(f, index_columns: Dict[str, list], element: ET.Element, data: bytes) -> Tuple[int, int]:
+    """Write a trade before the closing </Portfolio> tag and add it to index_columns, returns the written range."""
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(max(size - 4096, 0))
+    tail = f.read()
+    position = tail.rfind(_closing_tag)
+    if position < 0:
+        raise ValueError("No closing </Portfolio> tag found, cannot append.")
+    closing = size - len(tail) + position
+    f.seek(closing)
+    f.write(b"  " + data + b"\n" + _closing_tag + b"\n")
+    f.truncate()
+    start = closing + 2
+    for field, value in _index_entry(element, start, start + len(data)).items():
+        index_columns[field].append(value)
+    return closing, f.tell()
+
+
+def _blank(f, index_columns: Dict[str, list], position: int) -> Tuple[int, int]:
+    """Overwrite the trade at position of the index with spaces and drop it from index_columns."""
+    start, end = index_columns["starts"][position], index_columns["ends"][position]
+    f.seek(start)
+    f.write(b" " * (end - start))
+    for values in index_columns.values():
+        del values[position]
+    return start, end
+
+
+def _is_blank(path: str) -> bool:
+    """A file shorter than an empty portfolio that holds only whitespace."""
+    if os.path.getsize(path) >= len(_empty_portfolio):
+        return False
+    with open(path, "rb") as f:
+        return not f.read().strip()
+
+
+def _open_portfolio(path: str) -> TradeIndex:
+    if not os.path.isfile(path) or _is_blank(path):
+        with open(path, "wb") as f:
+            f.write(_empty_portfolio)
+    return get_trade_index(path)
+
+
+def add_trade(path: str, trade: Union[str, ET.Element]) -> str:
+    """
+    Append a trade to a portfolio file (created if missing or empty).
+
+    Returns:
+        str: The id of the added trade.
+
+    Raises:
+        ValueError: The trade is not a <Trade> element with an id, or its id is already in the portfolio.
+    """
+    element, data = _trade_bytes(trade)
+    with _path_lock(path):
+        index = _open_portfolio(path)
+        if index.position(element.get("id")) is not None:
+            raise ValueError(f"Trade {element.get('id')} already exists in {path}.")
+        columns = index.columns()
+        with open(path, "rb+") as f:
+            changed = [_append(f, columns, element, data)]
+        index.record_write(columns, changed)
+    maybe_compact(path)
+    return element.get("id")
+
+
+def replace_trade(path: str, trade_id: str, trade: Union[str, ET.Element]) -> str:
+    """
+    Replace the trade with id trade_id by trade, which may carry a different id.
+
+    Returns:
+        str: The id of the new trade.
+
+    Raises:
+        KeyError: There is no trade trade_id.
+        ValueError: The new trade has another trade's id, or is not a <Trade> element with an id.
+    """
+    element, data = _trade_bytes(trade)
+    with _path_lock(path):
+        index = get_trade_index(path)
+        position = index.position(trade_id)
+        if position is None:
+            raise KeyError(f"Trade {trade_id} not found in {path}.")
+        if element.get("id") != trade_id and index.position(element.get("id")) is not None:
+            raise ValueError(f"Trade {element.get('id')} already exists in {path}.")
+        columns = index.columns()
+        start, end = columns["starts"][position], columns["ends"][position]
+        with open(path, "rb+") as f:
+            if len(data) <= end - start:
+                f.seek(start)
+                f.write(data + b" " * (end - start - len(data)))
+                for field, value in _index_entry(element, start, start + len(data)).items():
+                    columns[field][position] = value
+                changed = [(start, end)]
+            else:
+                changed = [_blank(f, columns, position), _append(f, columns, element, data)]
+        index.record_write(columns, changed)
+    maybe_compact(path)
+    return element.get("id")
+
+
+def remove_trade(path: str, trade_id: str) -> None:
+    """Remove the trade with id trade_id, raises KeyError if there is none."""
+    with _path_lock(path):
+        index = get_trade_index(path)
+        position = index.position(trade_id)
+        if position is None:
+            raise KeyError(f"Trade {trade_id} not found in {path}.")
+        columns = index.columns()
+        with open(path, "rb+") as f:
+            changed = [_blank(f, columns, position)]
+        index.record_write(columns, changed)
+    maybe_compact(path)
+
+
+def wasted_bytes(index: TradeIndex, size: int) -> int:
+    """Bytes around the trades beyond a normal separator or header, mostly trades blanked by the writer."""
+    if not index.ids:
+        return 0
+    between = sum(max(start - end - len(_trade_separator), 0) for end, start in zip(index.ends, index.starts[1:]))
+    return between + max(index.starts[0] - len(_empty_portfolio), 0) + max(size - index.ends[-1] - len(_empty_portfolio), 0)
+
+
+def compact_portfolio(path: str) -> int:
+    """
+    Rewrite a portfolio without the blank space left by replaced and removed trades.
+
+    Whitespace-only gaps between trades become a normal separator, everything else is copied as it is.
+    The file is replaced atomically.
+
+    Returns:
+        int: Bytes saved.
+    """
+    with _path_lock(path):
+        index = get_trade_index(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        if not index.ids:
+            return 0
+        parts = [data[:index.starts[0]].rstrip() + _trade_separator]
+        for n in range(len(index.ids)):
+            parts.append(data[index.starts[n]:index.ends[n]])
+            if n + 1 < len(index.ids):
+                gap = data[index.ends[n]:index.starts[n + 1]]
+                parts.append(_trade_separator if not gap.strip() else gap)
+            else:
+                tail = data[index.ends[n]:]
+                markup = tail.find(b"<")
+                parts.append(b"\n" + tail[markup:] if markup >= 0 and not tail[:markup].strip() else tail)
+        compacted = b"".join(parts)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compacted)
+        os.replace(tmp_path, path)
+    get_trade_index(path)
+    return len(data) - len(compacted)
+
+
+def maybe_compact(path: str, ratio: float = portfolio_compaction_ratio) -> int:
+    """Compact the portfolio if its wasted space exceeds ratio of the file size, returns the bytes saved."""
+    index = get_trade_index(path)
+    size = os.path.getsize(path)
+    if size and wasted_bytes(index, size) > ratio * size:
+        return compact_portfolio(path)
+    return 0
+
+
+def _canonical_trades(root: ET.Element) -> Dict[str, str]:
+    return {trade.get("id"): ET.canonicalize(ET.tostring(trade), strip_text=True) for trade in root.findall("Trade")}
+
+
+def check_writer_against_dom(source: str, edits: int = 200, seed: int = 1, work_dir: str = ".") -> str:
+    """
+    Apply the same random adds, replaces and removes to a copy of a portfolio with the writer and with a full
+    DOM rewrite, and check that both give the same trades and that the index matches a fresh scan.
+    """
+    import random
+    import shutil
+    from portfolio_trade_index import TradeIndex
+    rng = random.Random(seed)
+    path = os.path.join(work_dir, "portfolio_writer_check.xml")
+    shutil.copyfile(source, path)
+    tree = ET.parse(source)
+    root = tree.getroot()
+    templates = [ET.tostring(t, encoding="unicode").strip() for t in root.findall("Trade")]
+    counter = 0
+    try:
+        for _ in range(edits):
+            ids = [t.get("id") for t in root.findall("Trade")]
+            action = rng.choice(["add", "replace", "remove"] if ids else ["add"])
+            counter += 1
+            if action == "add":
+                trade = ET.fromstring(rng.choice(templates))
+                trade.set("id", f"Check_{counter}")
+                add_trade(path, trade)
+                root.append(trade)
+            elif action == "replace":
+                old_id = rng.choice(ids)
+                trade = ET.fromstring(rng.choice(templates))
+                trade.set("id", old_id if rng.random() < 0.5 else f"Check_{counter}")
+                if rng.random() < 0.5:
+                    ET.SubElement(trade.find("Envelope"), "AdditionalFields").text = "x" * rng.randint(0, 400)
+                replace_trade(path, old_id, trade)
+                old = root.find(f"Trade[@id='{old_id}']")
+                root.insert(list(root).index(old), trade)
+                root.remove(old)
+            else:
+                old_id = rng.choice(ids)
+                remove_trade(path, old_id)
+                root.remove(root.find(f"Trade[@id='{old_id}']"))
+        written = ET.parse(path).getroot()
+        assert _canonical_trades(written) == _canonical_trades(root), "writer and DOM rewrite give different trades"
+        index = get_trade_index(path)
+        fresh = TradeIndex(path, index_dir=os.path.join(work_dir, ".check_index"))
+        fresh.refresh()
+        assert index.columns() == fresh.columns(), "index after writes differs from a fresh scan"
+        saved = compact_portfolio(path)
+        assert _canonical_trades(ET.parse(path).getroot()) == _canonical_trades(root), "compaction changed the trades"
+        return f"{edits} edits on {os.path.basename(source)}: writer matches DOM rewrite ({len(root)} trades), compaction saved {saved} bytes"
+    finally:
+        # the writer keeps the process-wide index of the copy, which is saved with the other trade indexes
+        drop_trade_index(path)
+        os.remove(path)
+        shutil.rmtree(os.path.join(work_dir, ".check_index"), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import sys
+    for portfolio in sys.argv[1:] or [os.path.join("Examples", "Example_1", "Input", "portfolio.xml")]:
+        print(check_writer_against_dom(portfolio))
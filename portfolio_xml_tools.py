@@ -1,12 +1,14 @@
 from langchain.tools import tool
 import xml.etree.ElementTree as ET
 import os
-from typing import Tuple, List, Literal
+from typing import Tuple, List, Literal, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
 from react_agent_system_prompts import portfolio_trade_creator_tool_prompt, portfolio_xml_agent_system_prompt_content
-from llm_manager import llm, llm_37
+from llm_manager import llm, cached_llm, cached_llm_37
 from pydantic import BaseModel, Field
 from config_file import f_path_trade_docs, f_path_in, f_path_trade_samples
+from portfolio_trade_index import get_trade_index
+from portfolio_writer import add_trade, replace_trade
 from glob import glob
 from langgraph.types import Command, interrupt
 from config_file import term_sheet_file
@@ -36,7 +38,7 @@ def extract_trade_sample(trade_type:str) -> str:
     trade_samples = [os.path.basename(i) for i in glob(os.path.join(f_path_trade_samples, '*.xml'))]
     class GetTeadeSample(BaseModel):
         trade_samples_list: List[Literal[*trade_samples]] = Field(str, description="Trade samples that closely match the trade type.")
-    result = llm.with_structured_output(GetTeadeSample).invoke([HumanMessage(content=f"Trade type: {trade_type}")])
+    result = cached_llm.with_structured_output(GetTeadeSample).invoke([HumanMessage(content=f"Trade type: {trade_type}")])
     return '\n\n'.join(result.trade_samples_list)
 
     
@@ -55,25 +57,14 @@ def create_trade_from_term_sheet() -> str:
         if (term_sheet_data == ''):
             return "Error: Term sheet data is empty"
         
-        trade_type = llm.with_structured_output(ExtractTradeType).invoke([SystemMessage(content=portfolio_xml_agent_system_prompt_content), HumanMessage(content=f"\r\n\r\nYou will be given a term sheet of a financial derivative product. Your job is to identify the trade type described in the term sheet: {term_sheet_data}\r\n\r\n")])
+        trade_type = cached_llm.with_structured_output(ExtractTradeType).invoke([SystemMessage(content=portfolio_xml_agent_system_prompt_content), HumanMessage(content=f"\r\n\r\nYou will be given a term sheet of a financial derivative product. Your job is to identify the trade type described in the term sheet: {term_sheet_data}\r\n\r\n")])
         trade_doc = extract_trade_doc(trade_type=trade_type.trade_type)
         trade_samples = extract_trade_sample(trade_type=trade_type.trade_type)
-        trade_result = llm_37.invoke([HumanMessage(content=f"You are an expert trader working for a trading desk in a bank who is tasked in extracting data from from a term sheet that describes a financial derivative product. Your job is to create trade xml snippet with a trade id by extracting relevant trade parameters that you find from the term sheet provided and the documentation of representing that trade as xml.\r\nTrade type: {trade_type.trade_type}\r\nTerm sheet: \r\n{term_sheet_data}\r\n\r\nTrade XML documentation: \r\n{trade_doc}\r\n\r\nHere are a few trade XML samples for reference: \r\n{trade_samples}. Now create an trade xml snippet using the data from term sheet and the sample trade xmls provided above. Return the xml.")])
-        result = llm.with_structured_output(GetTradeXMLResponse).invoke([HumanMessage(content=f"You are given a data for financial derivative trade. Your job is to extract xml from the data provided and return the xml.\r\n Data:\r\n{trade_result.content}")])
+        trade_result = cached_llm_37.invoke([HumanMessage(content=f"You are an expert trader working for a trading desk in a bank who is tasked in extracting data from from a term sheet that describes a financial derivative product. Your job is to create trade xml snippet with a trade id by extracting relevant trade parameters that you find from the term sheet provided and the documentation of representing that trade as xml.\r\nTrade type: {trade_type.trade_type}\r\nTerm sheet: \r\n{term_sheet_data}\r\n\r\nTrade XML documentation: \r\n{trade_doc}\r\n\r\nHere are a few trade XML samples for reference: \r\n{trade_samples}. Now create an trade xml snippet using the data from term sheet and the sample trade xmls provided above. Return the xml.")])
+        result = cached_llm.with_structured_output(GetTradeXMLResponse).invoke([HumanMessage(content=f"You are given a data for financial derivative trade. Your job is to extract xml from the data provided and return the xml.\r\n Data:\r\n{trade_result.content}")])
         trade_xml = ET.fromstring(result.xml_content)
-        with open(os.path.join(f_path_in, 'portfolio.xml'), 'r') as f:
-            file_content = f.read().strip()
-        if file_content == "":
-            # Create a new portfolio.xml with a single Trade element
-            root = ET.Element('Portfolio')
-            root.append(trade_xml)
-            tree = ET.ElementTree(root)
-            tree.write(os.path.join(f_path_in, 'portfolio.xml'), encoding='unicode', xml_declaration=True)
-        else:
-            tree = ET.parse(os.path.join(f_path_in, 'portfolio.xml'))
-            root = tree.getroot()
-            root.append(trade_xml)
-            tree.write(os.path.join(f_path_in, 'portfolio.xml'), encoding='unicode', xml_declaration=True)
+        # Appends to portfolio.xml, which is created if it is missing or empty
+        add_trade(os.path.join(f_path_in, 'portfolio.xml'), trade_xml)
             
         return f"Generated trade following trade xml for {trade_type.trade_type} successfully.\r\n Trade XML: {ET.tostring(trade_xml, encoding='unicode', method='xml')}"
     except Exception as e:
@@ -94,11 +85,8 @@ def modify_trade(trade_id: str, modification_query: str) -> str:
         str: Summary of the modification made to the trade
     """
     try:
-        tree = ET.parse(os.path.join(f_path_in, 'portfolio.xml'))
-        root = tree.getroot()
-        
         # Find the trade with the given ID
-        trade = root.find(f".//Trade[@id='{trade_id}']")
+        trade = get_trade_index(os.path.join(f_path_in, 'portfolio.xml')).trade_element(trade_id)
         if trade is None:
             return f"Error: Trade with ID {trade_id} not found"
         
@@ -107,10 +95,9 @@ def modify_trade(trade_id: str, modification_query: str) -> str:
         
             
         trade_xml = ET.fromstring(modified_trade.xml_content)
-        root.append(trade_xml)
+        # Replaces the old trade, also if the modified trade got a new id
+        replace_trade(os.path.join(f_path_in, 'portfolio.xml'), trade_id, trade_xml)
         
-                
-        tree.write(os.path.join(f_path_in, 'portfolio.xml'), encoding="utf-8", xml_declaration=True)
         return f"Successfully modified trade with ID {trade_id}\n\n modified xml of trade: \n\n{ET.tostring(trade_xml, encoding='unicode', method='xml')}"
         
     except Exception as e:
@@ -130,14 +117,11 @@ def get_trade_info(trade_id: str) -> str:
         str: Trade information in XML format
     """
     try:
-        tree = ET.parse(os.path.join(f_path_in, 'portfolio.xml'))
-        root = tree.getroot()
-        
-        trade = root.find(f".//Trade[@id='{trade_id}']")
-        if trade is None:
+        trade_xml = get_trade_index(os.path.join(f_path_in, 'portfolio.xml')).trade_xml(trade_id)
+        if trade_xml is None:
             return f"Error: Trade with ID {trade_id} not found"
             
-        return ET.tostring(trade, encoding='unicode', method='xml')
+        return trade_xml
         
     except Exception as e:
         return f"Error: {str(e)}"
@@ -151,41 +135,37 @@ def list_trades() -> str:
         str: List of trades in XML format
     """
     try:
-        tree = ET.parse(os.path.join(f_path_in, 'portfolio.xml'))
-        root = tree.getroot()
-        trades = root.findall(".//Trade")
-        if not trades:
+        trade_ids = get_trade_index(os.path.join(f_path_in, 'portfolio.xml')).ids
+        if not trade_ids:
             return "No trades found in portfolio.xml"
         
-        trade_ids = [trade.attrib['id'] for trade in trades]
         return f"Trade IDs: {', '.join(trade_ids)}"
         
     except Exception as e:
         return f"Error: {str(e)}"
 
 @tool(response_format="content")
-def select_trades_by_trade_type(trade_type: str) -> str:
+def select_trades_by_trade_type(trade_type: str, counterparty: Optional[str] = None, netting_set: Optional[str] = None) -> str:
     """
-    Select trades of a specific type from the portfolio.xml file.
+    Select trades of a specific type from the portfolio.xml file, optionally only those of one counterparty or netting set.
 
     Args:
-        trade_type (str): Type of trade to select
+        trade_type (str): Type of trade to select, as in the TradeType element, e.g. 'Swap' or 'FxForward'
+        counterparty (Optional[str]): Only trades with this Envelope CounterParty
+        netting_set (Optional[str]): Only trades with this Envelope NettingSetId
 
     Returns:
-        str: Trades of the specified type in XML format
+        str: Ids of the selected trades
     """
     try:
-        tree = ET.parse(os.path.join(f_path_in, 'portfolio.xml'))
-        root = tree.getroot()
-        trades = root.findall(f".//TradeType[@type='{trade_type}']")
-        if not trades:
+        trade_ids = get_trade_index(os.path.join(f_path_in, 'portfolio.xml')).select(trade_type, counterparty, netting_set)
+        if not trade_ids:
             return f"No trades of type {trade_type} found in portfolio.xml"
         
-        trade_ids = [trade.attrib['id'] for trade in trades]
         return f"Trade IDs: {', '.join(trade_ids)}"
         
     except Exception as e:
         return f"Error: {str(e)}"
 
-list_portfolio_xml_tools = [get_trade_info, modify_trade, list_trades, create_trade_from_term_sheet]
+list_portfolio_xml_tools = [get_trade_info, modify_trade, list_trades, select_trades_by_trade_type, create_trade_from_term_sheet]
 list_portfolio_xml_tools_description = [i.name+" : "+i.description + '\n\n' for n, i in enumerate(list_portfolio_xml_tools)]
@@ -161,6 +161,7 @@ test = 0
 ore_execution_agent_system_prompt_content = """
 You are a react agent that can trigger runs with ORE which is an executable file for ORE (Open Source Risk Engine).
 You have tools that can help you run the ORE executable file.
+Use run_ore for a single run. To run in the background use submit_ore_run, follow it with get_ore_run_progress, wait for the result with await_ore_run and stop it with cancel_ore_run if needed.
 You will be given a task and a stopping criteria. Using the tools available, complete the task and stop when the stopping criteria is met.
 Check at every step assess if the stopping criteria is met and proceed only if stopping criteria is not met.
 If stopping criteria is met, stop then return to supervisor.
@@ -273,8 +274,10 @@ You can use following plan to come up with analysis:
 2. Each chunk is clear and precise in terms of what insights it wants to get from the data. eg 'What is maximum exposure to counterparty A' or 'Plot time series of exposure to counterparty A' etc.
 3. Use the tools available to you to come up with analysis and passing chunks to the tools as query.
 4. If the tool returns with error try reformulating your query to be specific.
-5. Finally when you have sufficient analysis, respond with consolidated summary of analysis in markdown format.
-6. The markdown report should be properly formatted and easy to read, with plots (embed the saved plots in the markdown itself eg. ![alt text](path/to/image.png) or ![alt text](image.png))
+5. For exposure questions (EPE, ENE, PFE at a given quantile, Basel EE/EEE/EEPE) use compute_exposure_metrics, it computes them from the simulation cube without re-running ORE.
+   For collateral what-ifs (threshold, MTA, independent amount, MPOR) use sweep_collateral_parameters, it evaluates all variants on the same cube.
+6. Finally when you have sufficient analysis, respond with consolidated summary of analysis in markdown format.
+7. The markdown report should be properly formatted and easy to read, with plots (embed the saved plots in the markdown itself eg. ![alt text](path/to/image.png) or ![alt text](image.png))
 ) and tables.
 IMPORTANT: While writing the code for analysis DO NOT use plot().show() function instead save the plot with a name and use that name to perform actions.
 """
@@ -372,268 +375,22 @@ You will be provided with a user query and your task is to use above knowledge a
 """
 
 stress_test_scenario_transaltor_tool_prompt = """
-Here is a sample XML configuration for stress testing:
-<StressTesting>
-
-  <StressTest id="parallel_rates">
-
-    <DiscountCurves>
-      <DiscountCurve ccy="EUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </DiscountCurve>
-      <DiscountCurve ccy="USD">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </DiscountCurve>
-      <DiscountCurve ccy="GBP">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </DiscountCurve>
-      <DiscountCurve ccy="JPY">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </DiscountCurve>
-    </DiscountCurves>
-
-    <IndexCurves>
-      <IndexCurve index="EUR-EURIBOR-6M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="EUR-EURIBOR-3M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="EUR-EONIA">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="USD-LIBOR-3M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="USD-LIBOR-6M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="GBP-LIBOR-3M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="GBP-LIBOR-6M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="CHF-LIBOR-6M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-      <IndexCurve index="JPY-LIBOR-6M">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </IndexCurve>
-    </IndexCurves>
-
-    <YieldCurves>
-      <YieldCurve name="BENCHMARK_EUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.001,0.002,0.003,0.004,0.005,0.006,0.007,0.008,0.009</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </YieldCurve>
-    </YieldCurves>
-
-    <FxSpots>
-      <FxSpot ccypair="USDEUR">
-        <ShiftType>Relative</ShiftType>
-        <ShiftSize>0.01</ShiftSize>
-      </FxSpot>
-      <FxSpot ccypair="GBPEUR">
-        <ShiftType>Relative</ShiftType>
-        <ShiftSize>0.01</ShiftSize>
-      </FxSpot>
-      <FxSpot ccypair="CHFEUR">
-        <ShiftType>Relative</ShiftType>
-        <ShiftSize>0.01</ShiftSize>
-      </FxSpot>
-      <FxSpot ccypair="JPYEUR">
-        <ShiftType>Relative</ShiftType>
-        <ShiftSize>0.01</ShiftSize>
-      </FxSpot>
-    </FxSpots>
-
-    <FxVolatilities>
-      <FxVolatility ccypair="USDEUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.1,0.1,0.1,0.1</Shifts>
-        <ShiftExpiries>1Y,2Y,3Y,5Y</ShiftExpiries>
-      </FxVolatility>
-      <FxVolatility ccypair="GBPEUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.1,0.1,0.1,0.1</Shifts>
-        <ShiftExpiries>1Y,2Y,3Y,5Y</ShiftExpiries>
-      </FxVolatility>
-      <FxVolatility ccypair="JPYEUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>0.1,0.1,0.1,0.1</Shifts>
-        <ShiftExpiries>1Y,2Y,3Y,5Y</ShiftExpiries>
-      </FxVolatility>
-    </FxVolatilities>
-
-
-    <SwaptionVolatilities>
-      <SwaptionVolatility ccy="EUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>
-          <Shift>0.0010</Shift>
-          <Shift expiry="1Y" term="1Y">0.0010</Shift>
-          <Shift expiry="1Y" term="5Y">0.0010</Shift>
-          <Shift expiry="1Y" term="10Y">0.0010</Shift>
-          <Shift expiry="5Y" term="1Y">0.0010</Shift>
-          <Shift expiry="5Y" term="5Y">0.0010</Shift>
-          <Shift expiry="5Y" term="10Y">0.0010</Shift>
-          <Shift expiry="10Y" term="1Y">0.0010</Shift>
-          <Shift expiry="10Y" term="5Y">0.0010</Shift>
-          <Shift expiry="10Y" term="10Y">0.0010</Shift>
-        </Shifts>
-        <ShiftExpiries>1Y,5Y,10Y</ShiftExpiries>
-        <ShiftTerms>1Y,5Y,10Y</ShiftTerms>
-      </SwaptionVolatility>
-    </SwaptionVolatilities>
-
-
-    <CapFloorVolatilities>
-      <CapFloorVolatility ccy="EUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>
-          <Shift tenor="6M">0.001</Shift>
-          <Shift tenor="1Y">0.001</Shift>
-          <Shift tenor="2Y">0.001</Shift>
-          <Shift tenor="3Y">0.001</Shift>
-          <Shift tenor="5Y">0.001</Shift>
-          <Shift tenor="10Y">0.001</Shift>
-        </Shifts>
-        <ShiftExpiries>6M,1Y,2Y,3Y,5Y,10Y</ShiftExpiries>
-        <ShiftStrikes />
-      </CapFloorVolatility>
-      <CapFloorVolatility ccy="USD">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>
-          <Shift tenor="6M">0.001</Shift>
-          <Shift tenor="1Y">0.001</Shift>
-          <Shift tenor="2Y">0.001</Shift>
-          <Shift tenor="3Y">0.001</Shift>
-          <Shift tenor="5Y">0.001</Shift>
-          <Shift tenor="10Y">0.001</Shift>
-        </Shifts>
-        <ShiftExpiries>6M,1Y,2Y,3Y,5Y,10Y</ShiftExpiries>
-      </CapFloorVolatility>
-    </CapFloorVolatilities>
-
-
-    <EquitySpots>
-      <EquitySpot equity="SP5">
-        <ShiftType>Relative</ShiftType>
-        <ShiftSize>0.01</ShiftSize>
-      </EquitySpot>
-      <EquitySpot equity="Lufthansa">
-        <ShiftType>Relative</ShiftType>
-        <ShiftSize>0.01</ShiftSize>
-      </EquitySpot>
-    </EquitySpots>
-
-
-    <EquityVolatilities>
-      <EquityVolatility equity="SP5">
-        <ShiftType>Relative</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftExpiries>6M,1Y,2Y,3Y,5Y</ShiftExpiries>
-      </EquityVolatility>
-      <EquityVolatility equity="Lufthansa">
-        <ShiftType>Relative</ShiftType>
-        <Shifts>0.01,0.01,0.01,0.01,0.01</Shifts>
-        <ShiftExpiries>6M,1Y,2Y,3Y,5Y</ShiftExpiries>
-      </EquityVolatility>
-    </EquityVolatilities>
-    <SecuritySpreads />
-    <RecoveryRates />
-    <SurvivalProbabilities />
-  </StressTest>
-
-  <StressTest id="twist">
-
-    <DiscountCurves>
-    </DiscountCurves>
-    <IndexCurves>
-    </IndexCurves>
-    <YieldCurves>
-      <YieldCurve name="BENCHMARK_EUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>-0.005,-0.004,-0.003,-0.002,0.002,0.004,0.006,0.008,0.01</Shifts>
-        <ShiftTenors>6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y</ShiftTenors>
-      </YieldCurve>
-    </YieldCurves>
-    <FxSpots>
-    </FxSpots>
-    <FxVolatilities>
-    </FxVolatilities>
-    <SwaptionVolatilities>
-      <SwaptionVolatility ccy="EUR">
-        <ShiftType>Absolute</ShiftType>
-        <Shifts>
-          <Shift>0.0020</Shift>
-          <Shift expiry="1Y" term="5Y">0.0040</Shift>
-          <Shift expiry="5Y" term="5Y">0.0030</Shift>
-          <Shift expiry="10Y" term="5Y">0.0010</Shift>
-        </Shifts>
-        <ShiftExpiries>1Y,5Y,10Y</ShiftExpiries>
-        <ShiftTerms>5Y</ShiftTerms>
-      </SwaptionVolatility>
-    </SwaptionVolatilities>
-    <CapFloorVolatilities>
-    </CapFloorVolatilities>
-    <EquitySpots>
-    </EquitySpots>
-    <EquityVolatilities>
-    </EquityVolatilities>
-    <SecuritySpreads />
-    <RecoveryRates />
-    <SurvivalProbabilities />
-  </StressTest>
-
-</StressTesting>
-
-Important instructions:
-1. Follow the template above if you want to add new stress scenarios.
-2. Each stress scenario is defined by a unique id in a node <StressTest id="..."> and should contain all following elements:
-    - DiscountCurves : <DiscountCurves></DiscountCurves>
-    - IndexCurves : <IndexCurves></IndexCurves>
-    - YieldCurves : <YieldCurves></YieldCurves>
-    - FxSpots : <FxSpots></FxSpots>
-    - FxVolatilities : <FxVolatilities></FxVolatilities>
-    - SwaptionVolatilities : <SwaptionVolatilities></SwaptionVolatilities>
-    - CapFloorVolatilities : <CapFloorVolatilities></CapFloorVolatilities>
-    - EquitySpots : <EquitySpots></EquitySpots>
-    - EquityVolatilities : <EquityVolatilities></EquityVolatilities>
-    - SecuritySpreads : <SecuritySpreads></SecuritySpreads>
-    - RecoveryRates : <RecoveryRates></RecoveryRates>
-    - SurvivalProbabilities : <SurvivalProbabilities></SurvivalProbabilities>
-3. Ensure that you populate these nodes based on user query. You should leave the nodes that are not relevant to the user query empty but still part of the stress test file.
-4. make sure you name the stress test scenario with a unique id that describes the scenario.
-5. make sure you indent the nodes in the stress test file.
+You translate a stress scenario described by the user into the parameters of the shocks it applies. You do not write XML: the stress test configuration is generated from your parameters, and existing scenarios are kept unless you reuse their id.
+
+Each scenario has a unique, descriptive id (e.g. eur_rates_up_100bp) and a list of shocks. Each shock has:
+- factor: DiscountCurve (name is a currency, e.g. EUR), IndexCurve (name is an index, e.g. EUR-EURIBOR-6M), YieldCurve (name is a curve name, e.g. BENCHMARK_EUR), FxSpot or FxVolatility (name is a currency pair as in ORE, e.g. USDEUR), SwaptionVolatility (name is a currency), EquitySpot or EquityVolatility (name is the equity).
+- shape:
+    - parallel: the same shift at every tenor. Spot shocks (FxSpot, EquitySpot) are always parallel.
+    - twist: shifts linear in time from short_size at the first tenor to size at the last tenor. A steepener has size > short_size, a flattener size < short_size. short_size defaults to -size.
+    - butterfly: size at the first and last tenor and belly_size at the pivot tenor (default the middle tenor). belly_size defaults to -size.
+    - key_rate: size at the pivot tenor only, zero at the other tenors.
+- size: the shift as a decimal: 100 basis points is 0.01, 10 basis points is 0.001, 5% is 0.05. A decrease is negative.
+- shift_type: Absolute or Relative. Leave it empty for the usual convention: Absolute for curves, FX volatilities and swaption volatilities, Relative for FX spots, equity spots and equity volatilities.
+- tenors: curve tenors or volatility expiries such as 6M,1Y,5Y. Leave empty for the defaults (6M,1Y,2Y,3Y,5Y,7Y,10Y,15Y,20Y for curves, 6M,1Y,2Y,3Y,5Y for volatilities, 1Y,5Y,10Y for swaption expiries).
+- terms: swap terms of a swaption volatility shock, empty for 1Y,5Y,10Y.
+
+Rates stresses usually shift both the discount curve and the index curves of a currency. If the user asks for several scenarios (e.g. one per currency or per shock size), return one scenario each.
+If a part of the request cannot be expressed with these shocks (e.g. cap/floor volatilities, credit, par rate shifts), describe it in unsupported instead of approximating it.
 """
 stress_test_scenario_describer_tool_prompt = """
 You are an Quant Analyst working in a risk management team.
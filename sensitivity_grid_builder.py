@@ -0,0 +1,260 @@
+"""
+sensitivity.xml generated in one pass from a risk factor grid.
+
+Adding the components of sensitivity.xml one tool call at a time takes one call (and one rewrite of the
+file) per curve, currency pair or volatility surface. The grid instead says, per factor type, which names
+to shift and how (shift type, size, tenor buckets), and the names default to everything the market of
+todaysmarket.xml provides, optionally restricted to a list of currencies (factors without a known currency,
+such as most inflation indices, are kept; FX pairs are kept if their foreign currency is in the list).
+Index names of cap/floor volatilities and the currencies of curves whose market specification does not
+name one are looked up in curveconfig.xml. Cross gamma pairs are generated for the factor types listed in the grid, between all
+factors of the same currency, in the substring form of the CrossGammaFilter (e.g.
+'DiscountCurve/EUR,IndexCurve/EUR').
+
+A grid is a dictionary:
+    {"factors": [{"factor": "DiscountCurve", "names": [], "shift_type": None, "shift_size": None,
+                  "tenors": [], "terms": [], "strikes": []}, ...],
+     "currencies": ["EUR", "USD"], "base_currency": None,
+     "cross_gamma_factors": ["DiscountCurve", "IndexCurve"],
+     "compute_gamma": True, "use_spreaded_term_structures": False}
+Empty or missing entries take the defaults of the ORE examples.
+"""
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional
+from xml_document_cache import parse_xml, write_xml
+
+
+class SensitivityFactor:
+    """
+    How one factor type appears in todaysmarket.xml and in sensitivity.xml.
+
+    Args:
+        section, key (str): sensitivity.xml section and the attribute naming the factor, e.g. DiscountCurves, ccy.
+        market_section, market_key (str): todaysmarket.xml section and attribute of its entries, e.g.
+            DiscountingCurves, currency.
+        kind (str): 'curve' (ShiftTenors), 'spot', 'volatility' (ShiftExpiries, ShiftStrikes), 'swaption' (and
+            ShiftTerms), 'capfloor' (and Index) or 'credit' (ShiftTenors and Currency).
+        shift_type (str), shift_size (float): Defaults of the ORE examples.
+        tenors, terms, strikes (List[str]): Default buckets.
+    """
+
+    def __init__(self, section: str, key: str, market_section: str, market_key: str, kind: str, shift_type: str,
+                 shift_size: float, tenors: Optional[List[str]] = None, terms: Optional[List[str]] = None,
+                 strikes: Optional[List[str]] = None):
+        self.section = section
+        self.key = key
+        self.market_section = market_section
+        self.market_key = market_key
+        self.kind = kind
+        self.shift_type = shift_type
+        self.shift_size = shift_size
+        self.tenors = tenors or []
+        self.terms = terms or []
+        self.strikes = strikes or []
+
+
+_curve_tenors = ["6M", "1Y", "2Y", "3Y", "5Y", "7Y", "10Y", "15Y", "20Y"]
+
+# In the order of the sections of the ORE examples.
+sensitivity_factors = {
+    "DiscountCurve": SensitivityFactor("DiscountCurves", "ccy", "DiscountingCurves", "currency", "curve", "Absolute", 0.0001, _curve_tenors),
+    "IndexCurve": SensitivityFactor("IndexCurves", "index", "IndexForwardingCurves", "name", "curve", "Absolute", 0.0001, _curve_tenors),
+    "YieldCurve": SensitivityFactor("YieldCurves", "name", "YieldCurves", "name", "curve", "Absolute", 0.0001, _curve_tenors),
+    "FxSpot": SensitivityFactor("FxSpots", "ccypair", "FxSpots", "pair", "spot", "Relative", 0.01),
+    "FxVolatility": SensitivityFactor("FxVolatilities", "ccypair", "FxVolatilities", "pair", "volatility", "Relative", 0.01,
+                                      ["1Y", "2Y", "3Y", "5Y"]),
+    "SwaptionVolatility": SensitivityFactor("SwaptionVolatilities", "ccy", "SwaptionVolatilities", "currency", "swaption", "Relative",
+                                            0.01, ["1Y", "5Y", "7Y", "10Y"], terms=["1Y", "5Y", "10Y"]),
+    "CapFloorVolatility": SensitivityFactor("CapFloorVolatilities", "ccy", "CapFloorVolatilities", "currency", "capfloor", "Absolute",
+                                            0.0001, ["1Y", "2Y", "3Y", "5Y", "7Y", "10Y"], strikes=["0.01", "0.02", "0.03", "0.04", "0.05"]),
+    "CDSVolatility": SensitivityFactor("CDSVolatilities", "name", "CDSVolatilities", "name", "volatility", "Relative", 0.01,
+                                       ["3M", "6M", "1Y"]),
+    "CreditCurve": SensitivityFactor("CreditCurves", "name", "DefaultCurves", "name", "credit", "Absolute", 0.0001,
+                                     ["6M", "1Y", "2Y", "5Y", "10Y"]),
+    "EquitySpot": SensitivityFactor("EquitySpots", "equity", "EquityCurves", "name", "spot", "Relative", 0.01),
+    "EquityVolatility": SensitivityFactor("EquityVolatilities", "equity", "EquityVolatilities", "name", "volatility", "Relative", 0.01,
+                                          ["6M", "1Y", "2Y", "3Y", "5Y"]),
+    "ZeroInflationIndexCurve": SensitivityFactor("ZeroInflationIndexCurves", "index", "ZeroInflationIndexCurves", "name", "curve",
+                                                 "Absolute", 0.0001, _curve_tenors),
+    "YYInflationIndexCurve": SensitivityFactor("YYInflationIndexCurves", "index", "YYInflationIndexCurves", "name", "curve", "Absolute",
+                                               0.0001, _curve_tenors),
+    "SecuritySpread": SensitivityFactor("SecuritySpreads", "security", "Securities", "name", "spot", "Absolute", 0.0001),
+}
+
+_currency_code = re.compile(r"^[A-Z]{3}$")
+
+
+def _curve_ids(curveconfig: Optional[ET.Element]) -> Dict[str, ET.Element]:
+    """Curve configurations of curveconfig.xml by CurveId."""
+    if curveconfig is None:
+        return {}
+    return {c.findtext("CurveId", "").strip(): c for section in curveconfig for c in section}
+
+
+def market_factors(todaysmarket: ET.Element, curveconfig: Optional[ET.Element] = None) -> Dict[str, Dict[str, Dict[str, str]]]:
+    """
+    Factors the market of todaysmarket.xml provides, merged over all its configurations.
+
+    Returns:
+        Dict[str, Dict[str, Dict[str, str]]]: factor type -> name -> {"currency": ..., "index": ...}; the currency
+        is empty where neither the market specification nor curveconfig.xml gives one, the index is only set for
+        cap/floor volatilities.
+    """
+    curves = _curve_ids(curveconfig)
+    factors = {factor: {} for factor in sensitivity_factors}
+    for factor, definition in sensitivity_factors.items():
+        for section in todaysmarket.findall(definition.market_section):
+            for entry in section:
+                name = entry.get(definition.market_key)
+                if not name or name in factors[factor]:
+                    continue
+                spec = [token for token in (entry.text or "").strip().split("/") if token]
+                curve = curves.get(spec[-1]) if spec else None
+                currency = ""
+                if definition.key == "ccy":
+                    currency = name
+                elif factor == "IndexCurve":
+                    currency = name.split("-")[0]
+                elif len(spec) > 2 and _currency_code.match(spec[1]):
+                    currency = spec[1]
+                elif curve is not None:
+                    currency = curve.findtext("Currency", "").strip()
+                details = {"currency": currency}
+                if definition.kind == "capfloor":
+                    details["index"] = "" if curve is None else (curve.findtext("IborIndex") or curve.findtext("Index") or "").strip()
+                factors[factor][name] = details
+    return factors
+
+
+def _fx_pair(pair: str, base_currency: Optional[str]) -> Optional[str]:
+    """Currency pair as the simulation market quotes it, foreign currency then base currency, None if base is missing."""
+    if not base_currency:
+        return pair
+    if pair[3:] == base_currency:
+        return pair
+    if pair[:3] == base_currency:
+        return pair[3:] + pair[:3]
+    return None
+
+
+def _factor_element(factor: str, name: str, settings: Dict[str, Any], details: Dict[str, str]) -> ET.Element:
+    definition = sensitivity_factors[factor]
+    element = ET.Element(factor, {definition.key: name})
+    if definition.kind == "credit":
+        if not details.get("currency"):
+            raise ValueError(f"No currency found for {factor} {name}.")
+        ET.SubElement(element, "Currency").text = details["currency"]
+    ET.SubElement(element, "ShiftType").text = settings.get("shift_type") or definition.shift_type
+    shift_size = settings.get("shift_size")
+    ET.SubElement(element, "ShiftSize").text = f"{definition.shift_size if shift_size is None else shift_size:.10g}"
+    buckets = ",".join(settings.get("tenors") or definition.tenors)
+    if definition.kind in ("curve", "credit"):
+        ET.SubElement(element, "ShiftTenors").text = buckets
+    elif definition.kind in ("volatility", "swaption", "capfloor"):
+        ET.SubElement(element, "ShiftExpiries").text = buckets
+        strikes = ",".join(settings.get("strikes") or definition.strikes)
+        ET.SubElement(element, "ShiftStrikes").text = strikes or None
+        if definition.kind == "swaption":
+            ET.SubElement(element, "ShiftTerms").text = ",".join(settings.get("terms") or definition.terms)
+        if definition.kind == "capfloor":
+            if not details.get("index"):
+                raise ValueError(f"No index found for {factor} {name}, it has to be configured in curveconfig.xml.")
+            ET.SubElement(element, "Index").text = details["index"]
+    return element
+
+
+def cross_gamma_pairs(selected: Dict[str, Dict[str, Dict[str, str]]], factors: List[str]) -> List[str]:
+    """
+    CrossGammaFilter pairs between all factors of the given types that share a currency, including each factor
+    with itself. Factors named by their currency (DiscountCurve/EUR, IndexCurve/EUR-...) are matched by the
+    currency prefix, which covers every curve of that currency.
+    """
+    by_currency: Dict[str, List[str]] = {}
+    for factor in factors:
+        for name, details in selected.get(factor, {}).items():
+            currency = details.get("currency")
+            if not currency:
+                continue
+            prefix = f"{factor}/{currency}" if name.startswith(currency) else f"{factor}/{name}"
+            members = by_currency.setdefault(currency, [])
+            if prefix not in members:
+                members.append(prefix)
+    pairs = []
+    for members in by_currency.values():
+        for n, first in enumerate(members):
+            pairs.extend(f"{first},{second}" for second in members[n:])
+    return pairs
+
+
+def build_sensitivity_analysis(grid: Dict[str, Any], todaysmarket: Optional[ET.Element] = None,
+                               curveconfig: Optional[ET.Element] = None) -> ET.Element:
+    """
+    <SensitivityAnalysis> root for a grid, see the module docstring for the grid format.
+
+    Args:
+        todaysmarket, curveconfig (Optional[ET.Element]): Roots of todaysmarket.xml and curveconfig.xml; without the
+            market every factor group needs explicit names.
+
+    Raises:
+        ValueError: The grid names an unknown factor type or a factor that cannot be configured.
+    """
+    available = market_factors(todaysmarket, curveconfig) if todaysmarket is not None else {f: {} for f in sensitivity_factors}
+    currencies = set(grid.get("currencies") or [])
+    base_currency = grid.get("base_currency")
+    selected: Dict[str, Dict[str, Dict[str, str]]] = {}
+    elements: Dict[str, List[ET.Element]] = {}
+    for n, settings in enumerate(grid.get("factors") or [], 1):
+        factor = settings.get("factor")
+        if factor not in sensitivity_factors:
+            raise ValueError(f"Factor group {n}: unknown factor '{factor}', factors are {', '.join(sensitivity_factors)}.")
+        names = settings.get("names") or list(available[factor])
+        if not names:
+            raise ValueError(f"Factor group {n}: no {factor} in todaysmarket.xml, give the names explicitly.")
+        for name in names:
+            details = dict(available[factor].get(name, {"currency": ""}))
+            if factor in ("FxSpot", "FxVolatility"):
+                pair = _fx_pair(name, base_currency)
+                if pair is None:
+                    continue
+                name = pair
+                details["currency"] = name[:3]
+                if currencies and not (({name[:3], name[3:]} - {base_currency}) & currencies):
+                    continue
+            elif currencies and details.get("currency") and details["currency"] not in currencies:
+                continue
+            if name in selected.setdefault(factor, {}):
+                continue
+            elements.setdefault(factor, []).append(_factor_element(factor, name, settings, details))
+            selected[factor][name] = details
+
+    root = ET.Element("SensitivityAnalysis")
+    for factor, definition in sensitivity_factors.items():
+        section = ET.SubElement(root, definition.section)
+        section.extend(elements.get(factor, []))
+    cross_gamma = ET.SubElement(root, "CrossGammaFilter")
+    for pair in cross_gamma_pairs(selected, grid.get("cross_gamma_factors") or []):
+        ET.SubElement(cross_gamma, "Pair").text = pair
+    ET.SubElement(root, "ComputeGamma").text = str(grid.get("compute_gamma", True)).lower()
+    ET.SubElement(root, "UseSpreadedTermStructures").text = str(grid.get("use_spreaded_term_structures", False)).lower()
+    return root
+
+
+def write_sensitivity_config(path: str, grid: Dict[str, Any], todaysmarket_path: Optional[str] = None,
+                             curveconfig_path: Optional[str] = None) -> str:
+    """
+    Build sensitivity.xml from a grid and save it at path, replacing the file.
+
+    Returns:
+        str: The number of factors per type and of cross gamma pairs written.
+    """
+    todaysmarket = parse_xml(todaysmarket_path).getroot() if todaysmarket_path else None
+    curveconfig = parse_xml(curveconfig_path).getroot() if curveconfig_path and os.path.isfile(curveconfig_path) else None
+    root = build_sensitivity_analysis(grid, todaysmarket, curveconfig)
+    tree = ET.ElementTree(root)
+    ET.indent(tree, space="  ")
+    write_xml(tree, path, encoding="utf-8", xml_declaration=True)
+    counts = [f"{len(section)} {section.tag}" for section in root if len(section) and section.tag != "CrossGammaFilter"]
+    pairs = len(root.find("CrossGammaFilter"))
+    return f"Wrote {path} with {', '.join(counts) or 'no factors'} and {pairs} cross gamma pairs."
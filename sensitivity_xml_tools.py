@@ -1,9 +1,14 @@
 from langchain.tools import tool
 import xml.etree.ElementTree as ET
-from typing import Dict, List
+from typing import Any, Dict, List, Literal, Optional
 from langchain_anthropic import ChatAnthropic
 import os
+from pydantic import BaseModel, Field
 from config_file import f_path_in
+from xml_document_cache import parse_xml, write_xml
+from xml_edit_session import XmlEditSession, XmlEditError, edit_xml
+from ore_inputs import get_active_analytics, resolve_ore_input_files
+from sensitivity_grid_builder import sensitivity_factors, write_sensitivity_config
 
 
 sensitivity_templates = {
@@ -174,9 +179,132 @@ sensitivity_templates = {
 }
 
 
-# Helper function to save the XML tree (not exposed as a tool)
-def _save_xml(tree: ET.ElementTree, f_path_in) -> None:
-    tree.write(os.path.join(f_path_in, 'sensitivity.xml'), encoding="utf-8", xml_declaration=True)
+class SensitivityFactorGroup(BaseModel):
+    factor: Literal[*sensitivity_factors] = Field(description="Factor type to shift.")
+    names: List[str] = Field([], description="Currencies, indices, currency pairs, curve or equity names to shift, empty for all of this type in todaysmarket.xml.")
+    shift_type: Optional[Literal["Absolute", "Relative"]] = Field(None, description="Empty for the usual convention of the factor type.")
+    shift_size: Optional[float] = Field(None, description="Shift size as a decimal (0.0001 is 1bp), empty for the usual size.")
+    tenors: List[str] = Field([], description="Tenor or expiry buckets, e.g. ['1Y', '5Y', '10Y'], empty for the defaults.")
+    terms: List[str] = Field([], description="Swap terms of swaption volatilities, empty for the defaults.")
+    strikes: List[str] = Field([], description="Strikes of cap/floor volatilities, empty for the defaults.")
+
+class SensitivityGrid(BaseModel):
+    factors: List[SensitivityFactorGroup] = Field(description="One entry per factor type to shift.")
+    currencies: List[str] = Field([], description="Only shift factors of these currencies, empty for all.")
+    base_currency: Optional[str] = Field(None, description="Base currency FX pairs are quoted against, empty for the baseCurrency of ore.xml.")
+    cross_gamma_factors: List[str] = Field([], description="Factor types to compute cross gammas between, for each currency, e.g. ['DiscountCurve', 'IndexCurve'].")
+    compute_gamma: bool = Field(True, description="Compute gamma and cross gamma.")
+    use_spreaded_term_structures: bool = Field(False, description="Use spreaded term structures.")
+
+
+def _sensitivity_path() -> str:
+    return os.path.join(f_path_in, 'sensitivity.xml')
+
+def _edit_sensitivity(operation) -> str:
+    """Apply one edit operation to sensitivity.xml and save it, returns its message or the error."""
+    if not os.path.exists(_sensitivity_path()):
+        return f"Error: File {_sensitivity_path()} does not exist."
+    try:
+        return edit_xml(_sensitivity_path(), operation, encoding="utf-8", xml_declaration=True)
+    except XmlEditError as e:
+        return f"Error: {e}"
+
+def _find_component(root: ET.Element, component_type: str, identifier: Dict[str, str]) -> ET.Element:
+    component_section = root.find(component_type + 's')
+    if component_section is None:
+        raise XmlEditError(f"No {component_type}s section found in {_sensitivity_path()}")
+    for component in component_section.findall(component_type):
+        if all(component.get(key) == value for key, value in identifier.items()):
+            return component
+    raise XmlEditError(f"No matching {component_type} found with identifier {identifier}")
+
+def _add_market_component(root: ET.Element, component_type: str, attributes: Dict[str, str], shifts: Dict[str, str]) -> str:
+    component_section = root.find(component_type + 's')  # e.g., DiscountCurves, FxSpots
+    
+    if component_section is None:
+        component_section = ET.SubElement(root, component_type + 's')
+    
+    new_component = ET.SubElement(component_section, component_type, attributes)
+    for key, value in shifts.items():
+        ET.SubElement(new_component, key).text = value
+    return f"Added {component_type} with attributes {attributes} and shifts {shifts} to {_sensitivity_path()}"
+
+def _modify_market_component(root: ET.Element, component_type: str, identifier: Dict[str, str], new_shifts: Dict[str, str]) -> str:
+    component = _find_component(root, component_type, identifier)
+    for key, value in new_shifts.items():
+        element = component.find(key)
+        if element is not None:
+            element.text = value
+        else:
+            ET.SubElement(component, key).text = value
+    return f"Modified {component_type} with identifier {identifier} in {_sensitivity_path()}"
+
+def _delete_market_component(root: ET.Element, component_type: str, identifier: Dict[str, str]) -> str:
+    root.find(component_type + 's').remove(_find_component(root, component_type, identifier))
+    return f"Deleted {component_type} with identifier {identifier} from {_sensitivity_path()}"
+
+def _add_cross_gamma_pair(root: ET.Element, pair: str) -> str:
+    cross_gamma_filter = root.find("CrossGammaFilter")
+    
+    if cross_gamma_filter is None:
+        cross_gamma_filter = ET.SubElement(root, "CrossGammaFilter")
+    
+    # Check if pair already exists
+    for existing_pair in cross_gamma_filter.findall("Pair"):
+        if existing_pair.text == pair:
+            return f"Pair {pair} already exists in CrossGammaFilter"
+    
+    ET.SubElement(cross_gamma_filter, "Pair").text = pair
+    return f"Added pair {pair} to CrossGammaFilter in {_sensitivity_path()}"
+
+def _delete_cross_gamma_pair(root: ET.Element, pair: str) -> str:
+    cross_gamma_filter = root.find("CrossGammaFilter")
+    
+    if cross_gamma_filter is None:
+        raise XmlEditError(f"No CrossGammaFilter section found in {_sensitivity_path()}")
+    
+    for existing_pair in cross_gamma_filter.findall("Pair"):
+        if existing_pair.text == pair:
+            cross_gamma_filter.remove(existing_pair)
+            return f"Deleted pair {pair} from CrossGammaFilter in {_sensitivity_path()}"
+    
+    raise XmlEditError(f"Pair {pair} not found in CrossGammaFilter")
+
+def _set_flag(root: ET.Element, tag: str, value: bool) -> str:
+    flag = root.find(tag)
+    
+    if flag is None:
+        flag = ET.SubElement(root, tag)
+    
+    flag.text = str(value).lower()
+    return f"Set {tag} to {value} in {_sensitivity_path()}"
+
+def _insert_risk_factor_template(root: ET.Element, component_type: str) -> str:
+    if component_type not in sensitivity_templates:
+        raise XmlEditError(f"Invalid component type '{component_type}'. Supported types: {list(sensitivity_templates.keys())}")
+
+    # Determine the section name (plural form, e.g., DiscountCurves)
+    section_name = component_type + "s" if not component_type.endswith("s") else component_type
+    
+    # Check if the section already exists
+    if root.find(section_name) is not None:
+        return f"Section '{section_name}' already exists in {_sensitivity_path()}. No changes made."
+
+    # Parse the template and insert it
+    template_root = ET.fromstring(sensitivity_templates[component_type])
+    root.append(template_root)  # Append the entire section (e.g., <DiscountCurves>)
+    return f"Inserted '{component_type}' template into {_sensitivity_path()} under '{section_name}' section."
+
+sensitivity_edit_actions = {
+    "add_component": _add_market_component,
+    "modify_component": _modify_market_component,
+    "delete_component": _delete_market_component,
+    "add_cross_gamma_pair": _add_cross_gamma_pair,
+    "delete_cross_gamma_pair": _delete_cross_gamma_pair,
+    "set_compute_gamma": lambda root, value: _set_flag(root, "ComputeGamma", value),
+    "set_use_spreaded_term_structures": lambda root, value: _set_flag(root, "UseSpreadedTermStructures", value),
+    "insert_template": _insert_risk_factor_template,
+}
 
 @tool
 def add_market_component(component_type: str, attributes: Dict[str, str], shifts: Dict[str, str]) -> str:
@@ -191,22 +319,7 @@ def add_market_component(component_type: str, attributes: Dict[str, str], shifts
     Returns:
         str: Success confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    component_section = root.find(component_type + 's')  # e.g., DiscountCurves, FxSpots
-    
-    if component_section is None:
-        component_section = ET.SubElement(root, component_type + 's')
-    
-    new_component = ET.SubElement(component_section, component_type, attributes)
-    for key, value in shifts.items():
-        ET.SubElement(new_component, key).text = value
-    
-    _save_xml(tree, f_path_in)
-    return f"Added {component_type} with attributes {attributes} and shifts {shifts} to {os.path.join(f_path_in, 'sensitivity.xml')}"
+    return _edit_sensitivity(lambda root: _add_market_component(root, component_type, attributes, shifts))
 
 @tool
 def modify_market_component(component_type: str, identifier: Dict[str, str], new_shifts: Dict[str, str]) -> str:
@@ -221,28 +334,7 @@ def modify_market_component(component_type: str, identifier: Dict[str, str], new
     Returns:
         Confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    component_section = root.find(component_type + 's')
-    
-    if component_section is None:
-        return f"Error: No {component_type}s section found in {os.path.join(f_path_in, 'sensitivity.xml')}"
-    
-    for component in component_section.findall(component_type):
-        if all(component.get(key) == value for key, value in identifier.items()):
-            for key, value in new_shifts.items():
-                element = component.find(key)
-                if element is not None:
-                    element.text = value
-                else:
-                    ET.SubElement(component, key).text = value
-            _save_xml(tree, f_path_in)
-            return f"Modified {component_type} with identifier {identifier} in {os.path.join(f_path_in, 'sensitivity.xml')}"
-    
-    return f"Error: No matching {component_type} found with identifier {identifier}"
+    return _edit_sensitivity(lambda root: _modify_market_component(root, component_type, identifier, new_shifts))
 
 @tool
 def delete_market_component(component_type: str, identifier: Dict[str, str]) -> str:
@@ -256,23 +348,36 @@ def delete_market_component(component_type: str, identifier: Dict[str, str]) ->
     Returns:
         str: Success confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    component_section = root.find(component_type + 's')
-    
-    if component_section is None:
-        return f"Error: No {component_type}s section found in {os.path.join(f_path_in, 'sensitivity.xml')}"
-    
-    for component in component_section.findall(component_type):
-        if all(component.get(key) == value for key, value in identifier.items()):
-            component_section.remove(component)
-            _save_xml(tree, f_path_in)
-            return f"Deleted {component_type} with identifier {identifier} from {os.path.join(f_path_in, 'sensitivity.xml')}"
-    
-    return f"Error: No matching {component_type} found with identifier {identifier}"
+    return _edit_sensitivity(lambda root: _delete_market_component(root, component_type, identifier))
+
+@tool
+def edit_sensitivity_xml(edits: List[Dict[str, Any]]) -> str:
+    """
+    Apply several edits to the sensitivity.xml file in one go. The edits are applied in order and saved
+    together; if one of them fails, none is saved. Prefer this over many calls of the single edit tools.
+
+    Args:
+        edits (List[Dict[str, Any]]): The edits, each one of
+            {"action": "add_component", "component_type": "DiscountCurve", "attributes": {"ccy": "USD"}, "shifts": {"ShiftType": "Absolute", "ShiftSize": "0.0001", "ShiftTenors": "1Y,2Y"}},
+            {"action": "modify_component", "component_type": "DiscountCurve", "identifier": {"ccy": "EUR"}, "new_shifts": {"ShiftSize": "0.001"}},
+            {"action": "delete_component", "component_type": "FxSpot", "identifier": {"ccypair": "USDEUR"}},
+            {"action": "add_cross_gamma_pair", "pair": "DiscountCurve/EUR,IndexCurve/EUR"},
+            {"action": "delete_cross_gamma_pair", "pair": "DiscountCurve/EUR,IndexCurve/EUR"},
+            {"action": "set_compute_gamma", "value": true},
+            {"action": "set_use_spreaded_term_structures", "value": false},
+            {"action": "insert_template", "component_type": "FxSpot"}.
+
+    Returns:
+        str: One confirmation line per edit, or the reason why no edit was saved.
+    """
+    if not os.path.exists(_sensitivity_path()):
+        return f"Error: File {_sensitivity_path()} does not exist."
+    try:
+        session = XmlEditSession(_sensitivity_path(), encoding="utf-8", xml_declaration=True)
+        session.queue_edits(edits, sensitivity_edit_actions)
+        return "\n".join(session.commit())
+    except XmlEditError as e:
+        return f"Error: {e}"
 
 @tool
 def query_market_component(component_type: str, identifier: Dict[str, str]) -> Dict:
@@ -289,7 +394,7 @@ def query_market_component(component_type: str, identifier: Dict[str, str]) -> D
     if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
         return {"error": f"File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist"}
     
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
+    tree = parse_xml(os.path.join(f_path_in, 'sensitivity.xml'))
     root = tree.getroot()
     component_section = root.find(component_type + 's')
     
@@ -316,24 +421,7 @@ def add_cross_gamma_pair(pair: str) -> str:
     Returns:
         str: Success confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    cross_gamma_filter = root.find("CrossGammaFilter")
-    
-    if cross_gamma_filter is None:
-        cross_gamma_filter = ET.SubElement(root, "CrossGammaFilter")
-    
-    # Check if pair already exists
-    for existing_pair in cross_gamma_filter.findall("Pair"):
-        if existing_pair.text == pair:
-            return f"Pair {pair} already exists in CrossGammaFilter"
-    
-    ET.SubElement(cross_gamma_filter, "Pair").text = pair
-    _save_xml(tree, f_path_in)
-    return f"Added pair {pair} to CrossGammaFilter in {os.path.join(f_path_in, 'sensitivity.xml')}"
+    return _edit_sensitivity(lambda root: _add_cross_gamma_pair(root, pair))
 
 @tool
 def delete_cross_gamma_pair(pair: str) -> str:
@@ -346,23 +434,7 @@ def delete_cross_gamma_pair(pair: str) -> str:
     Returns:
         str: Success confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    cross_gamma_filter = root.find("CrossGammaFilter")
-    
-    if cross_gamma_filter is None:
-        return f"Error: No CrossGammaFilter section found in {os.path.join(f_path_in, 'sensitivity.xml')}"
-    
-    for existing_pair in cross_gamma_filter.findall("Pair"):
-        if existing_pair.text == pair:
-            cross_gamma_filter.remove(existing_pair)
-            _save_xml(tree, f_path_in)
-            return f"Deleted pair {pair} from CrossGammaFilter in {os.path.join(f_path_in, 'sensitivity.xml')}"
-    
-    return f"Error: Pair {pair} not found in CrossGammaFilter"
+    return _edit_sensitivity(lambda root: _delete_cross_gamma_pair(root, pair))
 
 @tool
 def toggle_compute_gamma(value: bool) -> str:
@@ -375,19 +447,7 @@ def toggle_compute_gamma(value: bool) -> str:
     Returns:
         str: Success confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    compute_gamma = root.find("ComputeGamma")
-    
-    if compute_gamma is None:
-        compute_gamma = ET.SubElement(root, "ComputeGamma")
-    
-    compute_gamma.text = str(value).lower()
-    _save_xml(tree, f_path_in)
-    return f"Set ComputeGamma to {value} in {os.path.join(f_path_in, 'sensitivity.xml')}"
+    return _edit_sensitivity(lambda root: _set_flag(root, "ComputeGamma", value))
 
 @tool
 def toggle_use_spreaded_term_structures(value: bool) -> str:
@@ -400,19 +460,7 @@ def toggle_use_spreaded_term_structures(value: bool) -> str:
     Returns:
         str: Success confirmation or error message
     """
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist."
-    
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
-    spreaded_term = root.find("UseSpreadedTermStructures")
-    
-    if spreaded_term is None:
-        spreaded_term = ET.SubElement(root, "UseSpreadedTermStructures")
-    
-    spreaded_term.text = str(value).lower()
-    _save_xml(tree, f_path_in)
-    return f"Set UseSpreadedTermStructures to {value} in {os.path.join(f_path_in, 'sensitivity.xml')}"
+    return _edit_sensitivity(lambda root: _set_flag(root, "UseSpreadedTermStructures", value))
 
 @tool
 def list_market_components(component_type: str) -> List[Dict]:
@@ -428,7 +476,7 @@ def list_market_components(component_type: str) -> List[Dict]:
     if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
         return [{"error": f"File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist"}]
     
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
+    tree = parse_xml(os.path.join(f_path_in, 'sensitivity.xml'))
     root = tree.getroot()
     component_section = root.find(component_type + 's')
     
@@ -515,7 +563,7 @@ def create_new_sensitivity_xml() -> str:
 
     # Create the ElementTree object and save the file
     tree = ET.ElementTree(root)
-    tree.write(os.path.join(f_path_in, 'sensitivity.xml'), encoding="utf-8", xml_declaration=True)
+    write_xml(tree, os.path.join(f_path_in, 'sensitivity.xml'), encoding="utf-8", xml_declaration=True)
 
     return f"Successfully created new sensitivity.xml file at {os.path.join(f_path_in, 'sensitivity.xml')} with minimal template structure."
 
@@ -535,28 +583,40 @@ def insert_risk_factor_template(component_type: str) -> str:
         return f"Error: Invalid component type '{component_type}'. Supported types: {list(sensitivity_templates.keys())}"
     
     # Check if file exists
-    if not os.path.exists(os.path.join(f_path_in, 'sensitivity.xml')):
-        return f"Error: File {os.path.join(f_path_in, 'sensitivity.xml')} does not exist. Please create it first using create_new_sensitivity_xml."
+    if not os.path.exists(_sensitivity_path()):
+        return f"Error: File {_sensitivity_path()} does not exist. Please create it first using create_new_sensitivity_xml."
 
-    # Parse the existing XML file
-    tree = ET.parse(os.path.join(f_path_in, 'sensitivity.xml'))
-    root = tree.getroot()
+    return _edit_sensitivity(lambda root: _insert_risk_factor_template(root, component_type))
 
-    # Determine the section name (plural form, e.g., DiscountCurves)
-    section_name = component_type + "s" if not component_type.endswith("s") else component_type
-    
-    # Check if the section already exists
-    if root.find(section_name) is not None:
-        return f"Section '{section_name}' already exists in {os.path.join(f_path_in, 'sensitivity.xml')}. No changes made."
-
-    # Parse the template and insert it
-    template_root = ET.fromstring(sensitivity_templates[component_type])
-    root.append(template_root)  # Append the entire section (e.g., <DiscountCurves>)
-
-    # Save the modified XML
-    tree.write(os.path.join(f_path_in, 'sensitivity.xml'), encoding="utf-8", xml_declaration=True)
-    return f"Inserted '{component_type}' template into {os.path.join(f_path_in, 'sensitivity.xml')} under '{section_name}' section."
+@tool
+def build_sensitivity_xml_from_grid(grid: SensitivityGrid) -> str:
+    """
+    Create the whole sensitivity.xml file in one go from a grid of factor types, currencies, shifts and tenor
+    buckets, replacing the current file. Factor names default to everything in todaysmarket.xml, and cross gamma
+    pairs are generated per currency. Prefer this over many add_market_component calls when configuring more
+    than a few components.
 
+    Args:
+        grid (SensitivityGrid): e.g. {"factors": [{"factor": "DiscountCurve"}, {"factor": "IndexCurve", "tenors": ["1Y", "5Y", "10Y"]},
+            {"factor": "FxSpot", "shift_size": 0.01}], "currencies": ["EUR", "USD"], "cross_gamma_factors": ["DiscountCurve", "IndexCurve"]}
 
-list_sensitivity_tools = [add_market_component, modify_market_component, delete_market_component, query_market_component, toggle_compute_gamma, toggle_use_spreaded_term_structures, list_market_components, seek_advise_on_sensitivity_xml, add_cross_gamma_pair, delete_cross_gamma_pair,insert_risk_factor_template, create_new_sensitivity_xml]
+    Returns:
+        str: The number of components written per section, or an error message
+    """
+    try:
+        input_files = resolve_ore_input_files(f_path_in)
+        grid = grid.model_dump()
+        if not grid["base_currency"]:
+            base_currencies = [params["baseCurrency"] for params in get_active_analytics(input_files["ore.xml"]).values() if params.get("baseCurrency")]
+            grid["base_currency"] = base_currencies[0] if base_currencies else None
+        return write_sensitivity_config(_sensitivity_path(), grid, input_files.get("Setup/marketConfigFile"), input_files.get("Setup/curveConfigFile"))
+    except ValueError as e:
+        return f"Error: {e}"
+    except ET.ParseError:
+        return "Error parsing XML file."
+    except FileNotFoundError as e:
+        return f"Error: File not found: {e.filename}"
+
+
+list_sensitivity_tools = [add_market_component, modify_market_component, delete_market_component, edit_sensitivity_xml, query_market_component, toggle_compute_gamma, toggle_use_spreaded_term_structures, list_market_components, seek_advise_on_sensitivity_xml, add_cross_gamma_pair, delete_cross_gamma_pair,insert_risk_factor_template, create_new_sensitivity_xml, build_sensitivity_xml_from_grid]
 list_sensitivity_tools_description = [i.name+" : "+i.description +'\n\n' for n, i in enumerate(list_sensitivity_tools)]
@@ -0,0 +1,303 @@
+"""
+Stress test scenarios built from a few parameters and merged into stresstest.xml.
+
+A scenario is a list of shocks, each given by the risk factor it moves (e.g. DiscountCurve EUR), a shape
+and a size. The shape spreads the size over the tenors (or expiries) of the factor:
+    - parallel: the same shift everywhere.
+    - twist: linear in time from short_size (default -size) at the first tenor to size at the last one.
+    - butterfly: size at the first and last tenor, belly_size (default -size) at the pivot tenor, linear
+      in between.
+    - key_rate: size at the pivot tenor and zero at every other tenor, which ORE interpolates into a
+      triangular bump between the neighbouring tenors.
+The shocks are written in the format of the ORE examples, and merge_stress_tests adds the scenarios to
+the StressTesting root (or replaces scenarios of the same id) without touching the other scenarios, so
+the agent only has to produce the parameters instead of the whole file.
+"""
+import os
+import re
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional
+from xml_edit_session import XmlEditError, edit_xml
+
+# Sections of a StressTest, in the order of the ORE examples.
+scenario_sections = ["DiscountCurves", "IndexCurves", "YieldCurves", "FxSpots", "FxVolatilities", "SwaptionVolatilities",
+                     "CapFloorVolatilities", "EquitySpots", "EquityVolatilities", "SecuritySpreads", "RecoveryRates",
+                     "SurvivalProbabilities"]
+
+# Shockable factor: (section, key attribute, kind, default shift type)
+shock_factors = {
+    "DiscountCurve": ("DiscountCurves", "ccy", "curve", "Absolute"),
+    "IndexCurve": ("IndexCurves", "index", "curve", "Absolute"),
+    "YieldCurve": ("YieldCurves", "name", "curve", "Absolute"),
+    "FxSpot": ("FxSpots", "ccypair", "spot", "Relative"),
+    "FxVolatility": ("FxVolatilities", "ccypair", "volatility", "Absolute"),
+    "SwaptionVolatility": ("SwaptionVolatilities", "ccy", "swaption", "Absolute"),
+    "EquitySpot": ("EquitySpots", "equity", "spot", "Relative"),
+    "EquityVolatility": ("EquityVolatilities", "equity", "volatility", "Relative"),
+}
+shock_shapes = ["parallel", "twist", "butterfly", "key_rate"]
+
+default_curve_tenors = ["6M", "1Y", "2Y", "3Y", "5Y", "7Y", "10Y", "15Y", "20Y"]
+default_volatility_expiries = ["6M", "1Y", "2Y", "3Y", "5Y"]
+default_swaption_expiries = ["1Y", "5Y", "10Y"]
+default_swaption_terms = ["1Y", "5Y", "10Y"]
+
+_empty_configuration = b'<?xml version="1.0" encoding="utf-8"?>\n<StressTesting>\n</StressTesting>\n'
+_period_units = {"D": 1 / 365.0, "W": 7 / 365.0, "M": 1 / 12.0, "Y": 1.0}
+
+
+def tenor_years(tenor: str) -> float:
+    """Length of an ORE period such as '6M', '10Y' or '1Y6M' in years."""
+    parts = re.findall(r"(\d+)([DWMY])", tenor.strip().upper())
+    if not parts or "".join(n + u for n, u in parts) != tenor.strip().upper():
+        raise ValueError(f"Invalid tenor '{tenor}', expected e.g. 6M, 1Y or 1Y6M.")
+    return sum(int(n) * _period_units[u] for n, u in parts)
+
+
+def _format_shift(value: float) -> str:
+    return f"{value:.10g}"
+
+
+def shock_profile(shape: str, size: float, tenors: List[str], pivot: Optional[str] = None,
+                  short_size: Optional[float] = None, belly_size: Optional[float] = None) -> List[float]:
+    """
+    Shift at every tenor for a shock shape.
+
+    Args:
+        tenors (List[str]): Tenors in increasing order.
+
+    Raises:
+        ValueError: Unknown shape, tenors not increasing, or pivot missing from tenors for a butterfly or key
+            rate shock.
+    """
+    years = [tenor_years(t) for t in tenors]
+    if any(a >= b for a, b in zip(years, years[1:])):
+        raise ValueError(f"The tenors {','.join(tenors)} are not in increasing order or contain the same tenor twice.")
+    if shape == "parallel":
+        return [size] * len(tenors)
+    if shape == "twist":
+        short_size = -size if short_size is None else short_size
+        if len(tenors) < 2:
+            return [size] * len(tenors)
+        return [short_size + (size - short_size) * (t - years[0]) / (years[-1] - years[0]) for t in years]
+    if shape not in ("butterfly", "key_rate"):
+        raise ValueError(f"Unknown shock shape '{shape}', shapes are {', '.join(shock_shapes)}.")
+    if pivot is None and shape == "butterfly":
+        pivot = tenors[len(tenors) // 2]
+    if pivot not in tenors:
+        raise ValueError(f"The {shape} pivot '{pivot}' is not one of the tenors {','.join(tenors)}.")
+    centre = years[tenors.index(pivot)]
+    if shape == "key_rate":
+        return [size if t == centre else 0.0 for t in years]
+    belly_size = -size if belly_size is None else belly_size
+    profile = []
+    for t in years:
+        if t <= centre:
+            w = 0.0 if centre == years[0] else (centre - t) / (centre - years[0])
+        else:
+            w = (t - centre) / (years[-1] - centre)
+        profile.append(belly_size + (size - belly_size) * w)
+    return profile
+
+
+def _shock_tenors(tenors: List[str], pivot: Optional[str]) -> List[str]:
+    """
+    Tenors sorted by length, with pivot inserted if it is not one of them.
+
+    Raises:
+        ValueError: Two tenors of the same length, e.g. 1Y and 12M.
+    """
+    tenors = sorted(list(tenors) + ([pivot] if pivot is not None and pivot not in tenors else []), key=tenor_years)
+    for shorter, longer in zip(tenors, tenors[1:]):
+        if tenor_years(shorter) == tenor_years(longer):
+            raise ValueError(f"The tenors {shorter} and {longer} are the same, give every tenor once.")
+    return tenors
+
+
+def build_shock(factor: str, name: str, shape: str = "parallel", size: float = 0.0, pivot: Optional[str] = None,
+                short_size: Optional[float] = None, belly_size: Optional[float] = None, shift_type: Optional[str] = None,
+                tenors: Optional[List[str]] = None, terms: Optional[List[str]] = None) -> ET.Element:
+    """
+    Element shocking one risk factor, e.g. <DiscountCurve ccy="EUR">.
+
+    Args:
+        factor (str): One of shock_factors, e.g. 'DiscountCurve' or 'FxSpot'.
+        name (str): Currency, index, curve name, currency pair or equity, as the factor's key attribute expects.
+        shape (str): One of shock_shapes, spot shocks are always parallel.
+        size (float): Shift as a decimal (0.01 is 100bp absolute or 1% relative).
+        pivot (Optional[str]): Belly tenor of a butterfly (default the middle tenor) or bumped tenor of a key rate
+            shock; added to the tenors if missing.
+        short_size, belly_size (Optional[float]): Short end of a twist and belly of a butterfly, default -size.
+        shift_type (Optional[str]): 'Absolute' or 'Relative', default by factor.
+        tenors (Optional[List[str]]): Curve tenors or volatility expiries, default as in the ORE examples. They are
+            written in increasing order, as ORE expects.
+        terms (Optional[List[str]]): Swap terms of a swaption volatility shock.
+
+    Raises:
+        ValueError: The parameters do not describe a valid shock.
+    """
+    if factor not in shock_factors:
+        raise ValueError(f"Unknown factor '{factor}', factors are {', '.join(shock_factors)}.")
+    if not name:
+        raise ValueError(f"A {factor} shock needs a name.")
+    section, key, kind, default_shift_type = shock_factors[factor]
+    shift_type = shift_type or default_shift_type
+    if shift_type not in ("Absolute", "Relative"):
+        raise ValueError(f"Invalid shift type '{shift_type}', expected Absolute or Relative.")
+    element = ET.Element(factor, {key: name})
+    ET.SubElement(element, "ShiftType").text = shift_type
+    if kind == "spot":
+        if shape != "parallel":
+            raise ValueError(f"{factor} shocks have no term structure, only the parallel shape applies.")
+        ET.SubElement(element, "ShiftSize").text = _format_shift(size)
+        return element
+    if kind == "curve":
+        tenors = _shock_tenors(tenors or default_curve_tenors, pivot)
+    elif kind == "volatility":
+        tenors = _shock_tenors(tenors or default_volatility_expiries, pivot)
+    else:
+        tenors = _shock_tenors(tenors or default_swaption_expiries, pivot)
+    profile = shock_profile(shape, size, tenors, pivot, short_size, belly_size)
+    if kind == "curve":
+        ET.SubElement(element, "Shifts").text = ",".join(_format_shift(v) for v in profile)
+        ET.SubElement(element, "ShiftTenors").text = ",".join(tenors)
+    elif kind == "volatility":
+        ET.SubElement(element, "Shifts").text = ",".join(_format_shift(v) for v in profile)
+        ET.SubElement(element, "ShiftExpiries").text = ",".join(tenors)
+    else:
+        # the shape runs along the expiries, every term of an expiry gets the same shift
+        terms = terms or default_swaption_terms
+        for term in terms:
+            tenor_years(term)
+        shifts = ET.SubElement(element, "Shifts")
+        ET.SubElement(shifts, "Shift").text = _format_shift(size if shape == "parallel" else 0.0)
+        for expiry, value in zip(tenors, profile):
+            for term in terms:
+                ET.SubElement(shifts, "Shift", {"expiry": expiry, "term": term}).text = _format_shift(value)
+        ET.SubElement(element, "ShiftExpiries").text = ",".join(tenors)
+        ET.SubElement(element, "ShiftTerms").text = ",".join(terms)
+    return element
+
+
+def build_stress_test(scenario_id: str, shocks: List[Dict[str, Any]]) -> ET.Element:
+    """
+    <StressTest> element with every section of the ORE examples, filled with the given shocks.
+
+    Args:
+        scenario_id (str): The id attribute of the scenario.
+        shocks (List[Dict[str, Any]]): Keyword arguments of build_shock, one dictionary per shock.
+
+    Raises:
+        ValueError: Invalid shock parameters, or two shocks of the same factor and name.
+    """
+    if not scenario_id:
+        raise ValueError("A stress test needs an id.")
+    stress_test = ET.Element("StressTest", {"id": scenario_id})
+    sections = {section: ET.SubElement(stress_test, section) for section in scenario_sections}
+    seen = set()
+    for n, shock in enumerate(shocks, 1):
+        try:
+            element = build_shock(**shock)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Scenario {scenario_id}, shock {n}: {str(e).rstrip('.')}.") from e
+        if (element.tag, shock.get("name")) in seen:
+            raise ValueError(f"Scenario {scenario_id} shocks {element.tag} {shock.get('name')} twice.")
+        seen.add((element.tag, shock.get("name")))
+        sections[shock_factors[element.tag][0]].append(element)
+    return stress_test
+
+
+def merge_stress_tests(root: ET.Element, stress_tests: List[ET.Element], replace: bool = True) -> str:
+    """
+    Edit operation adding stress tests to a StressTesting root; a stress test with the id of an existing one
+    takes its place if replace is set. The other scenarios are left as they are.
+    """
+    if root.tag != "StressTesting":
+        raise XmlEditError(f"Expected a StressTesting root element, found {root.tag}.")
+    positions = {child.get("id"): n for n, child in enumerate(root) if child.tag == "StressTest"}
+    added, replaced = [], []
+    for stress_test in stress_tests:
+        scenario_id = stress_test.get("id")
+        if scenario_id in positions:
+            if not replace:
+                raise XmlEditError(f"Stress test {scenario_id} already exists.")
+            root[positions[scenario_id]] = stress_test
+            replaced.append(scenario_id)
+        else:
+            positions[scenario_id] = len(root)
+            root.append(stress_test)
+            added.append(scenario_id)
+    messages = []
+    if added:
+        messages.append(f"Added {len(added)} stress test(s): {', '.join(added)}.")
+    if replaced:
+        messages.append(f"Replaced {len(replaced)} stress test(s): {', '.join(replaced)}.")
+    return " ".join(messages) or "No stress tests given."
+
+
+def _is_blank(path: str) -> bool:
+    """A file shorter than an empty configuration that holds only whitespace."""
+    if os.path.getsize(path) >= len(_empty_configuration):
+        return False
+    with open(path, "rb") as f:
+        return not f.read().strip()
+
+
+def write_stress_scenarios(path: str, scenarios: List[Dict[str, Any]], replace: bool = True) -> str:
+    """
+    Build scenarios from their parameters and merge them into a stress test configuration file, which is
+    created if it is missing or empty. All scenarios are saved together or, if one is invalid, none.
+
+    Args:
+        path (str): The stresstest.xml file.
+        scenarios (List[Dict[str, Any]]): {"id": ..., "shocks": [build_shock keyword arguments, ...]} per scenario.
+        replace (bool): Replace scenarios with the same id, otherwise adding one of them is an error.
+
+    Returns:
+        str: What was added and replaced.
+
+    Raises:
+        ValueError: Invalid scenario parameters, or an id used twice in scenarios.
+        XmlEditError: A scenario exists and replace is not set. Nothing was saved.
+    """
+    ids = [scenario.get("id") for scenario in scenarios]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"Scenario ids given more than once: {', '.join(duplicates)}.")
+    stress_tests = [build_stress_test(scenario.get("id"), scenario.get("shocks", [])) for scenario in scenarios]
+    if not os.path.isfile(path) or _is_blank(path):
+        with open(path, "wb") as f:
+            f.write(_empty_configuration)
+    return edit_xml(path, lambda root: merge_stress_tests(root, stress_tests, replace), indent="  ",
+                    encoding="utf-8", xml_declaration=True)
+
+
+def benchmark_stress_scenarios(scenarios: int = 100, path: str = "stresstest_benchmark.xml") -> str:
+    """Time adding scenarios one call at a time to a copy of Example_15's stresstest.xml and check nothing is lost."""
+    import time
+    import shutil
+    shutil.copyfile(os.path.join("Examples", "Example_15", "Input", "stresstest.xml"), path)
+    existing = [ET.canonicalize(ET.tostring(t), strip_text=True) for t in ET.parse(path).getroot()]
+    shapes = [{"shape": "parallel"}, {"shape": "twist"}, {"shape": "butterfly"}, {"shape": "key_rate", "pivot": "5Y"}]
+    try:
+        start = time.perf_counter()
+        for n in range(scenarios):
+            shape = shapes[n % len(shapes)]
+            write_stress_scenarios(path, [{"id": f"benchmark_{n}", "shocks": [
+                dict(factor="DiscountCurve", name="EUR", size=0.0001 * (n + 1), **shape),
+                dict(factor="IndexCurve", name="EUR-EURIBOR-6M", size=0.0001 * (n + 1), **shape),
+                dict(factor="FxSpot", name="USDEUR", size=0.01),
+                dict(factor="FxVolatility", name="USDEUR", size=0.01, **shape),
+                dict(factor="SwaptionVolatility", name="EUR", size=0.001, **shape)]}])
+        elapsed = time.perf_counter() - start
+        root = ET.parse(path).getroot()
+        kept = [ET.canonicalize(ET.tostring(t), strip_text=True) for t in root[:len(existing)]]
+        assert kept == existing, "existing scenarios changed"
+        assert [t.get("id") for t in root[len(existing):]] == [f"benchmark_{n}" for n in range(scenarios)]
+        return f"added {scenarios} scenarios one by one in {elapsed:.2f} s, {len(existing)} existing scenarios unchanged"
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    print(benchmark_stress_scenarios())
@@ -1,17 +1,35 @@
 from langchain.tools import tool
 import xml.etree.ElementTree as ET
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional
 import os
 from react_agent_system_prompts import stress_config_agent_system_prompt_content, stress_test_scenario_transaltor_tool_prompt, stress_test_scenario_describer_tool_prompt
 from pydantic import BaseModel, Field
 from langchain_core.messages import HumanMessage, SystemMessage
 from config_file import f_path_in
+from xml_edit_session import XmlEditError
+from stress_scenario_builder import shock_factors, shock_shapes, write_stress_scenarios
 from llm_manager import llm
 
 
-class GetXMLResponse(BaseModel):
-    content: str = Field(str, description="Content of the XML generated based on scenario described.")
-    summary: str = Field(str, description="Summary of the XML generated based on scenario described. Should highlight what change was made and if the task was successful.")
+class StressShockParameters(BaseModel):
+    factor: Literal[*shock_factors] = Field(description="Risk factor to shock.")
+    name: str = Field(description="Currency (DiscountCurve, SwaptionVolatility), index (IndexCurve), curve name (YieldCurve), currency pair (FxSpot, FxVolatility) or equity (EquitySpot, EquityVolatility).")
+    shape: Literal[*shock_shapes] = Field("parallel", description="Shape of the shift over the tenors, spot shocks are parallel.")
+    size: float = Field(description="Shift as a decimal, 0.01 is 100bp or 1%. Long end of a twist, wings of a butterfly, bumped tenor of a key rate shock.")
+    short_size: Optional[float] = Field(None, description="Short end of a twist, default -size.")
+    belly_size: Optional[float] = Field(None, description="Belly of a butterfly, default -size.")
+    pivot: Optional[str] = Field(None, description="Belly tenor of a butterfly or bumped tenor of a key rate shock, e.g. 5Y.")
+    shift_type: Optional[Literal["Absolute", "Relative"]] = Field(None, description="Empty for the usual convention of the factor.")
+    tenors: List[str] = Field([], description="Curve tenors or volatility expiries, empty for the defaults.")
+    terms: List[str] = Field([], description="Swap terms of a swaption volatility shock, empty for the defaults.")
+
+class StressScenarioParameters(BaseModel):
+    id: str = Field(description="Unique id describing the scenario, e.g. eur_rates_up_100bp.")
+    shocks: List[StressShockParameters] = Field(description="Shocks applied together in this scenario.")
+
+class StressScenarioRequest(BaseModel):
+    scenarios: List[StressScenarioParameters] = Field(description="Stress scenarios requested by the user.")
+    unsupported: str = Field("", description="Parts of the request that cannot be expressed with these shocks, empty if none.")
 
 class GetDescriptionofScenarios(BaseModel):
     summary: str = Field(str, description="Summary describing the scenario in the XML queried by user. Summary should be detailed enough based on user query.")
@@ -21,6 +39,7 @@ class GetDescriptionofScenarios(BaseModel):
 def translate_to_stress_test_config(user_query: str) -> str:
     """
     Translate scenario description in user query to stress scenarios in stress test configuration file.
+    Scenarios are added to the file (or replace scenarios with the same id), the other scenarios are kept.
 
 
     Args:
@@ -30,32 +49,36 @@ def translate_to_stress_test_config(user_query: str) -> str:
         str: summary of what was changed in the stress test configuration.
     """
     try:
-        if not os.path.isfile(os.path.join(f_path_in, 'stresstest.xml')):
-            with open(os.path.join(f_path_in, 'stresstest.xml'), 'w') as f:
-                result = llm.with_structured_output(GetXMLResponse).invoke([SystemMessage(content=stress_config_agent_system_prompt_content),SystemMessage(content=stress_test_scenario_transaltor_tool_prompt), HumanMessage(content=f"\n\nCreate an empty stress test configuration xml")])
-                f.write(result.content)
-            
-        else:
-            with open(os.path.join(f_path_in, 'stresstest.xml'), 'r') as f:
-                file_content = f.read().strip()
-                if file_content == "":
-                    with open(os.path.join(f_path_in, 'stresstest.xml'), 'w') as f:
-                        result = llm.with_structured_output(GetXMLResponse).invoke([SystemMessage(content=stress_config_agent_system_prompt_content), SystemMessage(content=stress_test_scenario_transaltor_tool_prompt), HumanMessage(content=f"\n\nCreate an empty stress test configuration xml")])
-                        f.write(result.content)
-                    
-            tree = ET.parse(os.path.join(f_path_in, 'stresstest.xml'))
-            root = tree.getroot()
-            file_content = ET.tostring(root, encoding='unicode')
-            message_list = [SystemMessage(content=stress_config_agent_system_prompt_content), SystemMessage(content=stress_test_scenario_transaltor_tool_prompt), HumanMessage(content=f"\n\nCreate a stress test configuration for following user query: \n{user_query}\n\n Current stress test configuration is :\n {file_content}")]
-            result = llm.with_structured_output(GetXMLResponse).invoke(message_list)
-            new_root = ET.fromstring(result.content)
-            tree = ET.ElementTree(new_root)
-            ET.indent(tree, space="  ")
-            tree.write(os.path.join(f_path_in, 'stresstest.xml'), encoding="utf-8", xml_declaration=True)
-        return result.summary
+        message_list = [SystemMessage(content=stress_config_agent_system_prompt_content), SystemMessage(content=stress_test_scenario_transaltor_tool_prompt), HumanMessage(content=f"\n\nCreate stress scenarios for following user query: \n{user_query}")]
+        result = llm.with_structured_output(StressScenarioRequest).invoke(message_list)
+        summary = write_stress_scenarios(os.path.join(f_path_in, 'stresstest.xml'), [scenario.model_dump() for scenario in result.scenarios])
+        if result.unsupported:
+            summary += f" Not applied: {result.unsupported}"
+        return summary
     except Exception as e:
         return f"Error: {str(e)}"
-   
+
+@tool
+def add_stress_scenarios(scenarios: List[StressScenarioParameters], replace: bool = True) -> str:
+    """
+    Add stress scenarios built from shock parameters to the stress test configuration file, without rewriting
+    the existing scenarios. All scenarios are saved together; if one of them is invalid, none is saved.
+
+    Args:
+        scenarios (List[StressScenarioParameters]): The scenarios, e.g.
+            {"id": "eur_steepener", "shocks": [{"factor": "DiscountCurve", "name": "EUR", "shape": "twist", "size": 0.005, "short_size": -0.005}]}
+        replace (bool): Replace existing scenarios with the same id, otherwise they are reported as an error.
+
+    Returns:
+        str: The added and replaced scenarios, or the reason why nothing was saved.
+    """
+    try:
+        return write_stress_scenarios(os.path.join(f_path_in, 'stresstest.xml'), [scenario.model_dump() for scenario in scenarios], replace)
+    except (ValueError, XmlEditError) as e:
+        return f"Error: {str(e)}"
+    except ET.ParseError:
+        return "Error parsing XML file."
+
 @tool
 def describe_stress_test_config(user_query: str) -> str:
     """
@@ -82,5 +105,5 @@ def describe_stress_test_config(user_query: str) -> str:
     except Exception as e:
         return f"Error: {str(e)}"
 
-list_stress_test_tools = [translate_to_stress_test_config, describe_stress_test_config]
+list_stress_test_tools = [translate_to_stress_test_config, add_stress_scenarios, describe_stress_test_config]
 list_stress_test_tools_description = [i.name+" : "+i.description +'\n\n' for n, i in enumerate(list_stress_test_tools)]
@@ -98,7 +98,11 @@ main_graph = main_agent_builder.compile()
 # ab= 0 
 
 
+import time
+import queue
+import threading
 import streamlit as st
+from ore_job_runner import get_ore_job_runner
 st.set_page_config(page_title="Quantif AI", page_icon="Logo.jpg", layout="wide")
 st.logo(
     "Logo.jpg",
@@ -156,12 +160,48 @@ for message in st.session_state.messages:
                         for plot_name, plot_description in plot_dict.items():
                             st.image(plot_name, caption=plot_description)
 
+def stream_with_ore_progress(graph_input):
+    """Run the graph in a background thread and show the progress of ORE jobs while waiting for its updates."""
+    updates = queue.Queue()
+    finished = object()
+
+    def produce():
+        try:
+            for update in main_graph.stream(graph_input):
+                updates.put(update)
+        except Exception as e:
+            updates.put(e)
+        finally:
+            updates.put(finished)
+
+    threading.Thread(target=produce, daemon=True).start()
+    runner = get_ore_job_runner()
+    since = time.time()
+    progress_area = st.empty()
+    while True:
+        try:
+            update = updates.get(timeout=0.5)
+        except queue.Empty:
+            jobs = [j for j in runner.list_jobs(since) if j["status"] in ("queued", "running")]
+            with progress_area.container():
+                for job in jobs:
+                    fraction = (job["progress"] / job["total"]) if job["total"] else 0.0
+                    step = job["step"] or job["status"]
+                    st.progress(min(max(fraction, 0.0), 1.0), text=f"ORE {step} ({job['elapsed']:.0f} sec)")
+            continue
+        progress_area.empty()
+        if update is finished:
+            break
+        if isinstance(update, Exception):
+            raise update
+        yield update
+
 if user_prompt := st.chat_input("What do you want to get done from ORE today?"):
     st.session_state.messages.append({"role": "user", "content": user_prompt})
     with st.chat_message("user"):
         st.markdown(user_prompt)
     with st.chat_message("assistant"):
-        for stream in main_graph.stream(
+        for stream in stream_with_ore_progress(
         {"messages": [HumanMessage(content=user_prompt)],"input_path":f_path_in,"output_path":f_path_out,"user_query": user_prompt}):
             node_name = next(iter(stream))
             print(stream)
@@ -1,6 +1,8 @@
 from langchain.tools import tool
 import xml.etree.ElementTree as ET
-from typing import Tuple
+from typing import Tuple, List, Dict
+from xml_document_cache import parse_xml
+from xml_edit_session import XmlEditSession, XmlEditError, edit_xml
 
 
 
@@ -39,7 +41,7 @@ def get_parameter_value(section: str, parameter_name: str, file_path: str = "ore
         str: The value of the parameter, or an error message if not found.
     """
     try:
-        tree = ET.parse(file_path)
+        tree = parse_xml(file_path)
         root = tree.getroot()
         section_elem = root.find(section)
         if section_elem is None:
@@ -54,6 +56,16 @@ def get_parameter_value(section: str, parameter_name: str, file_path: str = "ore
     except FileNotFoundError:
         return "File not found."
 
+def _set_parameter_value(root: ET.Element, section: str, parameter_name: str, new_value: str) -> str:
+    section_elem = root.find(section)
+    if section_elem is None:
+        raise XmlEditError(f"Section '{section}' not found.")
+    param_elem = section_elem.find(f"Parameter[@name='{parameter_name}']")
+    if param_elem is None:
+        raise XmlEditError("Parameter not found.")
+    param_elem.text = new_value
+    return f"Parameter '{parameter_name}' in section '{section}' set to '{new_value}'."
+
 @tool(response_format="content")
 def set_parameter_value(root_path: str, section: str, parameter_name: str, new_value: str) -> str:
     """
@@ -70,22 +82,38 @@ def set_parameter_value(root_path: str, section: str, parameter_name: str, new_v
         str: A confirmation message indicating success or failure.
     """
     try:
-        root = ET.parse(root_path).getroot()
-        section_elem = root.find(section)
-        if section_elem is None:
-            return f"Section '{section}' not found."
-        param_elem = section_elem.find(f"Parameter[@name='{parameter_name}']")
-        if param_elem is not None:
-            param_elem.text = new_value
-            tree = ET.ElementTree(root)
-            tree.write(root_path)
-            return f"Parameter '{parameter_name}' in section '{section}' set to '{new_value}'. saved_results to {root_path}"
-        else:
-            return "Parameter not found."
+        message = edit_xml(root_path, lambda root: _set_parameter_value(root, section, parameter_name, new_value))
+        return f"{message} saved_results to {root_path}"
+    except XmlEditError as e:
+        return str(e)
+    except ET.ParseError:
+        return "Error parsing XML file."
+    except FileNotFoundError:
+        return "File not found."
+
+@tool(response_format="content")
+def set_parameter_values(root_path: str, updates: List[Dict[str, str]]) -> str:
+    """
+    Set several parameters in the given XML file in one go. The updates are saved together; if one of them
+    fails, none is saved. Prefer this over repeated calls of set_parameter_value on the same file.
+
+    Args:
+        root_path (str): The path to the XML file.
+        updates (List[Dict[str, str]]): The updates, each {"section": "Setup", "parameter_name": "asofDate", "new_value": "2016-02-05"}.
+
+    Returns:
+        str: One confirmation line per update, or the reason why no update was saved.
+    """
+    try:
+        session = XmlEditSession(root_path)
+        session.queue_edits([dict(update, action="set") for update in updates], {"set": _set_parameter_value})
+        return "\n".join(session.commit() + [f"saved_results to {root_path}"])
+    except XmlEditError as e:
+        return str(e)
     except ET.ParseError:
         return "Error parsing XML file."
     except FileNotFoundError:
         return "File not found."
 
 
-list_tools = [get_parameter_value, set_parameter_value]
\ No newline at end of file
+list_tools = [get_parameter_value, set_parameter_value, set_parameter_values]
@@ -1,5 +1,9 @@
 import sys, time, math
 import pandas as pd
+import numpy as np
+from ore_report_store import report_to_dataframe
+from ore_cube import load_cube
+from ore_scenario_data import load_scenario_data
 
 def checkErrorsAndRunTime(app):
     errors = app.getErrors()
@@ -81,6 +85,10 @@ def writeReport(report, columnNumbers=None):
                 print ("%-17s  " % column[c][i], end=eol)       
 
 def format_report(report):
+    return report_to_dataframe(report, iso_dates=True)
+
+def format_report_rowwise(report):
+    # Previous implementation of format_report, kept as the baseline of benchmark_format_report.
     report_headers = [[i, report.header(i), report.columnType(i)] for i in range(report.columns())]
 
     formatted_report = dict()
@@ -98,13 +106,24 @@ def format_report(report):
     
     formatted_report = pd.DataFrame(formatted_report)
     
-    # formatted_report.loc[
-    # (formatted_report['MarketObjectType']=='yieldCurve') \
-    # & (formatted_report['MarketObjectId'].str.startswith('Equity')),
-    # 'MarketObjectType'] = 'equityCurve'
-    
     return formatted_report
 
+def benchmark_format_report(report, repeat=3):
+    """Time format_report against the row-wise conversion on one report (e.g. app.getReport("rawcube"))."""
+    timings = {}
+    for name, convert in [("rowwise", format_report_rowwise), ("columnar", format_report)]:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            df = convert(report)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings[name] = best
+    print("rows: %d, columns: %d" % (report.rows(), report.columns()))
+    print("row-wise: %.4f sec" % timings["rowwise"])
+    print("columnar: %.4f sec (%.1fx)" % (timings["columnar"], timings["rowwise"] / max(timings["columnar"], 1e-12)))
+    return timings
+
 def display_reports(reports, header_length=140):
     for report_name, report in reports.items():
         L = header_length
@@ -119,43 +138,15 @@ def display_reports(reports, header_length=140):
         print()
 
 def plotNpvPaths(netCubeReport, numberOfPaths):
-    #utilities.checkReportStructure("netcube", cubeReport)
-    dateIndexColumn = netCubeReport.dataAsSize(2)
-    sampleColumn = netCubeReport.dataAsSize(4)
-    depthColumn = netCubeReport.dataAsSize(5)
-    valueColumn = netCubeReport.dataAsReal(6)
-    # Loop over data and find unique dates, samples and depths
-    dateSet = set()
-    sampleSet = set()
-    depthSet = set()
-    for i in range(0, netCubeReport.rows()):
-        dateSet.add(dateIndexColumn[i])
-        sampleSet.add(sampleColumn[i])
-        depthSet.add(depthColumn[i])
-    print("dates:", len(dateSet))
-    print("samples:", len(sampleSet))
-    print("depths:", len(depthSet))
-    #print(dateSet)
-    #print(sampleSet)
-    dates = list(dateSet)
-    values = []
-    for i in range(0, len(sampleSet)):
-        values.append([0] * len(dateSet))
-    
-    for i in range(0, netCubeReport.rows()):
-        d = dateIndexColumn[i]
-        s = sampleColumn[i]
-        v = valueColumn[i]
-        if s == 0 & d == 0:
-            for j in range(0, len(sampleSet)):
-                values[j][0] = v
-        else:
-            values[s][d] = v
+    # netCubeReport can also be a path to netcube.csv/rawcube.csv/cube.csv.gz
+    cube = load_cube(netCubeReport)
+    print("dates:", cube.num_dates)
+    print("samples:", cube.num_samples)
+    print("depths:", cube.depth)
+    dates = np.arange(cube.num_dates)
+    # as before, the paths of the last id in the report are plotted
+    paths = cube.paths(cube.ids[-1], slice(0, numberOfPaths))
 
-    #print(values[1])
-    #for d in range(0, len(dateSet)):
-    #    print(d, values[1][d], values[2][d], values[3][d])
-    
     import matplotlib.pyplot as plt
     from matplotlib.gridspec import GridSpec
 
@@ -163,8 +154,7 @@ def plotNpvPaths(netCubeReport, numberOfPaths):
     gs = GridSpec(nrows=1, ncols=1)
     ax0 = fig.add_subplot(gs[0, 0])
 
-    for p in range(1, numberOfPaths+1):
-        ax0.plot(dates, values[p], label='')
+    ax0.plot(dates, paths, label='')
     ax0.set(xlabel='Time', ylabel='NPV')
     ax0.set_title('Selected NPV Paths')
     #ax0.legend()
@@ -172,74 +162,21 @@ def plotNpvPaths(netCubeReport, numberOfPaths):
     plt.show()
     
 def getNpvScenarios(netCubeReport, dateIndex):
-    #utilities.checkReportStructure("netcube", cubeReport)
-    dateIndexColumn = netCubeReport.dataAsSize(2)
-    sampleColumn = netCubeReport.dataAsSize(4)
-    depthColumn = netCubeReport.dataAsSize(5)
-    valueColumn = netCubeReport.dataAsReal(6)
-
-    sampleSet = set()
-    for i in range(0, netCubeReport.rows()):
-        if (sampleColumn[i] > 0):
-            sampleSet.add(sampleColumn[i])
-    print("samples:", len(sampleSet))
-
-    values = [0] * (len(sampleSet) + 1)
-    for i in range(0, netCubeReport.rows()):
-        date = dateIndexColumn[i]
-        depth = depthColumn[i]
-        sample = sampleColumn[i]
-        value = valueColumn[i]
-        if date == dateIndex and depth == 0 and sample > 0: 
-            values[sample] = value
-
-    values[0] = values[1]
-    
-    return values
+    # returns [value of sample 1, value of sample 1, ..., value of sample N] at the date, depth 0
+    cube = load_cube(netCubeReport)
+    print("samples:", cube.num_samples)
+    values = cube.scenarios(cube.ids[-1], dateIndex).tolist()
+    return [values[0]] + values
 
 def plotScenarioDataPaths(gzFileName, keyNumber, numberOfPaths, fixing):
-    import gzip
-    import csv
-    dateSet = set()
-    sampleSet = set()
-    keySet = set()
-    # scenario data file starts with date = 1, i.e. does NOT contain t0
-    dateSet.add(0)
-
-    with gzip.open(gzFileName, mode='rt') as file:
-        reader = csv.reader(file, delimiter = ',', quotechar="'")
-        for row in reader:
-            if (not row[0].startswith('#')):
-                #print("data", row)
-                date = int(row[0])
-                sample = int(row[1])
-                key = int(row[2])
-                value = float(row[3])
-                dateSet.add(int(date))
-                sampleSet.add(int(sample))
-                keySet.add(int(key))
-    print("dates:  ", len(dateSet))
-    print("samples:", len(sampleSet))
-    print("keys:   ", len(keySet))
-
-    dates = list(dateSet)
-    values = []
-    for i in range(0, len(sampleSet)):
-        values.append([0] * len(dateSet))
+    # scenario data file starts with date = 1, i.e. does NOT contain t0, the fixing is used for t0
+    data = load_scenario_data(gzFileName)
+    print("dates:  ", data.num_dates + 1)
+    print("samples:", data.num_samples)
+    print("keys:   ", data.num_keys)
 
-    with gzip.open("Output/scenariodata.csv.gz", mode='rt') as file:
-        reader = csv.reader(file, delimiter = ',', quotechar="'")
-        for row in reader:
-            if (not row[0].startswith('#')):
-                date = int(row[0])
-                sample = int(row[1])
-                key = int(row[2])
-                value = float(row[3])
-                if key == keyNumber:
-                    values[sample][date] = value
-                    # FIXME: copy to the left for now
-                    if date == 1:
-                        values[sample][0] = fixing
+    dates = np.arange(data.num_dates + 1)
+    paths = data.paths(keyNumber, slice(1, numberOfPaths + 1), t0=fixing)
 
     import matplotlib.pyplot as plt
     from matplotlib.gridspec import GridSpec
@@ -248,52 +185,19 @@ def plotScenarioDataPaths(gzFileName, keyNumber, numberOfPaths, fixing):
     gs = GridSpec(nrows=1, ncols=1)
     ax0 = fig.add_subplot(gs[0, 0])
 
-    for p in range(1, numberOfPaths+1):
-        ax0.plot(dates, values[p], label='')
-        ax0.set(xlabel='Time', ylabel='Rate')
-        ax0.set_title('Selected Market Data Paths')
-        #ax0.legend()
+    ax0.plot(dates, paths, label='')
+    ax0.set(xlabel='Time', ylabel='Rate')
+    ax0.set_title('Selected Market Data Paths')
+    #ax0.legend()
     
     plt.show()
     
 def getStateScenarios(gzFileName, keyNumber, dateIndex):
-    import gzip
-    import csv
-    dateSet = set()
-    sampleSet = set()
-    keySet = set()
-    # scenario data file starts with date = 1, i.e. does NOT contain t0
-    dateSet.add(0)
-
-    with gzip.open(gzFileName, mode='rt') as file:
-        reader = csv.reader(file, delimiter = ',', quotechar="'")
-        for row in reader:
-            if (not row[0].startswith('#')):
-                #print("data", row)
-                date = int(row[0])
-                sample = int(row[1])
-                key = int(row[2])
-                value = float(row[3])
-                dateSet.add(int(date))
-                sampleSet.add(int(sample))
-                keySet.add(int(key))
-    #print("dates:  ", len(dateSet))
-    print("samples:", len(sampleSet))
-    #print("keys:   ", len(keySet))
-
-    values = [0] * (len(sampleSet) + 1)
-    
-    with gzip.open("Output/scenariodata.csv.gz", mode='rt') as file:
-        reader = csv.reader(file, delimiter = ',', quotechar="'")
-        for row in reader:
-            if (not row[0].startswith('#')):
-                date = int(row[0])
-                sample = int(row[1])
-                key = int(row[2])
-                value = float(row[3])
-                if key == keyNumber and date == dateIndex:
-                    values[sample] = value
+    data = load_scenario_data(gzFileName)
+    print("samples:", data.num_samples)
 
+    # one entry per sample plus a trailing 0, with values[0] = values[1] as before
+    values = data.states(keyNumber, dateIndex).tolist() + [0]
     values[0] = values[1]
     
     return values
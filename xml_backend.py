@@ -0,0 +1,298 @@
+"""
+Pluggable XML backend: how the input files are parsed and how they are validated.
+
+LLM generated XML used to be checked only by ORE itself, so a bad edit surfaced as a failed run. The
+backend validates documents before they are written and the input files before a run:
+    - ElementTreeBackend needs nothing beyond the standard library. It checks well-formedness and the
+      structure ORE relies on (known root elements, trades with an id and a TradeType, unique trade ids,
+      curve configurations with a CurveId, ...).
+    - LxmlBackend validates against the ORE XML schemas (input.xsd and the schemas it includes, shipped in
+      the xsd folder of the ORE distribution, see f_path_ore_xsd). The schema is compiled once and reused for
+      every document. lxml also parses the files for the pre-flight check, which is several times faster than
+      ElementTree on large portfolios. Without the schema files it falls back to the structural checks.
+The trees handed to the tools are ElementTree trees with either backend, every tool is written against
+the ElementTree element API. The backend is chosen by config_file.xml_backend: 'auto' takes lxml when it
+is installed, 'lxml' falls back to ElementTree when it is not.
+"""
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+from config_file import xml_backend, f_path_ore_xsd
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+schema_file = "input.xsd"
+max_problems = 20
+# Positions in the element paths of schema errors, e.g. the [3] of /Portfolio/Trade[3]/TradeType
+_element_indices = re.compile(r"\[\d+\]")
+
+
+# A problem is (key, message). The key leaves out positions, so edits that move elements around do not turn
+# a problem the document already had into a new one (see edit_problems).
+Problem = Tuple[str, str]
+
+
+def _problem(message: str, key: Optional[str] = None) -> Problem:
+    return (key or message), message
+
+
+def _check_ore(root: ET.Element) -> List[Problem]:
+    problems = [] if root.find("Setup") is not None else [_problem("ORE has no Setup section")]
+    for parameter in root.iter("Parameter"):
+        if not parameter.get("name"):
+            problems.append(_problem("Parameter without a name attribute"))
+    for analytic in root.findall("Analytics/Analytic"):
+        if not analytic.get("type"):
+            problems.append(_problem("Analytic without a type attribute"))
+    return problems
+
+
+def _check_portfolio(root: ET.Element) -> List[Problem]:
+    problems, ids = [], set()
+    for n, trade in enumerate(root, 1):
+        if trade.tag != "Trade":
+            problems.append(_problem(f"Portfolio child {n} is <{trade.tag}>, expected <Trade>", f"Portfolio child <{trade.tag}>"))
+            continue
+        trade_id = trade.get("id")
+        if not trade_id:
+            problems.append(_problem(f"Trade {n} has no id attribute", "Trade without an id attribute"))
+        elif trade_id in ids:
+            problems.append(_problem(f"Trade id {trade_id} is used more than once"))
+        ids.add(trade_id)
+        if not (trade.findtext("TradeType") or "").strip():
+            problems.append(_problem(f"Trade {trade_id or n} has no TradeType", f"Trade {trade_id} without a TradeType" if trade_id else "Trade without an id and a TradeType"))
+    return problems
+
+
+def _check_curve_configuration(root: ET.Element) -> List[Problem]:
+    return [_problem(f"{section.tag}/{curve.tag} has no CurveId") for section in root if section.tag != "ReportConfiguration"
+            for curve in section if not (curve.findtext("CurveId") or "").strip()]
+
+
+def _check_conventions(root: ET.Element) -> List[Problem]:
+    return [_problem(f"Conventions/{convention.tag} has no Id") for convention in root if not (convention.findtext("Id") or "").strip()]
+
+
+def _check_stress_testing(root: ET.Element) -> List[Problem]:
+    problems = [_problem(f"StressTesting/{child.tag} is not a StressTest") for child in root
+                if child.tag not in ("StressTest", "UseSpreadedTermStructures")]
+    return problems + [_problem("StressTest without an id attribute") for test in root.findall("StressTest") if not test.get("id")]
+
+
+# Root element of every ORE input file the schema declares -> structural check of the document.
+ore_root_elements: Dict[str, Optional[Callable[[ET.Element], List[Problem]]]] = {
+    "ORE": _check_ore, "Portfolio": _check_portfolio, "CurveConfiguration": _check_curve_configuration,
+    "Conventions": _check_conventions, "StressTesting": _check_stress_testing, "TodaysMarket": None,
+    "SensitivityAnalysis": None, "Simulation": None, "NettingSetDefinitions": None, "PricingEngines": None,
+    "CurrencyConfig": None, "CalendarAdjustments": None, "ReferenceData": None,
+}
+
+
+def _messages(problems: List[Problem]) -> List[str]:
+    return [message for _, message in problems[:max_problems]]
+
+
+class ElementTreeBackend:
+    """Parsing with xml.etree.ElementTree, validation by the structural checks of ore_root_elements."""
+
+    name = "etree"
+
+    def parse(self, path: str) -> ET.ElementTree:
+        return ET.parse(path)
+
+    def problems(self, root: ET.Element) -> List[Problem]:
+        """Every problem of a document as (key, message), none if it is valid or its root element is not an ORE one."""
+        check = ore_root_elements.get(root.tag)
+        return check(root) if check else []
+
+    def validate(self, root: ET.Element) -> List[str]:
+        """Problems of a document (the first max_problems), an empty list if it is valid or its root element is not an ORE one."""
+        return _messages(self.problems(root))
+
+    def validate_file(self, path: str) -> List[str]:
+        """Problems of a file on disk, including a parse error."""
+        try:
+            return self.validate(ET.parse(path).getroot())
+        except ET.ParseError as e:
+            return [f"not well-formed XML: {e}"]
+
+    def schema_status(self) -> str:
+        return "structural checks (no schema validation without lxml)"
+
+
+class LxmlBackend(ElementTreeBackend):
+    """
+    Validation against the precompiled ORE schema with lxml.
+
+    Args:
+        xsd_dir (str): Folder with input.xsd and the schemas it includes.
+    """
+
+    name = "lxml"
+
+    def __init__(self, xsd_dir: str = f_path_ore_xsd):
+        self.xsd_dir = xsd_dir
+        self._lock = threading.Lock()
+        self._schema = None
+        self._schema_signature = None
+        self.schema_error: Optional[str] = None
+
+    def schema(self):
+        """The compiled schema, None if the schema files are missing or invalid. Compiled again if input.xsd changes."""
+        path = os.path.join(self.xsd_dir, schema_file)
+        with self._lock:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._schema, self._schema_signature = None, None
+                self.schema_error = f"{path} not found"
+                return None
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if signature != self._schema_signature:
+                try:
+                    self._schema, self.schema_error = lxml_etree.XMLSchema(lxml_etree.parse(path)), None
+                except (lxml_etree.XMLSchemaParseError, lxml_etree.XMLSyntaxError) as e:
+                    self._schema, self.schema_error = None, f"{path} could not be compiled: {e}"
+                self._schema_signature = signature
+            return self._schema
+
+    def _schema_problems(self, document) -> List[Problem]:
+        schema = self.schema()
+        # XMLSchema objects keep their error log between calls, so validations run one at a time
+        with self._lock:
+            if schema.validate(document):
+                return []
+            return [(f"{_element_indices.sub('', error.path)}: {error.message}", f"{error.path}: {error.message}")
+                    for error in schema.error_log]
+
+    def problems(self, root: ET.Element) -> List[Problem]:
+        if root.tag not in ore_root_elements or self.schema() is None:
+            return super().problems(root)
+        return self._schema_problems(lxml_etree.fromstring(ET.tostring(root)))
+
+    def validate_file(self, path: str) -> List[str]:
+        try:
+            document = lxml_etree.parse(path, lxml_etree.XMLParser(huge_tree=True))
+        except lxml_etree.XMLSyntaxError as e:
+            return [f"not well-formed XML: {e}"]
+        if document.getroot().tag not in ore_root_elements:
+            return []
+        if self.schema() is None:
+            return super().validate_file(path)
+        return _messages(self._schema_problems(document))
+
+    def schema_status(self) -> str:
+        return f"ORE schema {os.path.join(self.xsd_dir, schema_file)}" if self.schema() is not None else \
+            f"structural checks ({self.schema_error})"
+
+
+xml_backends = {"etree": ElementTreeBackend, "lxml": LxmlBackend}
+
+_backend: Optional[ElementTreeBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name: str) -> ElementTreeBackend:
+    if name not in xml_backends and name != "auto":
+        raise ValueError(f"Unknown XML backend '{name}', backends are auto, {', '.join(xml_backends)}.")
+    if name in ("auto", "lxml"):
+        name = "lxml" if lxml_etree is not None else "etree"
+    return xml_backends[name]()
+
+
+def get_xml_backend() -> ElementTreeBackend:
+    """Return the process-wide XML backend chosen by config_file.xml_backend."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(xml_backend)
+        return _backend
+
+
+def set_xml_backend(name: str) -> ElementTreeBackend:
+    """Switch the process-wide backend ('auto', 'etree' or 'lxml') and return it."""
+    global _backend
+    backend = _create_backend(name)
+    with _backend_lock:
+        _backend = backend
+    return backend
+
+
+def edit_problems(before: ET.Element, after: ET.Element) -> List[str]:
+    """
+    Problems of an edited document that the document did not have before the edit. Problems are matched by
+    their position-free keys and counted, so moving, adding or removing other elements changes nothing.
+    """
+    backend = get_xml_backend()
+    problems = backend.problems(after)
+    if not problems:
+        return []
+    existing = Counter(key for key, _ in backend.problems(before))
+    new = []
+    for key, message in problems:
+        if existing[key]:
+            existing[key] -= 1
+        else:
+            new.append(message)
+    return new[:max_problems]
+
+
+def benchmark_xml_backends(paths: Optional[List[str]] = None, trades: int = 20000, repeat: int = 3) -> str:
+    """
+    Time parsing, serialising and validating the large example inputs and a synthetic portfolio of copies
+    of Example_1's swap with every available backend.
+    """
+    import time
+    portfolio = "xml_backend_benchmark.xml"
+    template = ET.tostring(ET.parse(os.path.join("Examples", "Example_1", "Input", "portfolio.xml")).getroot().find("Trade"),
+                           encoding="unicode").strip()
+    with open(portfolio, "w") as f:
+        f.write('<?xml version="1.0"?>\n<Portfolio>\n')
+        for n in range(trades):
+            f.write("  " + template.replace('id="Swap_20"', f'id="Trade_{n}"') + "\n")
+        f.write("</Portfolio>\n")
+    paths = (paths or [os.path.join("Examples", "Input", name) for name in ["curveconfig.xml", "conventions.xml", "todaysmarket.xml"]]) + [portfolio]
+
+    def best(function: Callable[[], object]) -> float:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    results = []
+    try:
+        for path in paths:
+            size = os.path.getsize(path) / 1024
+            tree = ET.parse(path)
+            line = [f"{os.path.basename(path)} ({size:.0f} KB): ElementTree parse {best(lambda: ET.parse(path)) * 1000:.1f} ms, "
+                    f"serialise {best(lambda: ET.tostring(tree.getroot())) * 1000:.1f} ms"]
+            if lxml_etree is not None:
+                document = lxml_etree.parse(path, lxml_etree.XMLParser(huge_tree=True))
+                line.append(f"lxml parse {best(lambda: lxml_etree.parse(path, lxml_etree.XMLParser(huge_tree=True))) * 1000:.1f} ms, "
+                            f"serialise {best(lambda: lxml_etree.tostring(document)) * 1000:.1f} ms")
+            for name in xml_backends:
+                if name == "lxml" and lxml_etree is None:
+                    continue
+                backend = _create_backend(name)
+                problems = backend.validate_file(path)
+                line.append(f"{name} validation {best(lambda: backend.validate_file(path)) * 1000:.1f} ms ({len(problems)} problems)")
+            results.append(", ".join(line))
+        broken = ET.parse(portfolio).getroot()
+        broken[0].set("id", broken[1].get("id"))
+        results.append(f"duplicate trade id rejected by {get_xml_backend().name}: {edit_problems(ET.parse(portfolio).getroot(), broken)}")
+        results.append(f"backend {get_xml_backend().name}, {get_xml_backend().schema_status()}")
+    finally:
+        os.remove(portfolio)
+    return "\n".join(results)
+
+
+if __name__ == "__main__":
+    print(benchmark_xml_backends())
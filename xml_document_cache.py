@@ -0,0 +1,127 @@
+"""
+Cache of parsed XML input files shared by the *_xml_tools.
+
+A ReAct episode calls many tools on the same few files (ore.xml, portfolio.xml, sensitivity.xml,
+curveconfig.xml), each of which used to parse the file again. The cache keeps the parsed tree of every
+file keyed by its path, modification time and size, so a file is parsed again only after it changed on
+disk. Trees handed out by parse_xml are shared and must not be modified; tools that edit a file take
+their own copy with parse_xml_for_edit and save it with write_xml, which also puts the saved tree in
+the cache. write_xml writes a temporary file and renames it over the target, so a crash never leaves a
+half-written file behind. Files are parsed by the process-wide XML backend (xml_backend).
+"""
+import os
+import copy
+import shutil
+import threading
+import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from xml_backend import get_xml_backend
+from config_file import xml_cache_max_entries
+
+
+def file_signature(path: str) -> Tuple[int, int, int]:
+    """Modification time, size and inode of a file, any change on disk changes the signature."""
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class XmlDocumentCache:
+    def __init__(self, max_entries: int = xml_cache_max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int, int], ET.ElementTree]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _put(self, path: str, signature: Tuple[int, int, int], tree: ET.ElementTree) -> None:
+        self._entries[path] = (signature, tree)
+        self._entries.move_to_end(path)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def parse(self, path: str) -> ET.ElementTree:
+        """
+        Parsed tree of path, shared with every other caller: read it, do not modify it.
+
+        Raises the errors of ET.parse (FileNotFoundError, ET.ParseError) like ET.parse.
+        """
+        path = os.path.abspath(path)
+        signature = file_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.invalidations += 1
+            self.misses += 1
+        tree = get_xml_backend().parse(path)
+        with self._lock:
+            self._put(path, signature, tree)
+        return tree
+
+    def parse_for_edit(self, path: str) -> ET.ElementTree:
+        """Private copy of the parsed tree of path, safe to modify and save with write."""
+        return copy.deepcopy(self.parse(path))
+
+    def write(self, tree: ET.ElementTree, path: str, **kwargs) -> None:
+        """
+        Save tree to path (kwargs as for ElementTree.write) and cache it as the current content of path.
+
+        The cache takes ownership of tree, the caller must not modify it afterwards.
+        """
+        path = os.path.abspath(path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            tree.write(tmp_path, **kwargs)
+            if os.path.exists(path):
+                shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self._put(path, file_signature(path), tree)
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Forget path, or every file."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(os.path.abspath(path), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "entries": len(self._entries)}
+
+
+_cache: Optional[XmlDocumentCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_xml_document_cache() -> XmlDocumentCache:
+    """Return the process-wide XML document cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = XmlDocumentCache()
+        return _cache
+
+
+def parse_xml(path: str) -> ET.ElementTree:
+    """Shared, read-only parsed tree of path from the process-wide cache."""
+    return get_xml_document_cache().parse(path)
+
+
+def parse_xml_for_edit(path: str) -> ET.ElementTree:
+    """Private, modifiable copy of the parsed tree of path."""
+    return get_xml_document_cache().parse_for_edit(path)
+
+
+def write_xml(tree: ET.ElementTree, path: str, **kwargs) -> None:
+    """Save an edited tree to path atomically and keep it cached."""
+    get_xml_document_cache().write(tree, path, **kwargs)
@@ -0,0 +1,124 @@
+"""
+Batched, all-or-nothing edits of one XML input file.
+
+An XmlEditSession collects edit operations and applies them in one go on a private copy of the file's
+tree: the file is parsed once, every operation runs in order, the result is validated and written once
+with an atomic rename. If an operation or the validation fails nothing is written, so the file is either
+left untouched or has all edits. Besides the session's own check, the XML backend validates the result
+(against the ORE schema with lxml) and rejects edits that introduce a problem. Sessions on the same file
+are serialised, and a session refuses to overwrite a file that another process changed while it was
+applying its edits.
+
+The mutating XML tools express each edit as an operation on the root element that returns a message or
+raises XmlEditError, and their batch variants queue a list of such edits into one session.
+"""
+import os
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, List, Optional
+from xml_document_cache import file_signature, parse_xml, parse_xml_for_edit, write_xml
+from xml_backend import edit_problems
+
+Operation = Callable[[ET.Element], str]
+
+
+class XmlEditError(Exception):
+    """An edit that cannot be applied, its message is meant for the agent."""
+
+
+_path_locks: Dict[str, threading.Lock] = {}
+_path_locks_lock = threading.Lock()
+
+
+def _path_lock(path: str) -> threading.Lock:
+    with _path_locks_lock:
+        return _path_locks.setdefault(path, threading.Lock())
+
+
+class XmlEditSession:
+    """
+    Edits of one XML file, saved together by commit.
+
+    Args:
+        path (str): The XML file to edit.
+        validate (Optional[Callable[[ET.Element], List[str]]]): Checks the edited root, returns a list of problems.
+        indent (Optional[str]): Pretty print the saved file with this indentation, e.g. '  '.
+        write_kwargs: Passed to ElementTree.write, e.g. encoding='utf-8', xml_declaration=True.
+    """
+
+    def __init__(self, path: str, validate: Optional[Callable[[ET.Element], List[str]]] = None, indent: Optional[str] = None,
+                 **write_kwargs):
+        self.path = os.path.abspath(path)
+        self.validate = validate
+        self.indent = indent
+        self.write_kwargs = write_kwargs
+        self._operations: List[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self._operations)
+
+    def queue(self, description: str, operation: Operation) -> None:
+        """Add an operation; it runs on commit and returns a message or raises XmlEditError."""
+        self._operations.append((description, operation))
+
+    def queue_edits(self, edits: List[Dict[str, Any]], actions: Dict[str, Callable[..., str]]) -> None:
+        """
+        Queue edits given as dictionaries, e.g. {"action": "set_active", "analytic_type": "npv", "active": "Y"}.
+
+        Args:
+            edits (List[Dict[str, Any]]): The "action" entry picks the function from actions, the other entries
+                are passed to it as keyword arguments after the root element.
+            actions (Dict[str, Callable[..., str]]): Edit functions by action name.
+        """
+        for n, edit in enumerate(edits, 1):
+            edit = dict(edit)
+            action = edit.pop("action", None)
+            if action not in actions:
+                raise XmlEditError(f"Edit {n}: unknown action '{action}', actions are {', '.join(actions)}.")
+            self.queue(f"{action} {edit}", lambda root, action=action, edit=edit: actions[action](root, **edit))
+
+    def commit(self) -> List[str]:
+        """
+        Apply all queued operations and save the file once.
+
+        Returns:
+            List[str]: The message of every operation, in order.
+
+        Raises:
+            XmlEditError: An operation raised an exception, the validation failed, or the file changed on disk
+                meanwhile. Nothing was written.
+        """
+        with _path_lock(self.path):
+            signature = file_signature(self.path)
+            tree = parse_xml_for_edit(self.path)
+            messages = []
+            for n, (description, operation) in enumerate(self._operations, 1):
+                try:
+                    messages.append(operation(tree.getroot()))
+                except Exception as e:
+                    # e.g. an AttributeError of a find() that matched nothing or a KeyError of a malformed edit
+                    reason = str(e).rstrip('.') if isinstance(e, (XmlEditError, TypeError, ValueError)) else f"{type(e).__name__}: {e}"
+                    raise XmlEditError(f"Edit {n} ({description}) failed: {reason}. No changes were saved to {self.path}.") from e
+            problems = self.validate(tree.getroot()) if self.validate else []
+            problems += edit_problems(parse_xml(self.path).getroot(), tree.getroot())
+            if problems:
+                raise XmlEditError(f"Validation failed: {'; '.join(problems)}. No changes were saved to {self.path}.")
+            if file_signature(self.path) != signature:
+                raise XmlEditError(f"{self.path} was changed by someone else while editing. No changes were saved.")
+            if self.indent is not None:
+                ET.indent(tree, space=self.indent)
+            write_xml(tree, self.path, **self.write_kwargs)
+            self._operations = []
+            return messages
+
+
+def edit_xml(path: str, operation: Operation, validate: Optional[Callable[[ET.Element], List[str]]] = None,
+             indent: Optional[str] = None, **write_kwargs) -> str:
+    """Apply a single operation to an XML file and save it, returns the operation's message."""
+    session = XmlEditSession(path, validate, indent, **write_kwargs)
+    session.queue("edit", operation)
+    try:
+        return session.commit()[0]
+    except XmlEditError as e:
+        # a single edit reports the operation's own message
+        raise e.__cause__ if isinstance(e.__cause__, XmlEditError) else e